@@ -0,0 +1,91 @@
+"""
+Benchmark of Cache backends: add_items + commit and filter_uncached throughput.
+
+    python -m tests.bench_cache --sizes 10000 100000 --batch-size 10
+
+Every batch is a commit. Without --batch-size, batches grow above 100000 keys to keep 10000 commits,
+since 10000000 keys by 10 would be 1000000 sqlite commits.
+"""
+import argparse
+import contextlib
+import io
+import pathlib
+import shutil
+import tempfile
+import time
+from typing import Callable
+
+from ytldl.yt.cache import Cache, DbmCache, MemoryCache, SqliteCache
+
+DEFAULT_BATCH_SIZE = 10
+MAX_COMMITS = 10_000
+
+BACKENDS: dict[str, Callable[[pathlib.Path, int], Cache]] = {
+    "memory": lambda dir, batch_size: MemoryCache(),
+    "sqlite": lambda dir, batch_size: SqliteCache(str(dir / "ytldl.db"), batch_size=batch_size, backup=False),
+    "dbm": lambda dir, batch_size: DbmCache(str(dir / "ytldl.dbm"), batch_size=batch_size),
+}
+
+
+def bench(backend: str, size: int, batch_size: int = DEFAULT_BATCH_SIZE, query_size: int = 500,
+          queries: int = 100) -> dict:
+    """
+    Fills cache with size keys by batches, then filters queries of query_size keys, half of them are cached.
+    Default batch_size is the one of lib update and daemon, see open_cache() calls.
+    Returns keys per second of both operations.
+    """
+    dir = pathlib.Path(tempfile.mkdtemp(prefix="bench_cache"))
+    # commit() prints every batch
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            cache = BACKENDS[backend](dir, batch_size)
+            start = time.perf_counter()
+            for i in range(0, size, batch_size):
+                cache.add_items([_key(j) for j in range(i, min(size, i + batch_size))])
+            cache.commit()
+            add_seconds = time.perf_counter() - start
+
+            step = max(1, size // (queries * query_size // 2))
+            start = time.perf_counter()
+            for q in range(queries):
+                cached = [_key((q + i * step) % size) for i in range(query_size // 2)]
+                uncached = [f"u{q:05d}{i:05d}" for i in range(query_size // 2)]
+                uncached_found = cache.filter_uncached(cached + uncached)
+                assert len(uncached_found) == len(uncached), (backend, len(uncached_found))
+            filter_seconds = time.perf_counter() - start
+            cache.close()
+
+            return dict(backend=backend, size=size,
+                        add_per_second=size / add_seconds,
+                        filter_per_second=queries * query_size / filter_seconds)
+        finally:
+            shutil.rmtree(dir, ignore_errors=True)
+
+
+def default_batch_size(size: int) -> int:
+    return max(DEFAULT_BATCH_SIZE, -(-size // MAX_COMMITS))
+
+
+def _key(i: int) -> str:
+    # videoIds are 11 chars long
+    return f"{i:011d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="*", type=int, default=[10_000, 100_000])
+    parser.add_argument("--backends", nargs="*", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--batch-size", type=int,
+                        help=f"keys per commit, default is {DEFAULT_BATCH_SIZE} and at most {MAX_COMMITS} commits")
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'keys':>10} {'add keys/s':>12} {'filter keys/s':>14}")
+    for size in args.sizes:
+        for backend in args.backends:
+            res = bench(backend, size, batch_size=args.batch_size or default_batch_size(size))
+            print(f"{res['backend']:>8} {res['size']:>10} {res['add_per_second']:>12.0f} "
+                  f"{res['filter_per_second']:>14.0f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
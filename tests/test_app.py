@@ -0,0 +1,163 @@
+import pathlib
+import shutil
+import subprocess
+import sys
+import unittest
+
+
+class TestImportTime(unittest.TestCase):
+    # microseconds
+    budget = 100_000
+    heavy_modules = {"yt_dlp", "ytmusicapi", "PIL", "mutagen", "requests", "robocrypt"}
+
+    def _importtime(self, module: str) -> dict[str, int]:
+        """
+        Returns cumulative import time in microseconds for each imported module.
+        """
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True, check=True)
+        times = {}
+        for line in res.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative)
+        return times
+
+    def test_app_import_is_light(self):
+        times = self._importtime("ytldl.app")
+        top_level = {name.split(".")[0] for name in times}
+        self.assertEqual(set(), top_level & self.heavy_modules)
+        self.assertLess(times["ytldl.app"], self.budget)
+
+
+class TestLibFix(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_app")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_lib_fix(self):
+        open(self.dir / "artist - title [e7u2aPzWmU4].m4a", "w").close()
+        res = subprocess.run([sys.executable, "-m", "ytldl", "lib", "-o", str(self.dir), "fix"],
+                             capture_output=True, text=True, check=True)
+        self.assertIn("Extracted 1 videoIds", res.stdout)
+        self.assertIn("e7u2aPzWmU4", res.stdout)
+
+
+class TestLibVerify(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_app_verify")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_lib_verify(self):
+        from ytldl.yt.cache import SqliteCache
+        from ytldl.yt.jobs import JobQueue
+        from ytldl.yt.search import SearchIndex
+        from ytldl.yt.store import ContentStore
+
+        data = pathlib.Path("test_data/test_audio_no_tags.m4a").read_bytes()
+        (self.dir / "good [id1].m4a").write_bytes(data)
+        (self.dir / "bad [id2].m4a").write_bytes(data[:len(data) // 2])
+        (self.dir / ".ytldl").mkdir()
+        cache = SqliteCache(str(self.dir / ".ytldl" / "ytldl.db"), backup=False)
+        cache.add_items(["id1", "id2"])
+        cache.close()
+        store = ContentStore(self.dir / "store")
+        for name, video_id in (("good [id1].m4a", "id1"), ("bad [id2].m4a", "id2")):
+            store.add(video_id, self.dir / name)
+        search_index = SearchIndex(str(self.dir / ".ytldl" / "search.db"))
+        for name in ("good [id1].m4a", "bad [id2].m4a"):
+            search_index.add(self.dir / name, dict(artist="artist", title="title"))
+        search_index.close()
+        queue = JobQueue(str(self.dir / ".ytldl" / "jobs.db"))
+        queue.put(["id1", "id2"])
+        for item in queue.lease("worker", 2):
+            queue.complete("worker", item)
+        queue.close()
+
+        res = subprocess.run([sys.executable, "-m", "ytldl", "lib", "-o", str(self.dir), "verify", "-j", "1",
+                              "--store", str(self.dir / "store")],
+                             capture_output=True, text=True, check=True)
+        self.assertIn("Verified 2 tracks, 1 are broken", res.stdout)
+        self.assertTrue((self.dir / "bad [id2].m4a.broken").exists())
+        cache = SqliteCache(str(self.dir / ".ytldl" / "ytldl.db"), backup=False)
+        self.assertEqual({"id2"}, cache.filter_uncached(["id1", "id2"]))
+        cache.close()
+        self.assertIsNotNone(store.get("id1"))
+        self.assertIsNone(store.get("id2"))
+        search_index = SearchIndex(str(self.dir / ".ytldl" / "search.db"))
+        self.assertEqual(["id1"], [result.video_id for result in search_index.search("artist")])
+        search_index.close()
+        queue = JobQueue(str(self.dir / ".ytldl" / "jobs.db"))
+        self.assertEqual({JobQueue.DONE: 1, JobQueue.PENDING: 1}, queue.counts())
+        queue.close()
+
+
+
+class TestEventsStdout(unittest.TestCase):
+    def test_take_stdout(self):
+        code = ("import subprocess, sys\n"
+                "from ytldl.app import take_stdout\n"
+                "file = take_stdout()\n"
+                "print('human-readable')\n"
+                "subprocess.run([sys.executable, '-c', 'print(\"subprocess\")'])\n"
+                "file.write('{}\\n')\n"
+                "file.close()\n")
+        res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual("{}\n", res.stdout)
+        self.assertIn("human-readable", res.stderr)
+        self.assertIn("subprocess", res.stderr)
+
+
+class TestLibCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_app_cache")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        (self.dir / ".ytldl").mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_dbm_without_gdbm(self):
+        try:
+            import dbm.gnu  # noqa: F401
+            self.skipTest("python has gdbm")
+        except ImportError:
+            pass
+        res = subprocess.run([sys.executable, "-m", "ytldl", "lib", "-o", str(self.dir), "cache", "dbm"],
+                             capture_output=True, text=True)
+        self.assertEqual(1, res.returncode)
+        self.assertIn("needs dbm.gnu", res.stderr)
+        self.assertNotIn("Traceback", res.stderr)
+
+
+class TestLibWorker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_app_worker")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        (self.dir / ".ytldl").mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_dbm_cache_refused(self):
+        import dbm.dumb
+
+        dbm.dumb.open(str(self.dir / ".ytldl" / "ytldl.dbm"), "c").close()
+        res = subprocess.run([sys.executable, "-m", "ytldl", "lib", "-o", str(self.dir), "worker", "--once"],
+                             capture_output=True, text=True)
+        self.assertNotEqual(0, res.returncode)
+        self.assertIn("migrate it to sqlite", res.stderr)
+        self.assertFalse((self.dir / ".ytldl" / "jobs.db").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
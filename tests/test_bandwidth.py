@@ -0,0 +1,206 @@
+import pathlib
+import shutil
+import threading
+import time
+import unittest
+
+from yt_dlp import YoutubeDL
+
+from tests.test_transfer import ThrottlingHandler, ThrottlingServer
+from ytldl.yt.bandwidth import RateLimiter, RateSchedule, parse_size
+from ytldl.yt.postprocessors import BudgetPP, estimate_size
+from ytldl.yt.scheduler import Budget, BudgetExpired
+
+
+class FakeClock:
+    """
+    Simulated clock, sleep() advances it.
+    """
+
+    def __init__(self, now: float):
+        self.now = now
+        self.slept = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+        self.slept += seconds
+
+
+def _local(hours: int, minutes: int = 0) -> float:
+    return time.mktime((2024, 1, 1, hours, minutes, 0, 0, 0, -1))
+
+
+class TestRateSchedule(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(500, parse_size("500"))
+        self.assertEqual(500 << 10, parse_size("500K"))
+        self.assertEqual(int(1.5 * (1 << 30)), parse_size("1.5GiB"))
+        self.assertRaises(ValueError, parse_size, "fast")
+
+    def test_all_day(self):
+        schedule = RateSchedule.parse("2M")
+        self.assertEqual(2 << 20, schedule.rate(_local(0)))
+        self.assertEqual(2 << 20, schedule.rate(_local(23, 59)))
+
+    def test_time_of_day(self):
+        schedule = RateSchedule.parse("08:00=500K,23:00=unlimited")
+        self.assertEqual(500 << 10, schedule.rate(_local(8)))
+        self.assertEqual(500 << 10, schedule.rate(_local(22, 59)))
+        self.assertIsNone(schedule.rate(_local(23)))
+        # the last profile continues after midnight
+        self.assertIsNone(schedule.rate(_local(7, 59)))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, RateSchedule.parse, "25:00=1M")
+        self.assertRaises(ValueError, RateSchedule.parse, "08:00=fast")
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_rate(self):
+        clock = FakeClock(_local(12))
+        limiter = RateLimiter(RateSchedule.parse("1K"), clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            limiter.consume(1024)
+        self.assertAlmostEqual(10, clock.slept)
+
+    def test_unused_rate_is_lost_after_burst(self):
+        clock = FakeClock(_local(12))
+        limiter = RateLimiter(RateSchedule.parse("1K"), burst=2, clock=clock, sleep=clock.sleep)
+        limiter.consume(0)
+        clock.now += 60
+        limiter.consume(2048)
+        self.assertEqual(0, clock.slept)
+        limiter.consume(1024)
+        self.assertAlmostEqual(1, clock.slept)
+
+    def test_profile(self):
+        clock = FakeClock(_local(22, 59))
+        limiter = RateLimiter(RateSchedule.parse("08:00=1K,23:00=unlimited"), clock=clock, sleep=clock.sleep)
+        limiter.consume(30 * 1024)
+        self.assertAlmostEqual(30, clock.slept)
+        # rate is unlimited from 23:00
+        clock.now = _local(23)
+        limiter.consume(10 ** 9)
+        self.assertAlmostEqual(30, clock.slept)
+
+    def test_progress_hook(self):
+        clock = FakeClock(_local(12))
+        limiter = RateLimiter(RateSchedule.parse("1K"), clock=clock, sleep=clock.sleep)
+        # the first report is a baseline, e.g. for resumed download
+        limiter.progress_hook(dict(status="downloading", tmpfilename="a", downloaded_bytes=10 ** 6))
+        self.assertEqual(0, clock.slept)
+        limiter.progress_hook(dict(status="downloading", tmpfilename="a", downloaded_bytes=10 ** 6 + 2048))
+        self.assertAlmostEqual(2, clock.slept)
+        limiter.progress_hook(dict(status="finished", tmpfilename="a", downloaded_bytes=10 ** 6 + 2048))
+        self.assertEqual({}, limiter._downloaded)
+
+
+class TestBudget(unittest.TestCase):
+    def test_estimate_size(self):
+        self.assertEqual(100, estimate_size(dict(filesize=100, tbr=128, duration=10)))
+        self.assertEqual(100, estimate_size(dict(filesize_approx=100)))
+        self.assertEqual(160_000, estimate_size(dict(abr=128, duration=10)))
+        self.assertEqual(300, estimate_size(dict(requested_formats=[dict(filesize=100), dict(filesize=200)])))
+        self.assertIsNone(estimate_size(dict(abr=128)))
+
+    def test_bytes(self):
+        budget = Budget(max_bytes=100)
+        budget.start()
+        self.assertTrue(budget.reserve(60))
+        # doesn't fit, but smaller track still does
+        self.assertFalse(budget.reserve(50))
+        self.assertTrue(budget.reserve(30))
+        self.assertFalse(budget.expired())
+        budget.settle(30, 40)
+        self.assertTrue(budget.expired())
+
+    def test_released_on_failure(self):
+        budget = Budget(max_bytes=100)
+        budget.start()
+        budget_pp = BudgetPP(budget)
+        budget_pp.run(dict(id="a", filesize=80))
+        budget_pp.progress_hook(dict(status="downloading", downloaded_bytes=30))
+        # download failed or was aborted
+        budget_pp.release()
+        self.assertEqual(30, budget.bytes)
+        budget_pp.release()
+        self.assertEqual(30, budget.bytes)
+
+    def test_release_after_finished(self):
+        budget = Budget(max_bytes=100)
+        budget.start()
+        budget_pp = BudgetPP(budget)
+        budget_pp.run(dict(id="a", filesize=80))
+        budget_pp.progress_hook(dict(status="finished", total_bytes=70))
+        budget_pp.release()
+        self.assertEqual(70, budget.bytes)
+
+    def test_unknown_size_reserved(self):
+        budget = Budget(max_bytes=10 ** 9)
+        budget.start()
+        BudgetPP(budget).run(dict(id="a", duration=10))
+        self.assertEqual(BudgetPP.DEFAULT_BITRATE * 1000 // 8 * 10, budget.bytes)
+        BudgetPP(budget, max_duration=60).run(dict(id="b"))
+        self.assertEqual(BudgetPP.DEFAULT_BITRATE * 1000 // 8 * 70, budget.bytes)
+
+
+class FastHandler(ThrottlingHandler):
+    rate = 10 ** 9
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_bandwidth")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.server = ThrottlingServer(("127.0.0.1", 0), FastHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _info(self, video_id: str, size: int) -> dict:
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/stream?id={video_id}&range=0-{size - 1}"
+        return dict(id=video_id, title="title", ext="m4a", url=url, protocol="http", filesize=size,
+                    extractor="generic", extractor_key="Generic", webpage_url=url)
+
+    def _download(self, info: dict, limiter: RateLimiter | None = None, budget: Budget | None = None):
+        opts = dict(outtmpl=str(self.dir / "%(id)s.%(ext)s"), quiet=True, noprogress=True)
+        with YoutubeDL(opts) as ydl:
+            if limiter is not None:
+                ydl.add_progress_hook(limiter.progress_hook)
+            if budget is not None:
+                budget_pp = BudgetPP(budget)
+                ydl.add_post_processor(budget_pp, when="before_dl")
+                ydl.add_progress_hook(budget_pp.progress_hook)
+            ydl.process_ie_result(info, download=True)
+
+    def test_rate_limited(self):
+        size = len(FastHandler.data)
+        limiter = RateLimiter(RateSchedule([(0, size)]))
+        start = time.monotonic()
+        self._download(self._info("x", size), limiter)
+        elapsed = time.monotonic() - start
+        self.assertEqual(FastHandler.data, (self.dir / "x.m4a").read_bytes())
+        # all, but the first block, is limited to 1s
+        self.assertGreater(elapsed, 0.7)
+        self.assertLess(elapsed, 3)
+
+    def test_budget(self):
+        budget = Budget(max_bytes=250_000)
+        budget.start()
+        self._download(self._info("a", 200_000), budget=budget)
+        self.assertRaises(BudgetExpired, self._download, self._info("b", 100_000), budget=budget)
+        self._download(self._info("c", 50_000), budget=budget)
+        self.assertEqual(["a.m4a", "c.m4a"], sorted(f.name for f in self.dir.iterdir()))
+        self.assertEqual(250_000, budget.bytes)
+        self.assertTrue(budget.expired())
+
+
+if __name__ == '__main__':
+    unittest.main()
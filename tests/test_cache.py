@@ -3,7 +3,14 @@ import pathlib
 import shutil
 import unittest
 
-from ytldl.yt.cache import Cache, MemoryCache, SqliteCache
+from tests.bench_cache import BACKENDS, bench
+from ytldl.yt.cache import DBM, SQLITE, Cache, DbmCache, MemoryCache, SqliteCache, cache_backend, migrate, \
+    migrate_library_cache, open_cache, require_shared_cache
+
+try:
+    import dbm.gnu as gdbm
+except ImportError:
+    gdbm = None
 
 
 class ITestCache:
@@ -26,6 +33,10 @@ class ITestCache:
             self.assertEqual(self.cache.filter_uncached(
                 self.test_sequence), self.want_sequence)
 
+        def test_remove_items(self):
+            self.cache.remove_items(["1", "2"])
+            self.assertEqual({"1", "2", "3", "4"}, self.cache.filter_uncached(self.test_sequence))
+
         def tearDown(self) -> None:
             self.cache.commit()
             self.cache.close()
@@ -76,5 +87,127 @@ class TestSqliteCache(ITestCache.TestCache):
         dbv1Path.unlink()
 
 
+@unittest.skipIf(gdbm is None, "python is built without gdbm")
+class TestDbmCache(ITestCache.TestCache):
+    dir = pathlib.Path("tmp/test_dbm_cache")
+
+    def setUp(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.cache = DbmCache(str(self.dir / "ytldl.dbm"), batch_size=2)
+        super().setUp()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_batch(self):
+        self.cache.add_items({'10'})
+        self.assertEqual({'10'}, self.cache.filter_uncached(['10']))
+        self.cache.add_items({'11'})
+        self.assertEqual(set(), self.cache.filter_uncached(['10', '11']))
+
+    def test_keeps_first_time(self):
+        self.cache.add_discarded_items(['10', '11'])
+        self.cache.add_items(['10', '11'])
+        rows = {item: downloaded for item, _, downloaded in self.cache.export_items()}
+        self.assertFalse(rows['10'])
+        self.assertTrue(rows['0'])
+
+    def test_fix_downloaded_column(self):
+        self.cache.fix_downloaded_column(['1'])
+        rows = {item: downloaded for item, _, downloaded in self.cache.export_items()}
+        self.assertEqual({'0': False, '1': True, '2': False}, rows)
+
+    def test_locked(self):
+        self.assertRaises(gdbm.error, gdbm.open, str(self.dir / "ytldl.dbm"), "w")
+
+
+@unittest.skipIf(gdbm is not None, "python is built with gdbm")
+class TestDbmCacheWithoutGdbm(unittest.TestCase):
+    dir = pathlib.Path("tmp/test_dbm_cache")
+
+    def setUp(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_refused(self):
+        self.assertRaises(RuntimeError, DbmCache, str(self.dir / "ytldl.dbm"))
+
+    def test_migration_refused(self):
+        cache = open_cache(self.dir, backup=False)
+        cache.add_items(['1'])
+        cache.close()
+        self.assertRaises(RuntimeError, migrate_library_cache, self.dir, DBM)
+        self.assertEqual(["ytldl.db"], [p.name for p in self.dir.iterdir()])
+
+
+class TestMigrate(unittest.TestCase):
+    dir = pathlib.Path("tmp/test_migrate")
+
+    def setUp(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    @unittest.skipIf(gdbm is None, "python is built without gdbm")
+    def test_migrate(self):
+        sqlite = SqliteCache(str(self.dir / "a.db"), backup=False)
+        sqlite.add_items(['1', '2'])
+        sqlite.add_discarded_items(['3'])
+        dbm = DbmCache(str(self.dir / "b.dbm"))
+        self.assertEqual(3, migrate(sqlite, dbm, batch=2))
+        self.assertEqual(sorted(sqlite.export_items()), sorted(dbm.export_items()))
+        sqlite.close()
+        dbm.close()
+
+    @unittest.skipIf(gdbm is None, "python is built without gdbm")
+    def test_migrate_library_cache(self):
+        cache = open_cache(self.dir, backup=False)
+        self.assertIsInstance(cache, SqliteCache)
+        cache.add_items(['1', '2'])
+        cache.close()
+
+        self.assertEqual(2, migrate_library_cache(self.dir, DBM))
+        self.assertEqual(DBM, cache_backend(self.dir))
+        cache = open_cache(self.dir)
+        self.assertIsInstance(cache, DbmCache)
+        self.assertEqual({'3'}, cache.filter_uncached(['1', '2', '3']))
+        cache.add_items(['3'])
+        cache.close()
+
+        self.assertEqual(3, migrate_library_cache(self.dir, SQLITE))
+        self.assertEqual(SQLITE, cache_backend(self.dir))
+        cache = open_cache(self.dir, backup=False)
+        self.assertEqual(set(), cache.filter_uncached(['1', '2', '3']))
+        cache.close()
+        # previous backends are kept as backups
+        names = [p.name for p in self.dir.iterdir()]
+        self.assertEqual(1, len([name for name in names if name.startswith("ytldl.db.")]))
+        self.assertTrue(any(name.startswith("ytldl.dbm") for name in names))
+
+    def test_require_shared_cache(self):
+        require_shared_cache(self.dir)
+        # any dbm file makes library DBM-backed
+        import dbm.dumb
+        dbm.dumb.open(str(self.dir / "ytldl.dbm"), "c").close()
+        self.assertRaises(RuntimeError, require_shared_cache, self.dir)
+
+
+class TestBenchCache(unittest.TestCase):
+    def test_bench(self):
+        for backend in BACKENDS:
+            if backend == "dbm" and gdbm is None:
+                continue
+            res = bench(backend, 1000, query_size=10, queries=10)
+            self.assertGreater(res["add_per_second"], 0)
+            self.assertGreater(res["filter_per_second"], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
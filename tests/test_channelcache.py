@@ -0,0 +1,43 @@
+import pathlib
+import shutil
+import unittest
+
+from tests.test_infocache import FakeClock
+from ytldl.yt.channelcache import ChannelCache
+
+
+class TestChannelCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_channelcache")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.clock = FakeClock()
+        self.cache = ChannelCache(str(self.dir / "channels.db"), ttl=3600, clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get("channel"))
+
+    def test_ttl(self):
+        self.cache.put("channel", "playlist")
+        self.assertEqual("playlist", self.cache.get("channel"))
+        self.clock.now += 3600
+        self.assertIsNone(self.cache.get("channel"))
+
+    def test_invalidate(self):
+        self.cache.put("channel", "playlist")
+        self.cache.invalidate("channel")
+        self.assertIsNone(self.cache.get("channel"))
+
+    def test_persistent(self):
+        self.cache.put("channel", "playlist")
+        self.cache.close()
+        self.cache = ChannelCache(str(self.dir / "channels.db"), ttl=3600, clock=self.clock)
+        self.assertEqual("playlist", self.cache.get("channel"))
+
+
+if __name__ == '__main__':
+    unittest.main()
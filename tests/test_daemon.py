@@ -0,0 +1,163 @@
+import threading
+import time
+import unittest
+import json
+import shutil
+from concurrent.futures import Executor
+
+from ytldl.yt.daemon import Daemon, Library, send_command
+from ytldl.yt.download import LibDownloader
+from ytldl.yt.infocache import InfoCache
+
+
+class FakeDownloader:
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self.runs = 0
+        self.ran = threading.Event()
+        self.closed = False
+
+    def lib_update(self, limit: int = 50, budget=None) -> list[str]:
+        self.runs += 1
+        downloaded = [self.executor.submit(lambda i: str(i), i).result() for i in range(limit)]
+        self.ran.set()
+        return downloaded
+
+    def stop(self, drain_timeout: float | None = None):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeLibrary(Library):
+    def make_downloader(self, executor: Executor):
+        self.downloader = FakeDownloader(executor)
+        return self.downloader
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self) -> None:
+        self.libraries = [FakeLibrary("tmp/lib1", limit=2, interval=60),
+                          FakeLibrary("tmp/lib2", limit=3, interval=60)]
+        self.daemon = Daemon(self.libraries, workers=2, port=0)
+        self.daemon.start()
+        self.host, self.port = self.daemon.address
+        for library in self.libraries:
+            self._wait_run(library, 1)
+
+    def tearDown(self) -> None:
+        self.daemon.stop()
+        self.daemon.join()
+
+    def _wait_run(self, library: FakeLibrary, runs: int):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if getattr(library, "downloader", None) and library.downloader.runs >= runs \
+                    and library.state == "idle":
+                return
+            time.sleep(0.01)
+        self.fail(f"library {library.name} didn't run {runs} times")
+
+    def test_status(self):
+        status = send_command(dict(cmd="status"), host=self.host, port=self.port)
+        self.assertEqual(2, status["workers"])
+        self.assertEqual([2, 3], [lib["last_downloaded"] for lib in status["libraries"]])
+        self.assertTrue(all(lib["state"] == "idle" for lib in status["libraries"]))
+
+    def test_update_one(self):
+        response = send_command(dict(cmd="update", dir="tmp/lib2"), host=self.host, port=self.port)
+        self.assertEqual([self.libraries[1].name], response["triggered"])
+        self._wait_run(self.libraries[1], 2)
+        self.assertEqual(1, self.libraries[0].downloader.runs)
+
+    def test_unknown_command(self):
+        self.assertIn("error", send_command(dict(cmd="nope"), host=self.host, port=self.port))
+
+    def test_downloaders_closed_on_stop(self):
+        self.daemon.stop()
+        self.daemon.join()
+        self.assertTrue(all(library.downloader.closed for library in self.libraries))
+
+
+class FakeOauth:
+    def __init__(self):
+        self.token = "token1"
+
+    @property
+    def auth(self) -> str:
+        return json.dumps(dict(access_token=self.token))
+
+
+class FakeYTMusic:
+    def __init__(self, auth: str):
+        self.auth = auth
+        self.home_requests: list[str] = []
+
+    def get_home(self, limit: int) -> list:
+        self.home_requests.append(json.loads(self.auth)["access_token"])
+        return []
+
+
+class FakeAuthLibDownloader(LibDownloader):
+    # all clients, the downloader has created
+    clients: list[FakeYTMusic]
+
+    @staticmethod
+    def _make_yt(auth: str) -> FakeYTMusic:
+        client = FakeYTMusic(auth)
+        FakeAuthLibDownloader.clients.append(client)
+        return client
+
+
+class AuthLibrary(Library):
+    def make_downloader(self, executor: Executor):
+        return FakeAuthLibDownloader(self.download_dir, self.oauth, executor=executor,
+                                     info_cache=InfoCache(str(self.info_cache_path)))
+
+
+class TestDaemonAuth(unittest.TestCase):
+    def setUp(self) -> None:
+        FakeAuthLibDownloader.clients = []
+        self.oauth = FakeOauth()
+        self.library = AuthLibrary("tmp/lib_auth", self.oauth, interval=60)
+        self.library.ytldl_dir.mkdir(parents=True, exist_ok=True)
+        self.daemon = Daemon([self.library], workers=1, port=0)
+
+    def tearDown(self) -> None:
+        self.daemon.stop()
+        self.daemon.join()
+        shutil.rmtree("tmp/lib_auth", ignore_errors=True)
+
+    def _wait_runs(self, runs: int):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if sum(len(client.home_requests) for client in FakeAuthLibDownloader.clients) >= runs \
+                    and self.library.state == "idle":
+                return
+            time.sleep(0.01)
+        self.fail(f"library didn't run {runs} times")
+
+    def test_refreshed_token_used_by_next_run(self):
+        self.daemon.start()
+        self._wait_runs(1)
+        # token expired and was refreshed by Oauth between runs
+        self.oauth.token = "token2"
+        send_command(dict(cmd="update"), port=self.daemon.address[1])
+        self._wait_runs(2)
+        self.assertEqual(["token1", "token2"],
+                         [token for client in FakeAuthLibDownloader.clients for token in client.home_requests])
+
+    def test_run_purges_info_cache(self):
+        info_cache = InfoCache(str(self.library.info_cache_path), clock=lambda: 0)
+        info_cache.put("old", dict(id="old"))
+        info_cache.close()
+        self.daemon.start()
+        self._wait_runs(1)
+        info_cache = InfoCache(str(self.library.info_cache_path))
+        self.assertIsNone(info_cache._row("old"))
+        info_cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,20 @@
 import pathlib
 import shutil
+import threading
+import time
 import unittest
+from concurrent.futures import Executor, Future
+
+from yt_dlp import YoutubeDL
 
 from tests import consts
+from tests.test_transfer import ThrottlingHandler, ThrottlingServer
 from ytldl.yt.download import Downloader, LibDownloader
+from ytldl.yt.infocache import InfoCache
+from ytldl.yt.pool import FairExecutor
+from ytldl.yt.postprocessors import FilterPPException
+from ytldl.yt.scheduler import Budget, BudgetExpired, DownloadAborted
+from ytldl.yt.track import Track
 
 
 class TestDownloader(unittest.TestCase):
@@ -44,6 +55,218 @@ class TestDownloader(unittest.TestCase):
         shutil.rmtree(self.dir)
 
 
+class FakeDownloader(Downloader):
+    def __init__(self, *args, on_download=None, **kwargs):
+        super().__init__(*args, yt=object(), **kwargs)
+        self.on_download = on_download
+        self.started = []
+
+    def _download_track(self, video_id: str, budget: Budget | None = None) -> str:
+        self.started.append(video_id)
+        if self.on_download:
+            self.on_download(video_id)
+        return video_id
+
+
+class InlineExecutor(Executor):
+    """
+    Runs task at once in submit(), like a worker thread, that starts it before submit() returns.
+    """
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class TestDownloadTracks(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test")
+        self.executor = FairExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        shutil.rmtree(self.dir)
+
+    def test_order(self):
+        d = FakeDownloader(self.dir, executor=self.executor)
+        downloaded = list(d._download_tracks(["c", "a", "c", "b"]))
+        self.assertEqual(["c", "a", "b"], downloaded)
+        self.assertEqual(["c", "a", "b"], d.started)
+
+    def test_max_tracks(self):
+        d = FakeDownloader(self.dir, executor=self.executor)
+        downloaded = list(d._download_tracks(["c", "a", "b"], budget=Budget(max_tracks=2)))
+        self.assertEqual(["c", "a"], downloaded)
+
+    def test_discard_non_songs(self):
+        d = FakeDownloader(self.dir, executor=self.executor)
+        d._extractor.tracks["video"] = Track("video", "title", ("artist",), video_type="MUSIC_VIDEO_TYPE_UGC")
+        discarded = []
+        downloaded = list(d._download_tracks(["a", "video"], on_discarded=discarded.extend))
+        self.assertEqual(["a"], downloaded)
+        self.assertEqual(["a"], d.started)
+        self.assertEqual(["video"], discarded)
+
+    def test_max_duration(self):
+        now = [0.0]
+        budget = Budget(max_duration=1.5, clock=lambda: now[0])
+        budget.start()
+
+        def on_download(video_id: str):
+            now[0] += 1
+
+        d = FakeDownloader(self.dir, executor=self.executor, on_download=on_download)
+        downloaded = list(d._download_tracks([str(i) for i in range(10)], budget=budget))
+        self.assertEqual(["0", "1"], downloaded)
+
+    def test_track_over_max_bytes_skipped(self):
+        def on_download(video_id: str):
+            # as BudgetPP does, when track doesn't fit
+            if video_id == "b":
+                raise BudgetExpired()
+
+        d = FakeDownloader(self.dir, executor=self.executor, on_download=on_download)
+        downloaded = list(d._download_tracks(["a", "b", "c"], budget=Budget(max_bytes=100)))
+        self.assertEqual(["a", "c"], downloaded)
+
+    def test_events(self):
+        def on_download(video_id: str):
+            if video_id == "b":
+                raise RuntimeError("broken")
+
+        d = FakeDownloader(self.dir, executor=self.executor, on_download=on_download)
+        d._extractor.tracks["video"] = Track("video", "title", ("artist",), video_type="MUSIC_VIDEO_TYPE_UGC")
+        events = []
+        d.events.subscribe(events.append)
+        list(d._download_tracks(["a", "b", "video"]))
+        d.events.close()
+        self.assertEqual([("discarded", "video"), ("queued", "a"), ("queued", "b"),
+                          ("downloaded", "a"), ("failed", "b")],
+                         [(e.type, e.video_id) for e in events])
+
+    def test_queued_before_started(self):
+        d = FakeDownloader(self.dir, executor=InlineExecutor(),
+                           on_download=lambda video_id: d.events.emit("started", video_id))
+        events = []
+        d.events.subscribe(events.append)
+        list(d._download_tracks(["a", "b"]))
+        d.events.close()
+        self.assertEqual([("queued", "a"), ("started", "a"), ("queued", "b"), ("started", "b"),
+                          ("downloaded", "a"), ("downloaded", "b")],
+                         [(e.type, e.video_id) for e in events])
+
+    def test_stop(self):
+        d = FakeDownloader(self.dir, executor=self.executor, on_download=lambda video_id: d.stop())
+        after_download = []
+        downloaded = list(d._download_tracks(["a", "b", "c"], after_download=after_download.append))
+        # running track is completed and cached, the rest isn't started
+        self.assertEqual(["a"], downloaded)
+        self.assertEqual(["a"], after_download)
+        self.assertEqual(["a"], d.started)
+
+
+class TestStop(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_stop")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_close(self):
+        d = Downloader(self.dir, yt=object())
+        d.close()
+        self.assertRaises(RuntimeError, d._prefetch_executor.submit, print)
+
+    def test_abort_hook(self):
+        d = Downloader(self.dir, yt=object(), drain_timeout=60)
+        d._abort_hook({})
+        d.stop()
+        d._abort_hook({})
+        # second stop aborts at once
+        d.stop()
+        self.assertRaises(DownloadAborted, d._abort_hook, {})
+
+    def test_running_download_aborted_after_drain_timeout(self):
+        server = ThrottlingServer(("127.0.0.1", 0), ThrottlingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/stream?id=x&range=0-{len(ThrottlingHandler.data) - 1}"
+        info = dict(id="x", title="title", ext="m4a", url=url, protocol="http",
+                    extractor="generic", extractor_key="Generic", webpage_url=url)
+        opts = dict(outtmpl=str(self.dir / "%(id)s.%(ext)s"), quiet=True, noprogress=True)
+
+        d = Downloader(self.dir, yt=object())
+        timer = threading.Timer(0.1, d.stop, kwargs=dict(drain_timeout=0.1))
+        try:
+            with YoutubeDL(opts) as ydl:
+                ydl.add_progress_hook(d._abort_hook)
+                timer.start()
+                start = time.monotonic()
+                self.assertRaises(DownloadAborted, ydl.process_ie_result, info, download=True)
+                # throttled download takes about 1s
+                self.assertLess(time.monotonic() - start, 0.6)
+        finally:
+            timer.cancel()
+            server.shutdown()
+            server.server_close()
+        # partial download is left for resume
+        self.assertTrue((self.dir / "x.m4a.part").exists())
+        self.assertFalse((self.dir / "x.m4a").exists())
+
+
+class FakeYoutubeDL:
+    def __init__(self, info: dict):
+        self.info = info
+        self.extracted = 0
+        self.processed = []
+
+    def extract_info(self, url: str, download: bool = True, process: bool = True) -> dict:
+        self.extracted += 1
+        return dict(self.info)
+
+    def process_ie_result(self, info: dict, download: bool = True):
+        self.processed.append(info)
+
+    sanitize_info = staticmethod(YoutubeDL.sanitize_info)
+
+
+class TestDownloadWithInfoCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test")
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.info_cache = InfoCache(str(self.dir / "info.db"))
+        self.d = Downloader(self.dir, yt=object(), info_cache=self.info_cache)
+
+    def tearDown(self):
+        self.info_cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_cached_info_reused(self):
+        ydl = FakeYoutubeDL(dict(id="id", artist="artist", title="title", formats=[]))
+        self.d._download_with_info_cache(ydl, "id")
+        self.d._download_with_info_cache(ydl, "id")
+        self.assertEqual(1, ydl.extracted)
+        self.assertEqual(2, len(ydl.processed))
+
+    def test_cached_non_song_discarded(self):
+        self.info_cache.put("id", dict(id="id", title="title"))
+        ydl = FakeYoutubeDL({})
+        self.assertRaises(FilterPPException, self.d._download_with_info_cache, ydl, "id")
+        self.assertEqual(0, ydl.extracted)
+
+    def test_format_sort_fields_cached(self):
+        ydl = FakeYoutubeDL(dict(id="id", artist="artist", title="title", formats=[],
+                                 _format_sort_fields=("quality", "res", "source")))
+        self.d._download_with_info_cache(ydl, "id")
+        self.d._download_with_info_cache(ydl, "id")
+        self.assertEqual(["quality", "res", "source"], ydl.processed[1]["_format_sort_fields"])
+
+
 class TestLibDownloader(unittest.TestCase):
     def setUp(self) -> None:
         self.dir = pathlib.Path("tmp/test")
@@ -0,0 +1,95 @@
+import io
+import json
+import threading
+import unittest
+
+from ytldl.yt.events import Event, EventBus, JsonLinesSink, ProgressTracker
+
+
+class TestEventBus(unittest.TestCase):
+    def test_no_subscribers(self):
+        bus = EventBus()
+        bus.emit(EventBus.QUEUED, "a")
+        bus.close()
+
+    def test_order_and_close(self):
+        bus = EventBus()
+        events = []
+        bus.subscribe(events.append)
+        threads = [threading.Thread(target=lambda i=i: [bus.emit(EventBus.PROGRESS, str(i), downloaded_bytes=j)
+                                                        for j in range(100)])
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bus.close()
+        self.assertEqual(400, len(events))
+        for i in range(4):
+            self.assertEqual(list(range(100)),
+                             [e.data["downloaded_bytes"] for e in events if e.video_id == str(i)])
+
+    def test_failing_subscriber(self):
+        bus = EventBus()
+        events = []
+        bus.subscribe(lambda e: 1 / 0)
+        bus.subscribe(events.append)
+        bus.emit(EventBus.QUEUED, "a")
+        bus.close()
+        self.assertEqual(1, len(events))
+
+    def test_hooks(self):
+        bus = EventBus()
+        events = []
+        bus.subscribe(events.append)
+        info = dict(id="a")
+        bus.progress_hook(dict(status="downloading", info_dict=info, downloaded_bytes=10, total_bytes=100))
+        bus.progress_hook(dict(status="finished", info_dict=info, downloaded_bytes=100, total_bytes=100))
+        bus.postprocessor_hook(dict(status="finished", postprocessor="Lyrics", info_dict=info))
+        bus.postprocessor_hook(dict(status="finished", postprocessor="Metadata", info_dict=info))
+        bus.close()
+        self.assertEqual([("progress", "a"), ("tagged", "a")], [(e.type, e.video_id) for e in events])
+        self.assertEqual(100, events[0].data["total_bytes"])
+
+
+class TestProgressTracker(unittest.TestCase):
+    def test_throughput_and_eta(self):
+        now = [10.0]
+        tracker = ProgressTracker(window=30, clock=lambda: now[0])
+        tracker(Event(EventBus.DISCARDED, "x", 0, {}))
+        tracker(Event(EventBus.QUEUED, "a", 0, {}))
+        tracker(Event(EventBus.QUEUED, "b", 0, {}))
+        tracker(Event(EventBus.QUEUED, "c", 0, {}))
+        tracker(Event(EventBus.PROGRESS, "a", 0, dict(downloaded_bytes=0)))
+        tracker(Event(EventBus.PROGRESS, "a", 5, dict(downloaded_bytes=500)))
+        tracker(Event(EventBus.PROGRESS, "a", 10, dict(downloaded_bytes=1000)))
+        tracker(Event(EventBus.DOWNLOADED, "a", 10, {}))
+
+        self.assertEqual(1000, tracker.bytes)
+        self.assertEqual(100, tracker.throughput())
+        # 1 track in 10 seconds, 2 are left
+        self.assertEqual(20, tracker.eta())
+        self.assertEqual(3, tracker.snapshot()["counts"]["queued"])
+
+    def test_eta_unknown(self):
+        tracker = ProgressTracker()
+        tracker(Event(EventBus.QUEUED, "a", 0, {}))
+        self.assertIsNone(tracker.eta())
+
+
+class TestJsonLinesSink(unittest.TestCase):
+    def test_write(self):
+        file = io.StringIO()
+        tracker = ProgressTracker()
+        sink = JsonLinesSink(file, tracker)
+        for event in [Event(EventBus.QUEUED, "a", 1, {}), Event(EventBus.FAILED, "a", 2, dict(error="e"))]:
+            tracker(event)
+            sink(event)
+        lines = [json.loads(line) for line in file.getvalue().splitlines()]
+        self.assertEqual(["queued", "failed", "stats"], [line["type"] for line in lines])
+        self.assertEqual("e", lines[1]["error"])
+        self.assertEqual(1, lines[2]["counts"]["failed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
+import pathlib
+import shutil
 import unittest
 
 from ytmusicapi import YTMusic
 
+from ytldl.yt.cache import MemoryCache
+from ytldl.yt.channelcache import ChannelCache
 from ytldl.yt.extractor import Extractor
 
 
@@ -52,5 +56,90 @@ class TestExtractor(unittest.TestCase):
         )) == 0)
 
 
+class PagedExtractor(Extractor):
+    """
+    Serves playlist pages from memory.
+    """
+
+    def __init__(self, pages: list[list[str]], *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.pages = pages
+        self.requested_pages = 0
+
+    def _iter_playlist_pages(self, playlist: str):
+        for page in self.pages:
+            self.requested_pages += 1
+            yield [dict(videoId=video_id) for video_id in page]
+
+
+class TestExtractorPaging(unittest.TestCase):
+    pages = [["a", "b", "c"], ["d", "e", "f"], ["g", "h", "i"]]
+
+    def test_counts_new_tracks(self):
+        extractor = PagedExtractor(self.pages, cache=MemoryCache(["a", "b", "c", "d"]))
+        self.assertEqual(["e", "f"], list(extractor.extract(playlists=["p"], limit=2)))
+        self.assertEqual(2, extractor.requested_pages)
+
+    def test_stops_after_known(self):
+        extractor = PagedExtractor(self.pages, cache=MemoryCache(["b", "c", "d", "e"]), stop_after_known=3)
+        self.assertEqual(["a"], list(extractor.extract(playlists=["p"], limit=10)))
+        self.assertEqual(2, extractor.requested_pages)
+
+    def test_all_pages(self):
+        extractor = PagedExtractor(self.pages, cache=MemoryCache(["a"]))
+        self.assertEqual(8, len(list(extractor.extract(playlists=["p"], limit=100))))
+
+    def test_zero_limit(self):
+        extractor = PagedExtractor(self.pages, cache=MemoryCache())
+        self.assertEqual([], list(extractor.extract(playlists=["p"], limit=0)))
+        self.assertEqual(0, extractor.requested_pages)
+
+
+class FakeYTMusic:
+    """
+    Channel "c" has songs playlist "p".
+    """
+
+    def __init__(self):
+        self.playlists = {"p": ["a", "b"]}
+        self.requests: list[str] = []
+
+    def get_artist(self, channel: str) -> dict:
+        self.requests.append("get_artist")
+        return dict(songs=dict(browseId=next(iter(self.playlists))))
+
+    def get_playlist(self, playlistId: str, limit: int) -> dict:
+        self.requests.append("get_playlist")
+        return dict(tracks=[dict(videoId=video_id) for video_id in self.playlists[playlistId]])
+
+    def get_watch_playlist(self, playlistId: str, limit: int) -> dict:
+        raise Exception("not found")
+
+
+class TestExtractorChannelCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_extractor")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.channel_cache = ChannelCache(str(self.dir / "channels.db"))
+        self.yt = FakeYTMusic()
+        self.extractor = Extractor(self.yt, channel_cache=self.channel_cache)
+
+    def tearDown(self) -> None:
+        self.channel_cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_resolved_once(self):
+        self.assertEqual(["a", "b"], list(self.extractor.extract(channels=["c"])))
+        self.assertEqual(["a", "b"], list(self.extractor.extract(channels=["c"])))
+        self.assertEqual(["get_artist", "get_playlist", "get_playlist"], self.yt.requests)
+
+    def test_invalidated_on_failure(self):
+        self.channel_cache.put("c", "stale")
+        self.assertEqual(["a", "b"], list(self.extractor.extract(channels=["c"])))
+        self.assertEqual("p", self.channel_cache.get("c"))
+        self.assertEqual(["get_playlist", "get_artist", "get_playlist"], self.yt.requests)
+
+
 if __name__ == '__main__':
     unittest.main()
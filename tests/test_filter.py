@@ -0,0 +1,44 @@
+import unittest
+
+from ytldl.yt.filter import TrackFilter
+from ytldl.yt.track import Track
+
+
+class TestTrackFilter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.filter = TrackFilter(min_duration=30, max_duration=600, require_artists=True)
+
+    def test_unknown(self):
+        self.assertIsNone(self.filter.is_song(None))
+
+    def test_song(self):
+        track = Track("id", "title", ("artist",), duration_seconds=200, video_type="MUSIC_VIDEO_TYPE_ATV")
+        self.assertTrue(self.filter.is_song(track))
+
+    def test_music_video_is_ambiguous(self):
+        track = Track("id", "title", ("artist",), duration_seconds=200, video_type="MUSIC_VIDEO_TYPE_OMV")
+        self.assertIsNone(self.filter.is_song(track))
+
+    def test_user_video(self):
+        track = Track("id", "title", ("artist",), duration_seconds=200, video_type="MUSIC_VIDEO_TYPE_UGC")
+        self.assertFalse(self.filter.is_song(track))
+
+    def test_no_artists(self):
+        self.assertFalse(self.filter.is_song(Track("id", "title", video_type="MUSIC_VIDEO_TYPE_ATV")))
+
+    def test_duration(self):
+        for duration in (10, 3600):
+            track = Track("id", "title", ("artist",), duration_seconds=duration, video_type="MUSIC_VIDEO_TYPE_ATV")
+            self.assertFalse(self.filter.is_song(track))
+
+    def test_defaults_dont_discard_songs(self):
+        track_filter = TrackFilter()
+        long = Track("id", "title", ("artist",), duration_seconds=3600, video_type="MUSIC_VIDEO_TYPE_ATV")
+        self.assertTrue(track_filter.is_song(long))
+        self.assertIsNone(track_filter.is_song(Track("id", "title", video_type="MUSIC_VIDEO_TYPE_ATV")))
+        short = Track("id", "title", ("artist",), duration_seconds=10, video_type="MUSIC_VIDEO_TYPE_ATV")
+        self.assertTrue(track_filter.is_song(short))
+
+
+if __name__ == '__main__':
+    unittest.main()
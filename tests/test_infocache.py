@@ -0,0 +1,64 @@
+import pathlib
+import shutil
+import unittest
+
+from ytldl.yt.infocache import InfoCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestInfoCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_infocache")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.clock = FakeClock()
+        self.cache = InfoCache(str(self.dir / "info.db"), url_ttl=3600, meta_ttl=86400, clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _info(self, expire: float | None = None) -> dict:
+        url = "https://example.com/audio" + (f"?expire={int(expire)}&x=1" if expire else "")
+        return dict(id="id", title="title", artist="artist", formats=[dict(format_id="140", url=url)])
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get("id"))
+        self.assertIsNone(self.cache.get_metadata("id"))
+
+    def test_url_ttl(self):
+        self.cache.put("id", self._info())
+        self.assertEqual(self._info(), self.cache.get("id"))
+        self.clock.now += 3600
+        self.assertIsNone(self.cache.get("id"))
+        self.assertEqual(dict(id="id", title="title", artist="artist"), self.cache.get_metadata("id"))
+
+    def test_url_expire_param(self):
+        self.cache.put("id", self._info(expire=self.clock.now + 1200))
+        self.assertIsNotNone(self.cache.get("id"))
+        # urls are considered expired EXPIRE_MARGIN before their expiration
+        self.clock.now += 1200 - InfoCache.EXPIRE_MARGIN
+        self.assertIsNone(self.cache.get("id"))
+
+    def test_meta_ttl(self):
+        self.cache.put("id", self._info())
+        self.clock.now += 86400
+        self.assertIsNone(self.cache.get_metadata("id"))
+        self.cache.purge()
+        self.assertIsNone(self.cache._row("id"))
+
+    def test_invalidate(self):
+        self.cache.put("id", self._info())
+        self.cache.invalidate("id")
+        self.assertIsNone(self.cache.get_metadata("id"))
+
+
+if __name__ == '__main__':
+    unittest.main()
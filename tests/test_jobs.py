@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import pathlib
+import shutil
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from ytldl.yt.cache import MemoryCache, SqliteCache
+from ytldl.yt.jobs import JobQueue, JobWorker
+from ytldl.yt.postprocessors import FilterPPException
+from ytldl.yt.scheduler import DownloadAborted
+
+DIR = pathlib.Path("tmp/test_jobs")
+
+
+def _fake_download(video_id: str):
+    if video_id.startswith("video"):
+        raise FilterPPException()
+    # fails, if track is downloaded twice
+    fd = os.open(DIR / "out" / video_id, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    os.close(fd)
+
+
+def _run_worker(queue_path: str, cache_path: str) -> None:
+    queue = JobQueue(queue_path)
+    cache = SqliteCache(cache_path, backup=False)
+    JobWorker(queue, cache, _fake_download, batch_size=2).run(stop_when_empty=True)
+    cache.close()
+    queue.close()
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        shutil.rmtree(DIR, ignore_errors=True)
+        (DIR / "out").mkdir(parents=True)
+        self.queue_path = str(DIR / "jobs.db")
+        self.queue = JobQueue(self.queue_path, lease_seconds=60, max_attempts=2)
+
+    def tearDown(self) -> None:
+        self.queue.close()
+        shutil.rmtree(DIR, ignore_errors=True)
+
+    def test_put_is_idempotent(self):
+        self.assertEqual(2, self.queue.put(["a", "b"]))
+        self.assertEqual(1, self.queue.put(["b", "c"]))
+        self.assertEqual({JobQueue.PENDING: 3}, self.queue.counts())
+
+    def test_lease(self):
+        self.queue.put(["a", "b", "c"])
+        leased = self.queue.lease("w1", 2)
+        self.assertEqual(2, len(leased))
+        self.assertEqual(1, len(self.queue.lease("w2", 2)))
+        self.assertEqual([], self.queue.lease("w3", 2))
+
+    def test_complete(self):
+        self.queue.put(["a"])
+        self.queue.lease("w1")
+        self.queue.complete("w1", "a")
+        self.assertEqual({JobQueue.DONE: 1}, self.queue.counts())
+
+    def test_dead_worker_recovery(self):
+        self.queue.put(["a"])
+        self.queue.lease_seconds = 0.05
+        self.assertEqual(["a"], self.queue.lease("dead"))
+        self.assertEqual([], self.queue.lease("w2"))
+        time.sleep(0.1)
+        self.assertEqual(["a"], self.queue.lease("w2"))
+
+        # late report of dead worker doesn't break anything
+        self.queue.complete("w2", "a")
+        self.queue.fail("dead", "a", "late")
+        self.assertEqual({JobQueue.DONE: 1}, self.queue.counts())
+
+    def test_exhausted_lease_fails(self):
+        self.queue.put(["a"])
+        self.queue.lease_seconds = 0.01
+        self.queue.lease("w1")
+        time.sleep(0.02)
+        self.queue.lease("w2")
+        time.sleep(0.02)
+        self.assertEqual([], self.queue.lease("w3"))
+        self.assertEqual({JobQueue.FAILED: 1}, self.queue.counts())
+
+    def test_fail_retries(self):
+        self.queue.put(["a"])
+        self.queue.lease("w1")
+        self.queue.fail("w1", "a", "error")
+        self.assertEqual(["a"], self.queue.lease("w1"))
+        self.queue.fail("w1", "a", "error")
+        self.assertEqual({JobQueue.FAILED: 1}, self.queue.counts())
+
+    def test_put_requeues_finished(self):
+        self.queue.put(["a", "b", "c", "d"])
+        self.queue.lease("w1", 4)
+        self.queue.complete("w1", "a")
+        self.queue.discard("w1", "b")
+        self.queue.fail("w1", "c", "error")
+        self.queue.lease("w1")
+        self.queue.fail("w1", "c", "error")
+        self.assertEqual({JobQueue.DONE: 1, JobQueue.DISCARDED: 1, JobQueue.FAILED: 1, JobQueue.LEASED: 1},
+                         self.queue.counts())
+
+        self.assertEqual(4, self.queue.put(["a", "b", "c", "d", "e"]))
+        # leased job is left to its worker
+        self.assertEqual({JobQueue.PENDING: 4, JobQueue.LEASED: 1}, self.queue.counts())
+        # requeued job gets all its attempts again
+        self.assertEqual(4, len(self.queue.lease("w2", 10)))
+        self.queue.fail("w2", "c", "error")
+        self.assertEqual(["c"], self.queue.lease("w2"))
+
+    def test_worker_with_executor(self):
+        self.queue.put(["a", "b", "c"])
+        cache = MemoryCache()
+        # fails, unless all tracks are downloaded at once
+        barrier = threading.Barrier(3, timeout=5)
+
+        def download(video_id: str):
+            barrier.wait()
+
+        with ThreadPoolExecutor(3) as executor:
+            worker = JobWorker(self.queue, cache, download, batch_size=3, executor=executor)
+            self.assertEqual(3, worker.run(stop_when_empty=True))
+        self.assertEqual({JobQueue.DONE: 3}, self.queue.counts())
+        self.assertEqual(set(), cache.filter_uncached(["a", "b", "c"]))
+
+    def test_release(self):
+        self.queue.put(["a"])
+        self.queue.lease("w1")
+        self.queue.release("w1", "a")
+        self.assertEqual({JobQueue.PENDING: 1}, self.queue.counts())
+        # released job doesn't spend attempt
+        for _ in range(2):
+            self.assertEqual(["a"], self.queue.lease("w1"))
+            self.queue.release("w1", "a")
+        self.assertEqual(["a"], self.queue.lease("w1"))
+
+    def test_stopped_worker_returns_jobs(self):
+        self.queue.put(["a", "b", "c"])
+        cache = MemoryCache()
+
+        def download(video_id: str):
+            worker.stop()
+            if video_id == "a":
+                raise DownloadAborted()
+
+        worker = JobWorker(self.queue, cache, download, batch_size=3)
+        self.assertEqual(0, worker.run())
+        self.assertEqual({JobQueue.PENDING: 3}, self.queue.counts())
+        self.assertEqual({"a", "b", "c"}, cache.filter_uncached(["a", "b", "c"]))
+
+    def test_worker(self):
+        self.queue.put(["a", "video1"])
+        cache = MemoryCache()
+        processed = JobWorker(self.queue, cache, _fake_download).run(stop_when_empty=True)
+        self.assertEqual(2, processed)
+        self.assertEqual(set(), cache.filter_uncached(["a", "video1"]))
+        self.assertEqual({JobQueue.DONE: 1, JobQueue.DISCARDED: 1}, self.queue.counts())
+
+    def test_several_processes(self):
+        items = [f"track{i}" for i in range(40)] + [f"video{i}" for i in range(5)]
+        self.queue.put(items)
+        cache_path = str(DIR / "ytldl.db")
+        SqliteCache(cache_path, backup=False).close()
+
+        ctx = multiprocessing.get_context("spawn")
+        processes = [ctx.Process(target=_run_worker, args=(self.queue_path, cache_path)) for _ in range(3)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(0, p.exitcode)
+
+        self.assertEqual({JobQueue.DONE: 40, JobQueue.DISCARDED: 5}, self.queue.counts())
+        self.assertEqual(40, len(os.listdir(DIR / "out")))
+        cache = SqliteCache(cache_path, backup=False)
+        self.assertEqual(set(), cache.filter_uncached(items))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ import unittest
 from mutagen.mp4 import MP4, MP4FreeForm, AtomDataType, MP4Cover
 from PIL import Image
 
-from ytldl.metadata.metadata import write_metadata
+from ytldl.metadata.metadata import read_metadata, write_metadata
 
 
 class TestWriteMetadata(unittest.TestCase):
@@ -37,6 +37,11 @@ class TestWriteMetadata(unittest.TestCase):
                     "----:com.apple.iTunes:WWW", "covr"}
         self.assertTrue(len(not_want.intersection(keys)) == 0)
 
+    def test_read_metadata(self):
+        write_metadata(str(self.filepath), self.metadata_to_write)
+        self.assertEqual(dict(artist="artist", title="title", lyrics="lyrics", url="url"),
+                         read_metadata(str(self.filepath)))
+
     def tearDown(self) -> None:
         self.filepath.unlink()
 
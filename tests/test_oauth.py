@@ -1,6 +1,15 @@
 import json
 import pathlib
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import TestCase
+from unittest.mock import patch
+
+import requests
+import robocrypt
+from ytmusicapi.auth.oauth import YTMusicOAuth
 
 from ytldl.yt.oauth import Oauth
 
@@ -31,3 +40,115 @@ class TestOauth(TestCase):
 
         headers2 = oauth.auth
         self.assertEqual(headers1, headers2)
+
+
+class FakeTokenHandler(BaseHTTPRequestHandler):
+    requests_count = 0
+
+    def do_POST(self):
+        FakeTokenHandler.requests_count += 1
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        assert "grant_type=refresh_token" in body
+        data = json.dumps(dict(access_token="refreshed", expires_in=3599, token_type="Bearer")).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOauthCredentials(TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_oauth")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.oauth_path = self.dir / "oauth"
+        self.salt_path = self.dir / "salt"
+
+        self.server = HTTPServer(("127.0.0.1", 0), FakeTokenHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.token_url = f"http://127.0.0.1:{self.server.server_port}/token"
+        FakeTokenHandler.requests_count = 0
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _new_oauth(self) -> Oauth:
+        return Oauth(self.oauth_path, self.salt_path, password="123", token_url=self.token_url)
+
+    def _write_token(self, oauth: Oauth, expires_at: float):
+        oauth._dump(dict(access_token="initial", refresh_token="refresh", token_type="Bearer",
+                         expires_in=3599, expires_at=int(expires_at)))
+
+    def test_compatible_with_robocrypt(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 3600)
+        decrypted = json.loads(robocrypt.decrypt(self.oauth_path.read_bytes(), b"123"))
+        self.assertEqual("initial", decrypted["access_token"])
+
+    def test_key_derived_once(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 3600)
+        with patch("robocrypt.get_kdf", side_effect=AssertionError("kdf called twice")):
+            other = self._new_oauth()
+            self.assertEqual(oauth.auth, other.auth)
+
+    def test_token_kept_in_memory(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 3600)
+        oauth.auth
+        with patch.object(Oauth, "_load", side_effect=AssertionError("reloaded")):
+            self.assertEqual("initial", json.loads(oauth.auth)["access_token"])
+
+    def test_reload_on_file_change(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 3600)
+        oauth.auth
+        other = self._new_oauth()
+        other._dump(dict(access_token="other", refresh_token="refresh", token_type="Bearer",
+                         expires_in=3600, expires_at=int(time.time()) + 7200))
+        self.assertEqual("other", json.loads(oauth.auth)["access_token"])
+
+    def test_refresh_expiring(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 10)
+        token = json.loads(oauth.auth)
+        self.assertEqual("refreshed", token["access_token"])
+        self.assertEqual("refresh", token["refresh_token"])
+        self.assertEqual(1, FakeTokenHandler.requests_count)
+
+        # refreshed token is persisted and shared with other instances
+        self.assertEqual("refreshed", json.loads(self._new_oauth().auth)["access_token"])
+        self.assertEqual(1, FakeTokenHandler.requests_count)
+
+    def test_ytmusic_doesnt_refresh(self):
+        # YTMusic refreshes tokens, expiring within an hour, as Google issued ones do
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 30 * 60)
+        with patch.object(YTMusicOAuth, "refresh_token", side_effect=AssertionError("refreshed by YTMusic")):
+            headers = YTMusicOAuth(requests.Session()).load_headers(json.loads(oauth.auth))
+        self.assertEqual("Bearer initial", headers["Authorization"])
+        self.assertEqual(0, FakeTokenHandler.requests_count)
+
+    def test_refreshed_once(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 60)
+        self.assertEqual("refreshed", json.loads(oauth.auth)["access_token"])
+        # fresh token isn't refreshed again
+        self.assertEqual("refreshed", json.loads(oauth.auth)["access_token"])
+        self.assertEqual("refreshed", json.loads(self._new_oauth().auth)["access_token"])
+        self.assertEqual(1, FakeTokenHandler.requests_count)
+
+    def test_other_robocrypt_version(self):
+        oauth = self._new_oauth()
+        self._write_token(oauth, time.time() + 3600)
+        with patch("ytldl.yt.oauth._ROBOCRYPT_COMPATIBLE", False):
+            other = self._new_oauth()
+            self.assertEqual("initial", json.loads(other.auth)["access_token"])
+            self._write_token(other, time.time() + 3600)
+        self.assertEqual("initial", json.loads(self._new_oauth().auth)["access_token"])
@@ -0,0 +1,50 @@
+import threading
+import unittest
+
+from ytldl.yt.pool import FairExecutor
+
+
+class TestFairExecutor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.executor = FairExecutor(max_workers=1)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def test_submit(self):
+        self.assertEqual(4, self.executor.submit(lambda x: x * 2, 2).result())
+
+    def test_exception(self):
+        future = self.executor.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result)
+
+    def test_round_robin(self):
+        # blocking the only worker, while queues are filled
+        started, release = threading.Event(), threading.Event()
+        blocker = self.executor.submit(lambda: started.set() or release.wait())
+        started.wait()
+
+        order = []
+        a = self.executor.queue("a")
+        b = self.executor.queue("b")
+        futures = [a.submit(order.append, f"a{i}") for i in range(3)]
+        futures += [b.submit(order.append, f"b{i}") for i in range(3)]
+        self.assertEqual({"a": 3, "b": 3}, self.executor.pending())
+
+        release.set()
+        blocker.result()
+        for future in futures:
+            future.result()
+        self.assertEqual(["a0", "b0", "a1", "b1", "a2", "b2"], order)
+
+    def test_shutdown_cancels_pending(self):
+        release = threading.Event()
+        self.executor.submit(release.wait)
+        pending = self.executor.submit(lambda: None)
+        release.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.assertTrue(pending.cancelled() or pending.done())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,15 @@
 import pathlib
 import shutil
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from tests import consts
-from ytldl.yt.postprocessors import FilterPP, FilterPPException, LyricsPP, MetadataPP
+from mutagen.mp4 import MP4
+
+from ytldl.yt.postprocessors import FilterPP, FilterPPException, LyricsPP, MetadataPP, PrefetchPP
+from ytldl.yt.track import Track
 
 
 class TestLyricsPP(unittest.TestCase):
@@ -24,6 +30,141 @@ class TestLyricsPP(unittest.TestCase):
         self.assertFalse(info["lyrics"])
 
 
+class FakeYT:
+    def __init__(self):
+        self.calls = []
+
+    def get_watch_playlist(self, video_id: str) -> dict:
+        self.calls.append("get_watch_playlist")
+        return dict(lyrics="lyrics_id")
+
+    def get_lyrics(self, browse_id: str) -> dict:
+        self.calls.append("get_lyrics")
+        return dict(lyrics=f"lyrics of {browse_id}")
+
+
+class TestLyricsPPWithTrack(unittest.TestCase):
+    def test_without_track(self):
+        yt = FakeYT()
+        _, info = LyricsPP(yt=yt).run(dict(id="id"))
+        self.assertEqual("lyrics of lyrics_id", info["lyrics"])
+        self.assertEqual(["get_watch_playlist", "get_lyrics"], yt.calls)
+
+    def test_with_track_lyrics_id(self):
+        yt = FakeYT()
+        track = Track("id", lyrics_browse_id="known_id")
+        _, info = LyricsPP(yt=yt, track=track).run(dict(id="id"))
+        self.assertEqual("lyrics of known_id", info["lyrics"])
+        self.assertEqual(["get_lyrics"], yt.calls)
+
+    def test_shared_client_is_serialised(self):
+        yt = OverlapDetectingYT()
+        lock = threading.Lock()
+        with ThreadPoolExecutor(4) as executor:
+            lyrics = list(executor.map(lambda i: LyricsPP(yt=yt, lock=lock).fetch(f"id{i}"), range(8)))
+        self.assertEqual(["lyrics of lyrics_id"] * 8, lyrics)
+        self.assertEqual(16, len(yt.calls))
+        self.assertFalse(yt.overlapped)
+
+
+class OverlapDetectingYT(FakeYT):
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.overlapped = False
+
+    def _call(self):
+        self.running += 1
+        self.overlapped |= self.running > 1
+        time.sleep(0.01)
+        self.running -= 1
+
+    def get_watch_playlist(self, video_id: str) -> dict:
+        self._call()
+        return super().get_watch_playlist(video_id)
+
+    def get_lyrics(self, browse_id: str) -> dict:
+        self._call()
+        return super().get_lyrics(browse_id)
+
+
+class TestMetadataPPWithTrack(unittest.TestCase):
+    input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
+    filepath = pathlib.Path("test_data/test_audio_no_tags_track_copy.m4a")
+
+    def setUp(self) -> None:
+        shutil.copyfile(self.input_filepath, self.filepath)
+
+    def tearDown(self) -> None:
+        self.filepath.unlink()
+
+    def test_track_fields_preferred(self):
+        track = Track("id", title="Track title", artists=("A", "B"), album="Album")
+        MetadataPP(track=track).run(dict(artist="info artist", title="info title", filepath=str(self.filepath)))
+        tags = MP4(str(self.filepath)).tags
+        self.assertEqual(["A, B"], tags["©ART"])
+        self.assertEqual(["Track title"], tags["©nam"])
+        self.assertEqual(["Album"], tags["©alb"])
+
+    def test_fallback_to_info(self):
+        MetadataPP(track=Track("id")).run(dict(artist="info artist", title="info title",
+                                               filepath=str(self.filepath)))
+        tags = MP4(str(self.filepath)).tags
+        self.assertEqual(["info artist"], tags["©ART"])
+        self.assertNotIn("©alb", tags)
+
+
+class BlockingYT(FakeYT):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def get_lyrics(self, browse_id: str) -> dict:
+        self.release.wait(timeout=5)
+        return super().get_lyrics(browse_id)
+
+
+class FakeMetadataPP(MetadataPP):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = []
+
+    def get_image_bytes(self, url: str, format: str = "JPEG") -> bytes:
+        self.fetched.append(url)
+        return b""
+
+
+class TestPrefetchPP(unittest.TestCase):
+    input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
+    filepath = pathlib.Path("test_data/test_audio_no_tags_prefetch_copy.m4a")
+
+    def setUp(self) -> None:
+        shutil.copyfile(self.input_filepath, self.filepath)
+        self.executor = ThreadPoolExecutor()
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        self.filepath.unlink()
+
+    def test_prefetch(self):
+        yt = BlockingYT()
+        lyrics_pp = LyricsPP(yt=yt)
+        metadata_pp = FakeMetadataPP(track=Track("id", thumbnail="track_thumbnail"))
+        info = dict(id="id", artist="artist", title="title", thumbnail="info_thumbnail")
+
+        # doesn't wait for lyrics
+        PrefetchPP(self.executor, lyrics_pp, metadata_pp).run(info)
+        self.assertFalse(lyrics_pp.prefetched.done())
+        yt.release.set()
+
+        _, info = lyrics_pp.run(info)
+        self.assertEqual("lyrics of lyrics_id", info["lyrics"])
+        self.assertEqual(["get_watch_playlist", "get_lyrics"], yt.calls)
+
+        metadata_pp.run(dict(info, filepath=str(self.filepath)))
+        self.assertEqual(["info_thumbnail"], metadata_pp.fetched)
+
+
 class TestMetadataPP(unittest.TestCase):
     input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
     filepath = pathlib.Path("test_data/test_audio_no_tags_copy.m4a")
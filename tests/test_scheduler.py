@@ -0,0 +1,49 @@
+import unittest
+
+from ytldl.yt.scheduler import Budget, Source, prioritize
+
+
+class TestPrioritize(unittest.TestCase):
+    def test_prioritize(self):
+        sources = [Source(1, "playlists", "p1"),
+                   Source(0, "playlists", "p2"),
+                   Source(0, "videos", "v1"),
+                   Source(1, "channels", "c1")]
+        extracted = {"p1": ["a", "b"], "p2": ["c", "d", "a"], "v1": ["v1"], "c1": ["e"]}
+        self.assertEqual(["c", "v1", "d", "a", "e", "b"], prioritize(sources, extracted))
+
+    def test_missing_source(self):
+        self.assertEqual([], prioritize([Source(0, "playlists", "p1")], {}))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestBudget(unittest.TestCase):
+    def test_unlimited(self):
+        budget = Budget()
+        budget.start()
+        self.assertFalse(budget.expired())
+        self.assertEqual(["a", "b"], budget.limit(["a", "b"]))
+
+    def test_max_tracks(self):
+        self.assertEqual(["a"], Budget(max_tracks=1).limit(["a", "b"]))
+
+    def test_max_duration(self):
+        clock = FakeClock()
+        budget = Budget(max_duration=10, clock=clock)
+        self.assertFalse(budget.expired())
+        budget.start()
+        clock.now = 9
+        self.assertFalse(budget.expired())
+        clock.now = 10
+        self.assertTrue(budget.expired())
+
+
+if __name__ == '__main__':
+    unittest.main()
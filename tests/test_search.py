@@ -0,0 +1,66 @@
+import os
+import pathlib
+import shutil
+import unittest
+
+from ytldl.metadata.metadata import write_metadata
+from ytldl.yt.search import SearchIndex
+
+
+class TestSearchIndex(unittest.TestCase):
+    input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
+
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_search")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.index = SearchIndex(str(self.dir / "search.db"))
+
+    def tearDown(self) -> None:
+        self.index.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _track(self, video_id: str, metadata: dict) -> pathlib.Path:
+        path = self.dir / f"{metadata.get('artist')} - {metadata.get('title')} [{video_id}].m4a"
+        shutil.copyfile(self.input_filepath, path)
+        write_metadata(str(path), metadata)
+        return path
+
+    def test_add_and_search(self):
+        path = self._track("id1", dict(artist="Back Number", title="Christmas Song", lyrics="snow falls"))
+        self.index.add(path, dict(artist="Back Number", title="Christmas Song", lyrics="snow falls"))
+        self.index.add(self.dir / "other [id2].m4a", dict(artist="Other", title="Song"), mtime=0)
+
+        self.assertEqual(["id1"], [r.video_id for r in self.index.search("back chris")])
+        self.assertEqual(["id1"], [r.video_id for r in self.index.search("snow")])
+        self.assertEqual({"id1", "id2"}, {r.video_id for r in self.index.search("song")})
+        self.assertEqual([], self.index.search('"'))
+        self.assertEqual([], self.index.search(""))
+
+    def test_replace(self):
+        self.index.add(self.dir / "a [id1].m4a", dict(title="old"), mtime=0)
+        self.index.add(self.dir / "a [id1].m4a", dict(title="new"), mtime=0)
+        self.assertEqual([], self.index.search("old"))
+        self.assertEqual(1, len(self.index.search("new")))
+
+    def test_sync(self):
+        first = self._track("id1", dict(artist="first", title="title"))
+        self._track("id2", dict(artist="second", title="title"))
+        self.assertEqual((2, 0), self.index.sync(self.dir, workers=2))
+        self.assertEqual(2, len(self.index.search("title")))
+
+        # nothing changed
+        self.assertEqual((0, 0), self.index.sync(self.dir, workers=2))
+
+        first.unlink()
+        third = self._track("id3", dict(artist="third", title="title"))
+        os.utime(third, (0, 0))
+        self.assertEqual((1, 1), self.index.sync(self.dir, workers=2))
+        self.assertEqual({"id2", "id3"}, {r.video_id for r in self.index.search("title")})
+
+        self.assertEqual((2, 0), self.index.sync(self.dir, workers=2, rebuild=True))
+        self.assertEqual(2, len(self.index.search("title")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import errno
+import os
+import pathlib
+import shutil
+import threading
+import unittest
+from unittest import mock
+
+from yt_dlp import YoutubeDL
+
+from tests.test_transfer import ThrottlingHandler, ThrottlingServer
+from ytldl.yt.download import Downloader
+from ytldl.yt.postprocessors import PublishPP
+from ytldl.yt.staging import Staging
+from ytldl.yt.store import ContentStore
+
+
+class TestStaging(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_staging")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.library = self.dir / "library"
+        self.library.mkdir(parents=True)
+        self.staging = Staging(self.dir / "staging", self.library, sync_every=2)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _stage(self, name: str) -> pathlib.Path:
+        filepath = self.staging.path / name
+        filepath.write_bytes(b"data")
+        return filepath
+
+    def test_publish(self):
+        published = self.staging.publish(self._stage("a [a].m4a"))
+        self.assertEqual(self.library / "a [a].m4a", published)
+        self.assertEqual(b"data", published.read_bytes())
+        self.assertEqual([], list(self.staging.path.iterdir()))
+
+    def test_publish_across_filesystems(self):
+        replace = os.replace
+
+        def cross_device_replace(src, dst):
+            if pathlib.Path(src).parent == self.staging.path:
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            replace(src, dst)
+
+        with mock.patch("os.replace", cross_device_replace):
+            published = self.staging.publish(self._stage("a [a].m4a"))
+        self.assertEqual(b"data", published.read_bytes())
+        # no temporary files are left
+        self.assertEqual([published], list(self.library.iterdir()))
+        self.assertEqual([], list(self.staging.path.iterdir()))
+
+    def test_publish_keeps_library_track(self):
+        (self.library / "a [a].m4a").write_bytes(b"library")
+        published = self.staging.publish(self._stage("a [a].m4a"))
+        self.assertEqual(b"library", published.read_bytes())
+        self.assertEqual([], list(self.staging.path.iterdir()))
+
+    def test_find(self):
+        self.assertIsNone(self.staging.find("a"))
+        published = self.staging.publish(self._stage("artist - a [a].m4a"))
+        self.assertEqual(published, self.staging.find("a"))
+        self.assertIsNone(self.staging.find("b"))
+
+    def test_find_lists_library_once(self):
+        (self.library / "artist - a [a].m4a").write_bytes(b"library")
+        (self.library / "artist - b [b].m4a").write_bytes(b"library")
+        scandir = os.scandir
+        with mock.patch("os.scandir", side_effect=scandir) as listed:
+            self.assertIsNotNone(self.staging.find("a"))
+            self.assertIsNotNone(self.staging.find("b"))
+            self.assertIsNone(self.staging.find("c"))
+            self.assertEqual(1, listed.call_count)
+            # removed since listing
+            (self.library / "artist - a [a].m4a").unlink()
+            self.assertIsNone(self.staging.find("a"))
+            self.staging.refresh()
+            self.assertIsNotNone(self.staging.find("b"))
+            self.assertEqual(2, listed.call_count)
+
+    def test_batched_sync(self):
+        self.staging.publish(self._stage("a [a].m4a"))
+        self.assertEqual(1, self.staging._unsynced)
+        self.staging.publish(self._stage("b [b].m4a"))
+        self.assertEqual(0, self.staging._unsynced)
+        self.staging.publish(self._stage("c [c].m4a"))
+        self.staging.sync()
+        self.assertEqual(0, self.staging._unsynced)
+
+    def test_library_gets_own_subdir(self):
+        other = Staging(self.dir / "staging", self.dir / "other")
+        self.assertNotEqual(self.staging.path, other.path)
+        self.assertEqual(self.staging.path, Staging(self.dir / "staging", self.library).path)
+
+    def test_download(self):
+        server = ThrottlingServer(("127.0.0.1", 0), ThrottlingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/stream?id=x&range=0-{len(ThrottlingHandler.data) - 1}"
+        info = dict(id="x", title="title", ext="m4a", url=url, protocol="http",
+                    extractor="generic", extractor_key="Generic", webpage_url=url)
+        opts = dict(outtmpl="%(id)s.%(ext)s", paths=dict(home=str(self.staging.path)), quiet=True, noprogress=True)
+        try:
+            with YoutubeDL(opts) as ydl:
+                ydl.add_post_processor(PublishPP(self.staging), when="after_move")
+                ydl.process_ie_result(info, download=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(ThrottlingHandler.data, (self.library / "x.m4a").read_bytes())
+        self.assertEqual([], list(self.staging.path.iterdir()))
+
+    def test_downloader_skips_library_track(self):
+        (self.library / "artist - title [a].m4a").write_bytes(b"library")
+        d = Downloader(self.library, yt=object(), staging_dir=self.dir / "staging")
+        with mock.patch("ytldl.yt.download.YoutubeDL", side_effect=AssertionError("track is downloaded again")):
+            self.assertEqual("a", d._download_track("a"))
+        d.close()
+        self.assertEqual(b"library", (self.library / "artist - title [a].m4a").read_bytes())
+
+    def test_store_order(self):
+        store = ContentStore(self.dir / "store")
+        d = Downloader(self.library, yt=object(), staging_dir=self.dir / "staging", store=store)
+        # the same filesystem, store hardlinks published track
+        self.assertFalse(d._store_from_staging)
+        d.close()
+
+        stat = os.stat
+
+        def other_device(path, *args, **kwargs):
+            result = stat(path, *args, **kwargs)
+            if pathlib.Path(path) == store.path:
+                return mock.Mock(st_dev=result.st_dev + 1)
+            return result
+
+        with mock.patch("os.stat", other_device):
+            d = Downloader(self.library, yt=object(), staging_dir=self.dir / "staging", store=store)
+        # store gets staged track, not its copy from library
+        self.assertTrue(d._store_from_staging)
+        d.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
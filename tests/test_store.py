@@ -0,0 +1,107 @@
+import os
+import pathlib
+import shutil
+import threading
+import unittest
+from unittest.mock import patch
+
+from ytldl.util.filename import get_downloaded_video_ids
+from ytldl.yt.store import ContentStore, link_or_copy
+
+
+class TestContentStore(unittest.TestCase):
+    filename = "artist - title [e7u2aPzWmU4].m4a"
+    video_id = "e7u2aPzWmU4"
+
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_store")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.lib1 = self.dir / "lib1"
+        self.lib2 = self.dir / "lib2"
+        self.lib1.mkdir(parents=True)
+        self.lib2.mkdir(parents=True)
+        self.store = ContentStore(self.dir / "store")
+
+        self.downloaded = self.lib1 / self.filename
+        self.downloaded.write_bytes(b"audio")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.store.get(self.video_id))
+        self.assertIsNone(self.store.link_to(self.video_id, self.lib2))
+
+    def test_add_and_link(self):
+        stored = self.store.add(self.video_id, self.downloaded)
+        self.assertEqual(self.filename, stored.name)
+        self.assertEqual(stored, self.store.get(self.video_id))
+
+        linked = self.store.link_to(self.video_id, self.lib2)
+        self.assertEqual(self.lib2 / self.filename, linked)
+        self.assertTrue(os.path.samefile(self.downloaded, linked))
+        self.assertEqual([self.video_id], get_downloaded_video_ids(self.lib2))
+
+    def test_add_twice(self):
+        stored = self.store.add(self.video_id, self.downloaded)
+        other = self.lib2 / "other name [e7u2aPzWmU4].m4a"
+        other.write_bytes(b"other")
+        self.assertEqual(stored, self.store.add(self.video_id, other))
+
+    def test_remove(self):
+        self.store.add(self.video_id, self.downloaded)
+        self.assertTrue(self.store.remove(self.video_id))
+        self.assertIsNone(self.store.get(self.video_id))
+        self.assertIsNone(self.store.link_to(self.video_id, self.lib2))
+        self.assertFalse(self.store.remove(self.video_id))
+
+    def test_case_sensitive_ids(self):
+        self.store.add(self.video_id, self.downloaded)
+        self.assertIsNone(self.store.get(self.video_id.upper()))
+
+    def test_copy_across_filesystems(self):
+        with patch("os.link", side_effect=OSError("cross-device link")):
+            stored = self.store.add(self.video_id, self.downloaded)
+        self.assertFalse(os.path.samefile(self.downloaded, stored))
+        self.assertEqual(b"audio", stored.read_bytes())
+
+    def test_killed_copy_leaves_no_track(self):
+        self.store.add(self.video_id, self.downloaded)
+
+        def killed_copy(src, dst):
+            pathlib.Path(dst).write_bytes(b"au")
+            raise KeyboardInterrupt()
+
+        with patch("ytldl.yt.store.link_or_copy", killed_copy):
+            self.assertRaises(KeyboardInterrupt, self.store.link_to, self.video_id, self.lib2)
+        self.assertEqual([], list(self.lib2.iterdir()))
+        self.assertEqual([], get_downloaded_video_ids(self.lib2))
+
+    def test_add_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def link_and_wait(src, dst):
+            link_or_copy(src, dst)
+            barrier.wait()
+
+        errors = []
+
+        def add():
+            try:
+                self.store.add(self.video_id, self.downloaded)
+            except Exception as e:
+                errors.append(e)
+
+        with patch("ytldl.yt.store.link_or_copy", link_and_wait):
+            threads = [threading.Thread(target=add) for _ in range(2)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual([], errors)
+        self.assertEqual(b"audio", self.store.get(self.video_id).read_bytes())
+        self.assertEqual([self.filename], [f.name for f in self.store.get(self.video_id).parent.iterdir()])
+
+
+if __name__ == '__main__':
+    unittest.main()
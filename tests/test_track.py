@@ -0,0 +1,25 @@
+import unittest
+
+from ytldl.yt.track import Track
+
+
+class TestTrack(unittest.TestCase):
+    def test_from_playlist_item(self):
+        track = Track.from_ytmusic(dict(
+            videoId="bjGppZKiuFE", title="Lost",
+            artists=[dict(name="Guest Who", id="1"), dict(name="Kate Wild", id="2")],
+            album=dict(name="Lost album", id="3"),
+            thumbnails=[dict(url="small", width=60), dict(url="big", width=120)],
+            duration_seconds=178, videoType="MUSIC_VIDEO_TYPE_ATV"))
+        self.assertEqual(Track("bjGppZKiuFE", "Lost", ("Guest Who", "Kate Wild"), "Lost album", 178,
+                               "MUSIC_VIDEO_TYPE_ATV", "big"), track)
+        self.assertEqual("Guest Who, Kate Wild", track.artist)
+
+    def test_from_sparse_item(self):
+        track = Track.from_ytmusic(dict(videoId="id", artists=None, album=None, thumbnail=[dict(url="u")]))
+        self.assertEqual(Track("id", thumbnail="u"), track)
+        self.assertIsNone(track.artist)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import http.server
+import pathlib
+import shutil
+import socketserver
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from yt_dlp import YoutubeDL
+
+from ytldl.yt.postprocessors import TransferPP
+from ytldl.yt.transfer import TransferTuner, split_into_ranges
+
+
+class TestTransferTuner(unittest.TestCase):
+    def test_initial(self):
+        tuner = TransferTuner(max_connections=16, workers=4, min_chunk=100)
+        self.assertEqual(2, tuner.connections())
+        self.assertEqual(100, tuner.chunk_size())
+
+    def test_bounded_by_workers(self):
+        tuner = TransferTuner(max_connections=8, workers=8)
+        self.assertEqual(1, tuner.connections())
+        tuner.record(1, 1000, 1)
+        self.assertEqual(1, tuner.connections())
+
+    def test_climbs_while_throughput_grows(self):
+        tuner = TransferTuner(max_connections=16, workers=2, min_chunk=1, max_chunk=1000, chunk_seconds=1)
+        tuner.record(2, 200, 1)
+        self.assertEqual(3, tuner.connections())
+        tuner.record(3, 300, 1)
+        self.assertEqual(4, tuner.connections())
+        # 4 connections give less than 10% more
+        tuner.record(4, 310, 1)
+        self.assertEqual(3, tuner.connections())
+        self.assertEqual(100, tuner.chunk_size())
+
+    def test_chunk_size_bounds(self):
+        tuner = TransferTuner(min_chunk=10, max_chunk=20, chunk_seconds=1)
+        tuner.record(2, 2, 1)
+        self.assertEqual(10, tuner.chunk_size())
+        tuner.record(2, 10 ** 6, 1)
+        self.assertEqual(20, tuner.chunk_size())
+
+    def test_split_into_ranges(self):
+        fragments = split_into_ranges("http://host/path?a=1&range=0-9", 10, 4)
+        self.assertEqual(["http://host/path?a=1&range=0-3", "http://host/path?a=1&range=4-7",
+                          "http://host/path?a=1&range=8-9"], [f["url"] for f in fragments])
+
+
+class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves data by "range" query param, like YouTube streams, throttling each connection to rate bytes per second.
+    """
+    data = bytes(range(256)) * 1600
+    rate = 400_000
+    block = 16 << 10
+
+    def do_GET(self):
+        start, end = (int(x) for x in parse_qs(urlparse(self.path).query)["range"][0].split("-"))
+        body = self.data[start:end + 1]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), self.block):
+            time.sleep(self.block / self.rate)
+            self.wfile.write(body[i:i + self.block])
+
+    def log_message(self, *args):
+        pass
+
+
+class ThrottlingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class TestTransferPP(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_transfer")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.server = ThrottlingServer(("127.0.0.1", 0), ThrottlingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/stream?id=x"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _download(self, tuner: TransferTuner | None) -> float:
+        size = len(ThrottlingHandler.data)
+        # as YouTube extractor returns audio stream of known size
+        info = dict(id="x", title="title", ext="m4a", url=self.url, protocol="http_dash_segments", filesize=size,
+                    fragments=[dict(url=f"{self.url}&range=0-{size - 1}")],
+                    extractor="generic", extractor_key="Generic", webpage_url=self.url)
+        opts = dict(outtmpl=str(self.dir / "%(id)s.%(ext)s"), quiet=True, noprogress=True, overwrites=True)
+        with YoutubeDL(opts) as ydl:
+            if tuner is not None:
+                transfer_pp = TransferPP(tuner)
+                ydl.add_post_processor(transfer_pp, when="before_dl")
+                ydl.add_progress_hook(transfer_pp.progress_hook)
+            start = time.monotonic()
+            ydl.process_ie_result(info, download=True)
+            elapsed = time.monotonic() - start
+        self.assertEqual(ThrottlingHandler.data, (self.dir / "x.m4a").read_bytes())
+        return elapsed
+
+    def test_faster_than_single_connection(self):
+        single = self._download(None)
+        tuner = TransferTuner(max_connections=4, workers=1, min_chunk=32 << 10)
+        tuned = min(self._download(tuner) for _ in range(2))
+        self.assertLess(tuned * 1.5, single)
+        self.assertTrue(tuner._throughput)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import pathlib
+import shutil
+import unittest
+
+from ytldl.yt.verify import Verifier, check_boxes, verify_file
+
+
+class TestVerifyFile(unittest.TestCase):
+    input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
+
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_verify")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.good = self.dir / "good [id1].m4a"
+        shutil.copyfile(self.input_filepath, self.good)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _truncated(self, name: str) -> pathlib.Path:
+        path = self.dir / name
+        data = self.input_filepath.read_bytes()
+        path.write_bytes(data[:len(data) // 2])
+        return path
+
+    def test_good(self):
+        result = verify_file(str(self.good), expected_duration=1)
+        self.assertTrue(result.ok, result.error)
+        self.assertAlmostEqual(1.14, result.duration, places=2)
+        self.assertEqual("id1", result.video_id)
+
+    def test_truncated(self):
+        result = verify_file(str(self._truncated("bad [id2].m4a")))
+        self.assertFalse(result.ok)
+        self.assertIn("truncated", result.error)
+
+    def test_empty(self):
+        path = self.dir / "empty [id3].m4a"
+        path.touch()
+        self.assertEqual("empty file", verify_file(str(path)).error)
+
+    def test_duration_mismatch(self):
+        self.assertFalse(verify_file(str(self.good), expected_duration=200).ok)
+
+    def test_check_boxes(self):
+        self.assertIn("missing boxes", check_boxes(b"\x00\x00\x00\x08ftyp"))
+        self.assertIn("invalid size", check_boxes(b"\x00\x00\x00\x04ftyp"))
+
+
+class TestVerifier(unittest.TestCase):
+    input_filepath = pathlib.Path("test_data/test_audio_no_tags.m4a")
+
+    def setUp(self) -> None:
+        self.dir = pathlib.Path("tmp/test_verifier")
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+        self.verifier = Verifier(str(self.dir / "verify.db"))
+
+    def tearDown(self) -> None:
+        self.verifier.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_incremental(self):
+        for video_id in ("id1", "id2"):
+            shutil.copyfile(self.input_filepath, self.dir / f"track [{video_id}].m4a")
+        results = self.verifier.verify(self.dir, workers=2)
+        self.assertEqual([True, True], [r.ok for r in results])
+
+        # corrupting file without changing its size and mtime: it's not verified again
+        path = self.dir / "track [id1].m4a"
+        stat = path.stat()
+        with open(path, "r+b") as f:
+            f.write(b"\xff" * 8)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertTrue(all(r.ok for r in self.verifier.verify(self.dir, workers=2)))
+
+        results = {r.video_id: r for r in self.verifier.verify(self.dir, workers=2, full=True)}
+        self.assertFalse(results["id1"].ok)
+        self.assertTrue(results["id2"].ok)
+
+        (self.dir / "track [id2].m4a").unlink()
+        self.assertEqual(["id1"], [r.video_id for r in self.verifier.verify(self.dir, workers=2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,8 @@ import argparse
 import os
 from pathlib import Path
 
-from ytldl.yt.cache import SqliteCache
-from ytldl.yt.download import Downloader, LibDownloader
-from ytldl.yt.oauth import Oauth
+# Heavy modules (yt_dlp, ytmusicapi, PIL, ...) are imported lazily inside subcommands,
+# so that --help and lightweight subcommands start fast.
 
 
 def parse_args() -> argparse.Namespace:
@@ -17,10 +16,43 @@ def parse_args() -> argparse.Namespace:
         description="Program to download songs and playlists from youtube.")
     action_parsers = parser.add_subparsers(dest="action")
     action_parsers.required = True
-    action_parsers.choices = ["dl", "lib"]
+    action_parsers.choices = ["dl", "lib", "daemon", "ctl"]
+
+    # options, shared by several subcommands
+    store_options = argparse.ArgumentParser(add_help=False)
+    store_options.add_argument(
+        "--store", help="Directory of content store, shared between libraries, to link tracks from", default=None)
+
+    download_options = argparse.ArgumentParser(add_help=False, parents=[store_options])
+    download_options.add_argument(
+        "--staging", help="Local directory (e.g. on tmpfs or SSD), where tracks are downloaded and tagged "
+                          "before they are moved into library", default=None)
+    download_options.add_argument(
+        "--bandwidth", help="Limits total download rate: 2M or by time of day, e.g. 08:00=500K,23:00=unlimited",
+        default=None)
+
+    connections_options = argparse.ArgumentParser(add_help=False)
+    connections_options.add_argument(
+        "--max-connections", help="Downloads tracks by chunks over several connections, "
+                                  "keeping total connections under this count", default=None, type=int)
+
+    drain_options = argparse.ArgumentParser(add_help=False)
+    drain_options.add_argument(
+        "--drain-timeout", help="On SIGINT/SIGTERM, seconds given to running downloads before aborting them",
+        default=10, type=float)
+
+    max_bytes_options = argparse.ArgumentParser(add_help=False)
+    max_bytes_options.add_argument(
+        "--max-bytes", help="Downloads at most this many bytes per run, e.g. 2G, tracks are sized before download",
+        default=None)
+
+    events_options = argparse.ArgumentParser(add_help=False)
+    events_options.add_argument(
+        "--events", help="Writes pipeline events as json lines to this file, - for stdout "
+                         "(other output goes to stderr then)", default=None)
 
     # DL
-    dl_parser = action_parsers.add_parser("dl")
+    dl_parser = action_parsers.add_parser("dl", parents=[download_options, connections_options, events_options])
     dl_parser.add_argument(
         "-o", "--dir", help="output directory", required=True)
     group = dl_parser.add_argument_group()
@@ -39,19 +71,106 @@ def parse_args() -> argparse.Namespace:
 
     lib_action_parsers = lib_parser.add_subparsers(dest="lib_action")
     lib_action_parsers.required = True
-    lib_action_parsers.choices = ["update", "fix"]
+    lib_action_parsers.choices = ["update", "fix", "enqueue", "worker", "search", "verify", "cache"]
 
     lib_action_update_parser = lib_action_parsers.add_parser(
-        "update")
+        "update", parents=[download_options, connections_options, drain_options, max_bytes_options,
+                          events_options])
     lib_action_update_parser.add_argument(
         "-n", "--limit", help="Limit of downloaded tracks per playlist or channel", default=50, type=int)
     lib_action_update_parser.add_argument(
         "--reset_oauth", help="Resets oauth info and forces user to redo authentication", action="store_true")
     lib_action_update_parser.add_argument(
         "-p", "--password", help="Provides password for storing oauth data locally", default=None, type=str)
+    lib_action_update_parser.add_argument(
+        "--count-new", help="Counts limit only in new tracks, paging playlists until they are found",
+        action="store_true")
+    lib_action_update_parser.add_argument(
+        "--stop-after-known", help="With --count-new, stops paging playlist after this many known tracks in a row",
+        default=None, type=int)
+    lib_action_update_parser.add_argument(
+        "--max-duration", help="Stops starting new downloads after this many seconds", default=None, type=float)
+    lib_action_update_parser.add_argument(
+        "--max-tracks", help="Downloads at most this many tracks, the most valuable first", default=None, type=int)
 
     lib_action_parsers.add_parser("fix", description="Try to fix lib. For now, fixes only downloaded column")
 
+    lib_action_enqueue_parser = lib_action_parsers.add_parser(
+        "enqueue", description="Extracts uncached tracks into job queue, that is processed by workers")
+    lib_action_enqueue_parser.add_argument(
+        "-n", "--limit", help="Limit of downloaded tracks per playlist or channel", default=50, type=int)
+    lib_action_enqueue_parser.add_argument(
+        "-p", "--password", help="Provides password for storing oauth data locally", default=None, type=str)
+    lib_action_enqueue_parser.add_argument(
+        "-q", "--queue", help="Path to job queue db, .ytldl/jobs.db by default", default=None)
+
+    lib_action_worker_parser = lib_action_parsers.add_parser(
+        "worker", description="Downloads tracks from job queue, several workers can share one queue",
+        parents=[download_options, drain_options])
+    lib_action_worker_parser.add_argument(
+        "-q", "--queue", help="Path to job queue db, .ytldl/jobs.db by default", default=None)
+    lib_action_worker_parser.add_argument(
+        "--lease", help="Seconds, after which job of dead worker is leased again", default=600, type=float)
+    lib_action_worker_parser.add_argument(
+        "--batch", help="Jobs leased at once", default=4, type=int)
+    lib_action_worker_parser.add_argument(
+        "-w", "--workers", help="Jobs downloaded at once", default=4, type=int)
+    lib_action_worker_parser.add_argument(
+        "--once", help="Exit when queue is empty", action="store_true")
+
+    lib_action_search_parser = lib_action_parsers.add_parser(
+        "search", description="Searches downloaded tracks by artist, title, album and lyrics")
+    lib_action_search_parser.add_argument(
+        "query", help="Words, that found tracks should start with", nargs="*", default=[])
+    lib_action_search_parser.add_argument(
+        "-n", "--limit", help="Max count of found tracks", default=20, type=int)
+    lib_action_search_parser.add_argument(
+        "--sync", help="Indexes tracks, added or removed by hand, before searching", action="store_true")
+    lib_action_search_parser.add_argument(
+        "--rebuild", help="Reindexes all tracks before searching", action="store_true")
+    lib_action_search_parser.add_argument(
+        "-j", "--jobs", help="Processes, reading tags on sync", default=None, type=int)
+
+    lib_action_verify_parser = lib_action_parsers.add_parser(
+        "verify", description="Checks, that downloaded tracks are complete, and marks broken ones for re-download",
+        parents=[store_options])
+    lib_action_verify_parser.add_argument(
+        "-j", "--jobs", help="Processes, verifying tracks", default=None, type=int)
+    lib_action_verify_parser.add_argument(
+        "--full", help="Verifies also tracks, that didn't change since previous verification", action="store_true")
+    lib_action_verify_parser.add_argument(
+        "--keep", help="Only reports broken tracks, without marking them for re-download", action="store_true")
+
+    lib_action_cache_parser = lib_action_parsers.add_parser(
+        "cache", description="Migrates cache of downloaded tracks to another backend")
+    lib_action_cache_parser.add_argument(
+        "backend", help="sqlite (.ytldl/ytldl.db) or dbm (.ytldl/ytldl.dbm)", choices=["sqlite", "dbm"])
+
+    # DAEMON
+    daemon_parser = action_parsers.add_parser(
+        "daemon", description="Periodically updates several libraries, sharing one download pool",
+        parents=[download_options, connections_options, drain_options, max_bytes_options])
+    daemon_parser.add_argument(
+        "-o", "--dir", help="library directory, can be repeated", action="append", required=True)
+    daemon_parser.add_argument(
+        "-n", "--limit", help="Limit of downloaded tracks per playlist or channel", default=50, type=int)
+    daemon_parser.add_argument(
+        "-i", "--interval", help="Seconds between updates of each library", default=6 * 60 * 60, type=float)
+    daemon_parser.add_argument(
+        "-w", "--workers", help="Download workers, shared by all libraries", default=4, type=int)
+    daemon_parser.add_argument(
+        "--port", help="Port of local control socket", default=None, type=int)
+    daemon_parser.add_argument(
+        "-p", "--password", help="Provides password for storing oauth data locally", default=None, type=str)
+
+    # CTL
+    ctl_parser = action_parsers.add_parser("ctl", description="Controls running daemon")
+    ctl_parser.add_argument("ctl_action", choices=["status", "update"])
+    ctl_parser.add_argument(
+        "-o", "--dir", help="library directory to update, all libraries if not provided", default=None)
+    ctl_parser.add_argument(
+        "--port", help="Port of local control socket", default=None, type=int)
+
     res = parser.parse_args()
 
     res.debug = "DEBUG" in os.environ
@@ -59,46 +178,313 @@ def parse_args() -> argparse.Namespace:
     return res
 
 
+def make_store(path: str | None):
+    if path is None:
+        return None
+
+    from ytldl.yt.store import ContentStore
+    return ContentStore(path)
+
+
+def take_stdout():
+    """
+    Returns file on stdout and redirects stdout (fd 1, so also output of yt-dlp and subprocesses) to stderr,
+    so print() output doesn't mix with json lines of "--events -".
+    """
+    import sys
+
+    sys.stdout.flush()
+    file = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return file
+
+
+def write_events(path, events):
+    """
+    Subscribes json lines sink with progress stats to events.
+    path is path of file or file, see take_stdout().
+    Returns function, that flushes events and closes the file.
+    """
+    if path is None:
+        return events.close
+
+    from ytldl.yt.events import JsonLinesSink, ProgressTracker
+
+    file = open(path, "a", encoding="utf-8") if isinstance(path, str) else path
+    tracker = ProgressTracker()
+    events.subscribe(tracker)
+    events.subscribe(JsonLinesSink(file, tracker))
+
+    def close():
+        events.close()
+        file.close()
+
+    return close
+
+
+def make_rate_limiter(bandwidth: str | None):
+    if bandwidth is None:
+        return None
+
+    from ytldl.yt.bandwidth import RateLimiter, RateSchedule
+    return RateLimiter(RateSchedule.parse(bandwidth))
+
+
+def make_transfer_tuner(max_connections: int | None, workers: int | None = None):
+    if max_connections is None:
+        return None
+
+    from ytldl.yt.transfer import TransferTuner
+    return TransferTuner(max_connections, workers=workers)
+
+
 def main():
     args = parse_args()
+    if getattr(args, "events", None) == "-":
+        # stdout is taken before anything is printed
+        args.events = take_stdout()
 
     match args.action:
         case 'dl':
+            from ytldl.yt.download import Downloader
+
             cwd_dir = Path(args.dir)
-            d = Downloader(cwd_dir, debug=args.debug)
+            d = Downloader(cwd_dir, debug=args.debug, store=make_store(args.store), staging_dir=args.staging,
+                           transfer_tuner=make_transfer_tuner(args.max_connections),
+                           rate_limiter=make_rate_limiter(args.bandwidth))
+            close_events = write_events(args.events, d.events)
             d.download(videos=args.v, playlists=args.l, channels=args.c)
+            d.close()
+            close_events()
 
         case 'lib':
             cwd_dir = Path(args.dir)
             ytldl_dir = cwd_dir / ".ytldl"
             ytldl_dir.mkdir(parents=True, exist_ok=True)
-            sqlite_path = cwd_dir / ".ytldl" / "ytldl.db"
             oauth_path = cwd_dir / ".ytldl" / "oauth"
             salt_path = cwd_dir / ".ytldl" / "salt"
+            jobs_path = cwd_dir / ".ytldl" / "jobs.db"
+            info_cache_path = cwd_dir / ".ytldl" / "info.db"
+            search_path = cwd_dir / ".ytldl" / "search.db"
+            channels_path = cwd_dir / ".ytldl" / "channels.db"
+            verify_path = cwd_dir / ".ytldl" / "verify.db"
 
             match args.lib_action:
                 case 'update':
+                    from ytldl.yt.cache import open_cache
+                    from ytldl.yt.channelcache import ChannelCache
+                    from ytldl.yt.download import LibDownloader
+                    from ytldl.yt.infocache import InfoCache
+                    from ytldl.yt.oauth import Oauth
+                    from ytldl.yt.bandwidth import parse_size
+                    from ytldl.yt.scheduler import Budget
+                    from ytldl.yt.search import SearchIndex
+
                     if args.reset_oauth:
                         oauth_path.unlink(missing_ok=True)
                         salt_path.unlink(missing_ok=True)
 
                     oauth = Oauth(oauth_path, salt_path, password=args.password)
-                    d = LibDownloader(cwd_dir, oauth, debug=args.debug,
-                                      cache=SqliteCache(str(sqlite_path), batch_size=10))
-                    d.lib_update(limit=args.limit)
+                    d = LibDownloader(cwd_dir, oauth, debug=args.debug, store=make_store(args.store),
+                                      staging_dir=args.staging,
+                                      cache=open_cache(ytldl_dir, batch_size=10),
+                                      info_cache=InfoCache(str(info_cache_path)),
+                                      search_index=SearchIndex(str(search_path)),
+                                      channel_cache=ChannelCache(str(channels_path)),
+                                      transfer_tuner=make_transfer_tuner(args.max_connections),
+                                      rate_limiter=make_rate_limiter(args.bandwidth),
+                                      drain_timeout=args.drain_timeout,
+                                      count_new=args.count_new, stop_after_known=args.stop_after_known)
+                    close_events = write_events(args.events, d.events)
+                    budget = Budget(max_duration=args.max_duration, max_tracks=args.max_tracks,
+                                    max_bytes=parse_size(args.max_bytes) if args.max_bytes else None)
+                    d.lib_update(limit=args.limit, budget=budget)
+                    d.close()
+                    close_events()
 
                 case 'fix':
-                    d = Downloader(cwd_dir)
-                    video_ids = d.get_downloaded_video_ids()
+                    from ytldl.util.filename import get_downloaded_video_ids
+                    from ytldl.yt.cache import open_cache
+
+                    video_ids = get_downloaded_video_ids(cwd_dir)
                     print(f"Extracted {len(video_ids)} videoIds from {cwd_dir}")
-                    cache = SqliteCache(str(sqlite_path))
+                    cache = open_cache(ytldl_dir)
                     cache.fix_downloaded_column(video_ids)
-                    print(f"Downloaded column fixed for {sqlite_path}")
+                    print(f"Downloaded column fixed for {cache.path}")
 
                     uncached = cache.filter_uncached(video_ids)
                     uncached_str = "\n".join(uncached)
                     print(f"Warning: you have {len(uncached)} uncached songs:\n{uncached_str}")
 
+                case 'enqueue':
+                    from ytldl.yt.cache import open_cache
+                    from ytldl.yt.download import LibDownloader
+                    from ytldl.yt.jobs import JobQueue
+                    from ytldl.yt.oauth import Oauth
+
+                    oauth = Oauth(oauth_path, salt_path, password=args.password)
+                    queue = JobQueue(args.queue or str(jobs_path))
+                    d = LibDownloader(cwd_dir, oauth, cache=open_cache(ytldl_dir))
+                    d.lib_enqueue(queue, limit=args.limit)
+                    d.close()
+                    print(f"Queue: {queue.counts()}")
+
+                case 'worker':
+                    import signal
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    from ytldl.yt.cache import open_cache, require_shared_cache
+                    from ytldl.yt.download import Downloader
+                    from ytldl.yt.infocache import InfoCache
+                    from ytldl.yt.jobs import JobQueue, JobWorker
+                    from ytldl.yt.search import SearchIndex
+
+                    require_shared_cache(ytldl_dir)
+                    executor = ThreadPoolExecutor(args.workers)
+                    d = Downloader(cwd_dir, debug=args.debug, store=make_store(args.store), staging_dir=args.staging,
+                                   executor=executor,
+                                   info_cache=InfoCache(str(info_cache_path)),
+                                   search_index=SearchIndex(str(search_path)),
+                                   rate_limiter=make_rate_limiter(args.bandwidth),
+                                   drain_timeout=args.drain_timeout)
+                    queue = JobQueue(args.queue or str(jobs_path), lease_seconds=args.lease)
+                    cache = open_cache(ytldl_dir, backup=False)
+                    worker = JobWorker(queue, cache, d._download_track, batch_size=args.batch, executor=executor)
+
+                    def stop(*a):
+                        worker.stop()
+                        d.stop()
+
+                    signal.signal(signal.SIGINT, stop)
+                    signal.signal(signal.SIGTERM, stop)
+                    processed = worker.run(stop_when_empty=args.once)
+                    executor.shutdown()
+                    d.sync()
+                    d.close()
+                    cache.close()
+                    print(f"Processed {processed} jobs, queue: {queue.counts()}")
+
+                case 'search':
+                    from ytldl.yt.search import SearchIndex
+
+                    index = SearchIndex(str(search_path))
+                    if args.sync or args.rebuild:
+                        indexed, removed = index.sync(cwd_dir, workers=args.jobs, rebuild=args.rebuild)
+                        print(f"Indexed {indexed} tracks, removed {removed} tracks")
+                    for result in index.search(" ".join(args.query), limit=args.limit):
+                        print(f"{result.artist} - {result.title} [{result.video_id}]: {cwd_dir / result.filename}")
+                    index.close()
+
+                case 'cache':
+                    import sys
+
+                    from ytldl.yt.cache import cache_backend, migrate_library_cache
+
+                    current = cache_backend(ytldl_dir)
+                    if current == args.backend:
+                        print(f"Cache is already {current}")
+                    else:
+                        try:
+                            migrated = migrate_library_cache(ytldl_dir, args.backend)
+                        except RuntimeError as e:
+                            # python without gdbm
+                            print(e, file=sys.stderr)
+                            sys.exit(1)
+                        print(f"Migrated {migrated} items from {current} to {args.backend}")
+
+                case 'verify':
+                    from ytldl.yt.cache import open_cache
+                    from ytldl.yt.verify import Verifier
+
+                    expected_durations = {}
+                    if info_cache_path.exists():
+                        from ytldl.util.filename import get_downloaded_video_ids
+                        from ytldl.yt.infocache import InfoCache
+
+                        info_cache = InfoCache(str(info_cache_path))
+                        for video_id in get_downloaded_video_ids(cwd_dir):
+                            metadata = info_cache.get_metadata(video_id)
+                            if metadata and metadata.get("duration"):
+                                expected_durations[video_id] = metadata["duration"]
+                        info_cache.close()
+
+                    verifier = Verifier(str(verify_path))
+                    results = verifier.verify(cwd_dir, expected_durations, workers=args.jobs, full=args.full)
+                    verifier.close()
+                    broken = [result for result in results if not result.ok]
+                    for result in broken:
+                        print(f"broken {result.filename}: {result.error}")
+                    print(f"Verified {len(results)} tracks, {len(broken)} are broken")
+
+                    if broken and not args.keep:
+                        video_ids = [result.video_id for result in broken]
+                        cache = open_cache(ytldl_dir)
+                        cache.remove_items(video_ids)
+                        cache.close()
+                        # yt-dlp skips existing files, so broken ones are moved out of the way
+                        for result in broken:
+                            path = cwd_dir / result.filename
+                            path.replace(path.with_name(path.name + ".broken"))
+                        # broken tracks shouldn't be linked from store again
+                        store = make_store(args.store)
+                        if store is not None:
+                            for video_id in video_ids:
+                                store.remove(video_id)
+                        if search_path.exists():
+                            from ytldl.yt.search import SearchIndex
+
+                            search_index = SearchIndex(str(search_path))
+                            for result in broken:
+                                search_index.remove(result.filename)
+                            search_index.close()
+                        if jobs_path.exists():
+                            from ytldl.yt.jobs import JobQueue
+
+                            # finished jobs are returned to queue, so workers download tracks again
+                            queue = JobQueue(str(jobs_path))
+                            queue.put(video_ids)
+                            queue.close()
+                        print(f"Marked {len(broken)} tracks for re-download")
+
+        case 'daemon':
+            from ytldl.yt.bandwidth import parse_size
+            from ytldl.yt.cache import require_shared_cache
+            from ytldl.yt.daemon import DEFAULT_PORT, Daemon, Library
+            from ytldl.yt.oauth import Oauth
+
+            store = make_store(args.store)
+            # shared by libraries, as they share download workers
+            transfer_tuner = make_transfer_tuner(args.max_connections, workers=args.workers)
+            rate_limiter = make_rate_limiter(args.bandwidth)
+            max_bytes = parse_size(args.max_bytes) if args.max_bytes else None
+            libraries = []
+            for lib_dir in args.dir:
+                ytldl_dir = Path(lib_dir) / ".ytldl"
+                ytldl_dir.mkdir(parents=True, exist_ok=True)
+                require_shared_cache(ytldl_dir)
+                print(f"Setting up oauth for {lib_dir}")
+                oauth = Oauth(ytldl_dir / "oauth", ytldl_dir / "salt", password=args.password)
+                # finishing interactive oauth setup, before libraries go to background threads
+                _ = oauth.auth
+                libraries.append(Library(lib_dir, oauth, limit=args.limit, interval=args.interval,
+                                         debug=args.debug, store=store, transfer_tuner=transfer_tuner,
+                                         staging_dir=args.staging, rate_limiter=rate_limiter,
+                                         max_bytes=max_bytes))
+
+            daemon = Daemon(libraries, workers=args.workers, port=args.port or DEFAULT_PORT,
+                            drain_timeout=args.drain_timeout)
+            daemon.serve_forever()
+
+        case 'ctl':
+            import json
+
+            from ytldl.yt.daemon import DEFAULT_PORT, send_command
+
+            request = dict(cmd=args.ctl_action)
+            if args.dir is not None:
+                request["dir"] = str(Path(args.dir))
+            print(json.dumps(send_command(request, port=args.port or DEFAULT_PORT), indent="    "))
+
 
 if __name__ == "__main__":
     main()
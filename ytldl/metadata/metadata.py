@@ -16,6 +16,8 @@ def write_metadata(filepath: str, metadata: dict):
             file.tags["©ART"] = metadata["artist"]
         if "title" in metadata:
             file.tags["©nam"] = metadata["title"]
+        if "album" in metadata:
+            file.tags["©alb"] = metadata["album"]
         if "lyrics" in metadata:
             file.tags["©lyr"] = metadata["lyrics"]
         if "url" in metadata:
@@ -28,3 +30,23 @@ def write_metadata(filepath: str, metadata: dict):
         raise UnknownFileType()
 
     file.save()
+
+
+def read_metadata(filepath: str) -> dict:
+    """
+    Reads text metadata, written by write_metadata: artist, title, album, lyrics, url.
+    Missing tags are omitted.
+    """
+    file: mutagen.FileType = mutagen.File(filepath)
+    if not isinstance(file, MP4):
+        raise UnknownFileType()
+
+    metadata = {}
+    if file.tags is None:
+        return metadata
+    for key, tag in (("artist", "©ART"), ("title", "©nam"), ("album", "©alb"), ("lyrics", "©lyr")):
+        if tag in file.tags:
+            metadata[key] = "\n".join(file.tags[tag])
+    if "----:com.apple.iTunes:WWW" in file.tags:
+        metadata["url"] = bytes(file.tags["----:com.apple.iTunes:WWW"][0]).decode("utf-8")
+    return metadata
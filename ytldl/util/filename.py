@@ -0,0 +1,28 @@
+import os
+import re
+from os import PathLike
+
+# for parsing filename
+pattern = re.compile(r".*\[(.+?)\].m4a$")
+
+
+# can return None
+def extract_video_id(filename: str) -> str | None:
+    search = pattern.search(filename)
+    if search is None:
+        return None
+    try:
+        return search.group(1)
+    except IndexError:
+        return None
+
+
+def get_downloaded_video_ids(download_dir: PathLike) -> list:
+    """
+    Gets all music filenames from download_dir and parses videoid from it.
+    """
+    files: list[str] = os.listdir(download_dir)
+
+    video_ids = [video_id for file in files if
+                 (video_id := extract_video_id(file)) is not None]
+    return video_ids
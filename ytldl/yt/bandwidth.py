@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from typing import Callable
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses size like "500K", "2M" or "1.5G" into bytes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*", size, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"invalid size: {size!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+class RateSchedule:
+    """
+    Byte rate by time of day.
+
+    Profiles are (minute of day, rate) pairs: each rate applies from its minute until the next profile's one,
+    the last rate continues after midnight until the first profile. Rate None means unlimited.
+    """
+
+    def __init__(self, profiles: list[tuple[int, float | None]]):
+        if not profiles:
+            raise ValueError("no rate profiles")
+        self.profiles = sorted(profiles)
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateSchedule":
+        """
+        Parses "2M" (all day) or "08:00=500K,23:00=unlimited" (by time of day).
+        Rate 0 and "unlimited" mean no limit.
+        """
+        profiles = []
+        for part in spec.split(","):
+            if "=" in part:
+                at, rate = part.split("=", 1)
+                hours, minutes = (int(x) for x in at.strip().split(":"))
+                if not (0 <= hours < 24 and 0 <= minutes < 60):
+                    raise ValueError(f"invalid time: {at!r}")
+                minute = hours * 60 + minutes
+            else:
+                minute, rate = 0, part
+            rate = rate.strip()
+            limit = None if rate.lower() == "unlimited" else parse_size(rate) or None
+            profiles.append((minute, limit))
+        return cls(profiles)
+
+    def rate(self, t: float) -> float | None:
+        """
+        Returns rate at local time t (seconds since epoch).
+        """
+        local = time.localtime(t)
+        minute = local.tm_hour * 60 + local.tm_min
+        current = self.profiles[-1][1]
+        for start, rate in self.profiles:
+            if start > minute:
+                break
+            current = rate
+        return current
+
+
+class RateLimiter:
+    """
+    Global byte rate budget, shared by all downloads (and downloaders) of process.
+
+    Downloads report received bytes by progress_hook, that sleeps in download thread,
+    while downloads together are ahead of the scheduled rate. Bytes, not used within burst seconds, are lost.
+    """
+
+    def __init__(self, schedule: RateSchedule, burst: float = 1,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.schedule = schedule
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # bytes, that can be received at once, negative, when downloads are ahead of rate
+        self._available = 0.0
+        self._updated: float | None = None
+        # file -> bytes, reported by download
+        self._downloaded: dict[str, int] = {}
+
+    def consume(self, size: int):
+        """
+        Accounts size received bytes, sleeps until they fit into rate.
+        """
+        with self._lock:
+            now = self._clock()
+            rate = self.schedule.rate(now)
+            if rate is None:
+                self._available = 0.0
+                self._updated = now
+                return
+            if self._updated is not None:
+                self._available = min(rate * self.burst, self._available + (now - self._updated) * rate)
+            self._updated = now
+            self._available -= size
+            wait = -self._available / rate
+        if wait > 0:
+            self._sleep(wait)
+
+    def progress_hook(self, d: dict):
+        """
+        yt-dlp progress hook.
+        """
+        key = d.get("tmpfilename") or d.get("filename") or ""
+        if d.get("status") != "downloading":
+            with self._lock:
+                self._downloaded.pop(key, None)
+            return
+        downloaded = d.get("downloaded_bytes") or 0
+        with self._lock:
+            previous = self._downloaded.get(key)
+            self._downloaded[key] = max(downloaded, previous or 0)
+            # the first report is a baseline, resumed download reports bytes of .part file
+            if previous is None or downloaded <= previous:
+                return
+            delta = downloaded - previous
+        self.consume(delta)
@@ -1,9 +1,13 @@
 import datetime
+import dbm
 import pathlib
+import re
 import shutil
 import sqlite3
+import threading
 from abc import ABCMeta, abstractmethod
-from typing import Iterable
+from os import PathLike
+from typing import Iterable, Iterator
 
 
 class Cache(metaclass=ABCMeta):
@@ -28,6 +32,13 @@ class Cache(metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def remove_items(self, items: Iterable):
+        """
+        Should uncache items, so they are downloaded again.
+        """
+        pass
+
     @abstractmethod
     def commit(self):
         """
@@ -56,6 +67,9 @@ class MemoryCache(Cache):
     def add_discarded_items(self, items: Iterable):
         self.cache.update(items)
 
+    def remove_items(self, items: Iterable):
+        self.cache.difference_update(items)
+
     def commit(self):
         super().commit()
 
@@ -64,9 +78,10 @@ class MemoryCache(Cache):
 
 
 class SqliteCache(Cache):
-    def __init__(self, path: str, batch_size: int = 0):
+    def __init__(self, path: str, batch_size: int = 0, backup: bool = True):
         """
         batch_size = 0 means, that add_items() will write items immediatly.
+        backup = False disables backup on open, e.g. for short-lived workers.
         """
         self.batch_size = batch_size
 
@@ -76,12 +91,15 @@ class SqliteCache(Cache):
         self.path = pathlib.Path(path)
         path_existed = self.path.exists()
 
-        self.con = sqlite3.connect(path)
+        # connection can be used from several threads (e.g. by Extractor), access is guarded by lock
+        self._lock = threading.RLock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
         if not path_existed:
             self._create_v1()
         self._try_migrate()
 
-        self._make_backup(self.path)
+        if backup:
+            self._make_backup(self.path)
 
         self.cur = self.con.cursor()
 
@@ -90,30 +108,41 @@ class SqliteCache(Cache):
         Provided with list of downloaded items (e.g. videoId strings),
         it fixes downloaded column for all items.
         """
-        self.con.execute('update items set downloaded = false;')
-        self.con.executemany(
-            'update items set downloaded = true where item = ?;',
-            [[item] for item in downloaded_items])
-        self.con.commit()
+        with self._lock:
+            self.con.execute('update items set downloaded = false;')
+            self.con.executemany(
+                'update items set downloaded = true where item = ?;',
+                [[item] for item in downloaded_items])
+            self.con.commit()
 
     def filter_uncached(self, items: Iterable) -> set:
         items = list(items)
         in_str = ', '.join(["?"] * len(items))
-        exec = self.cur.execute(
-            f'SELECT item FROM items WHERE item IN ({in_str});', items)
-        cached = {item[0] for item in exec.fetchall()}
+        with self._lock:
+            exec = self.cur.execute(
+                f'SELECT item FROM items WHERE item IN ({in_str});', items)
+            cached = {item[0] for item in exec.fetchall()}
         uncached = set(items).difference(cached)
         return uncached
 
     def add_items(self, items: Iterable):
         # downloaded = False
-        self.batch.extend([(item, True) for item in items])
-        self._try_batch_commit()
+        with self._lock:
+            self.batch.extend([(item, True) for item in items])
+            self._try_batch_commit()
 
     def add_discarded_items(self, items: Iterable):
         # downloaded = True
-        self.batch.extend([(item, False) for item in items])
-        self._try_batch_commit()
+        with self._lock:
+            self.batch.extend([(item, False) for item in items])
+            self._try_batch_commit()
+
+    def remove_items(self, items: Iterable):
+        items = set(items)
+        with self._lock:
+            self.batch = [item for item in self.batch if item[0] not in items]
+            self.con.executemany('DELETE FROM "items" WHERE "item" = ?;', [[item] for item in items])
+            self.con.commit()
 
     def _try_batch_commit(self):
         exceeds_batch_size = self.batch_size != 0 and len(
@@ -126,19 +155,39 @@ class SqliteCache(Cache):
         """
         adds items in batch and clears it
         """
-        print(f"inserting {len(self.batch)} items into db")
-        if len(self.batch) == 0:
-            return
+        with self._lock:
+            print(f"inserting {len(self.batch)} items into db")
+            if len(self.batch) == 0:
+                return
+
+            self.cur.executemany(
+                'INSERT OR IGNORE INTO "items" ("item", "time", "downloaded") VALUES (?, CURRENT_TIMESTAMP, ?);',
+                [item for item in self.batch])
+            self.con.commit()
+            self.batch = []
 
-        self.cur.executemany(
-            'INSERT OR IGNORE INTO "items" ("item", "time", "downloaded") VALUES (?, CURRENT_TIMESTAMP, ?);',
-            [item for item in self.batch])
-        self.con.commit()
-        self.batch = []
+    def export_items(self) -> Iterator[tuple[str, str, bool]]:
+        """
+        Yields committed (item, time, downloaded), see migrate().
+        """
+        with self._lock:
+            rows = self.con.execute('SELECT "item", "time", "downloaded" FROM "items";').fetchall()
+        for item, time, downloaded in rows:
+            yield item, time, bool(downloaded)
+
+    def import_items(self, rows: Iterable[tuple[str, str, bool]]):
+        """
+        Inserts (item, time, downloaded), keeping already cached items.
+        """
+        with self._lock:
+            self.con.executemany(
+                'INSERT OR IGNORE INTO "items" ("item", "time", "downloaded") VALUES (?, ?, ?);', rows)
+            self.con.commit()
 
     def close(self):
-        super().close()
-        self.con.close()
+        with self._lock:
+            super().close()
+            self.con.close()
 
     def _create_v1(self):
         self.con.execute(
@@ -173,3 +222,204 @@ class SqliteCache(Cache):
     @staticmethod
     def _is_duplicate_error(e: sqlite3.DatabaseError):
         return str(e).find("duplicate column") != -1
+
+
+class DbmCache(Cache):
+    """
+    Cache on embedded key-value store: gdbm (dbm.gnu), other dbm modules are refused, see _gdbm().
+    Keys are items, values are b"<downloaded 0 or 1> <time>".
+    Lookups don't parse sql, batches are written by plain puts.
+    Unlike SqliteCache, db is locked by the process, that opened it,
+    so it can't be used by lib worker and daemon, see require_shared_cache().
+    """
+
+    def __init__(self, path: str, batch_size: int = 0):
+        """
+        batch_size = 0 means, that add_items() will write items immediatly.
+        """
+        self.batch_size = batch_size
+        # item -> value
+        self.batch: dict[str, bytes] = {}
+        self.path = path
+        self._lock = threading.RLock()
+        self.db = _gdbm().open(path, "c")
+
+    def filter_uncached(self, items: Iterable) -> set:
+        with self._lock:
+            return {item for item in set(items) if item.encode() not in self.db}
+
+    def add_items(self, items: Iterable):
+        self._add(items, True)
+
+    def add_discarded_items(self, items: Iterable):
+        self._add(items, False)
+
+    def remove_items(self, items: Iterable):
+        with self._lock:
+            for item in items:
+                self.batch.pop(item, None)
+                key = item.encode()
+                if key in self.db:
+                    del self.db[key]
+            self._sync()
+
+    def fix_downloaded_column(self, downloaded_items: list[str]):
+        """
+        Same as SqliteCache.fix_downloaded_column.
+        """
+        downloaded_items = set(downloaded_items)
+        with self._lock:
+            for key in self.db.keys():
+                _, time = self.db[key].split(b" ", 1)
+                self.db[key] = self._value(key.decode() in downloaded_items, time.decode())
+            self._sync()
+
+    def commit(self):
+        """
+        adds items in batch and clears it
+        """
+        with self._lock:
+            print(f"inserting {len(self.batch)} items into db")
+            if not self.batch:
+                return
+            for item, value in self.batch.items():
+                self.db.setdefault(item.encode(), value)
+            self._sync()
+            self.batch = {}
+
+    def export_items(self) -> Iterator[tuple[str, str, bool]]:
+        """
+        Yields committed (item, time, downloaded), see migrate().
+        """
+        with self._lock:
+            for key in self.db.keys():
+                downloaded, time = self.db[key].split(b" ", 1)
+                yield key.decode(), time.decode(), downloaded == b"1"
+
+    def import_items(self, rows: Iterable[tuple[str, str, bool]]):
+        """
+        Inserts (item, time, downloaded), keeping already cached items.
+        """
+        with self._lock:
+            for item, time, downloaded in rows:
+                self.db.setdefault(item.encode(), self._value(downloaded, time))
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            super().close()
+            self.db.close()
+
+    def _add(self, items: Iterable, downloaded: bool):
+        value = self._value(downloaded, datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+        with self._lock:
+            for item in items:
+                self.batch.setdefault(item, value)
+            if self.batch_size == 0 or len(self.batch) >= self.batch_size:
+                self.commit()
+
+    def _sync(self):
+        # gdbm buffers writes
+        self.db.sync()
+
+    @staticmethod
+    def _value(downloaded: bool, time: str) -> bytes:
+        return f"{int(downloaded)} {time}".encode()
+
+
+def _gdbm():
+    """
+    Returns dbm.gnu module or raises RuntimeError, if python is built without gdbm.
+    dbm.dumb isn't a fallback: it rewrites its whole index on every commit and doesn't lock db.
+    """
+    try:
+        import dbm.gnu
+    except ImportError:
+        raise RuntimeError("dbm cache needs dbm.gnu (python built with gdbm), use sqlite cache") from None
+    return dbm.gnu
+
+
+def migrate(src: SqliteCache | DbmCache, dst: SqliteCache | DbmCache, batch: int = 10000) -> int:
+    """
+    Copies committed items from src to dst, returns count of copied items.
+    """
+    count = 0
+    rows = []
+    for row in src.export_items():
+        rows.append(row)
+        if len(rows) >= batch:
+            dst.import_items(rows)
+            count += len(rows)
+            rows = []
+    dst.import_items(rows)
+    return count + len(rows)
+
+
+SQLITE = "sqlite"
+DBM = "dbm"
+
+# backups, made by SqliteCache._make_backup() and migrate_library_cache()
+_backup_pattern = re.compile(r"\.\d{2}_\d{2}_\d{4}_\d{2}_\d{2}_\d{2}_\d+\.bak$")
+
+
+def cache_backend(ytldl_dir: PathLike) -> str:
+    """
+    Returns backend of library cache: DBM, if library was migrated to it, SQLITE otherwise.
+    """
+    if dbm.whichdb(str(pathlib.Path(ytldl_dir) / "ytldl.dbm")):
+        return DBM
+    return SQLITE
+
+
+def open_cache(ytldl_dir: PathLike, /, batch_size: int = 0, backup: bool = True) -> SqliteCache | DbmCache:
+    """
+    Opens cache of library in ytldl_dir (.ytldl), ytldl.db or ytldl.dbm, see cache_backend().
+    """
+    ytldl_dir = pathlib.Path(ytldl_dir)
+    if cache_backend(ytldl_dir) == DBM:
+        return DbmCache(str(ytldl_dir / "ytldl.dbm"), batch_size=batch_size)
+    return SqliteCache(str(ytldl_dir / "ytldl.db"), batch_size=batch_size, backup=backup)
+
+
+def require_shared_cache(ytldl_dir: PathLike):
+    """
+    Raises RuntimeError, if library cache can't be opened by several processes at once:
+    lib worker runs alongside other workers and daemon keeps cache open.
+    """
+    if cache_backend(ytldl_dir) == DBM:
+        raise RuntimeError(f"cache of {ytldl_dir} is locked by process, that opens it, "
+                           f"migrate it to sqlite by 'lib cache {SQLITE}'")
+
+
+def migrate_library_cache(ytldl_dir: PathLike, backend: str) -> int:
+    """
+    Moves library cache to backend. Files of previous backend are kept as backups.
+    Returns count of migrated items.
+    """
+    ytldl_dir = pathlib.Path(ytldl_dir)
+    current = cache_backend(ytldl_dir)
+    if current == backend:
+        return 0
+    if backend == DBM:
+        # refusing before anything is opened or moved
+        _gdbm()
+
+    src = open_cache(ytldl_dir, backup=False)
+    if backend == DBM:
+        dst = DbmCache(str(ytldl_dir / "ytldl.dbm"))
+    else:
+        dst = SqliteCache(str(ytldl_dir / "ytldl.db"), backup=False)
+    count = migrate(src, dst)
+    src.close()
+    dst.close()
+
+    time_str = datetime.datetime.now().strftime("%d_%m_%Y_%H_%M_%S_%f")
+    if current == DBM:
+        # dbm modules add their own suffixes (.dir, .dat, .db), backups have time_str in name
+        paths = [path for path in ytldl_dir.glob("ytldl.dbm*") if not _backup_pattern.search(path.name)]
+    else:
+        paths = [ytldl_dir / "ytldl.db"]
+    for path in paths:
+        path.rename(path.with_name(".".join([path.name, time_str, "bak"])))
+    return count
+
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+import time
+
+
+class ChannelCache:
+    """
+    On-disk cache of channel -> browseId of its songs playlist, so extracting channel
+    doesn't need get_artist() on every run.
+
+    Entries are valid for ttl seconds. Extractor invalidates entry, if its playlist couldn't be fetched.
+    """
+
+    def __init__(self, path: str, /, ttl: float = 7 * 24 * 60 * 60, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute('CREATE TABLE IF NOT EXISTS "channels" ('
+                         '"channel" varchar(50) PRIMARY KEY NOT NULL, '
+                         '"browse_id" varchar(100) NOT NULL, '
+                         '"time" real NOT NULL);')
+        self.con.commit()
+
+    def get(self, channel: str) -> str | None:
+        """
+        Returns browseId of channel's songs playlist, if it's not older than ttl.
+        """
+        with self._lock:
+            row = self.con.execute('SELECT "browse_id", "time" FROM "channels" WHERE "channel" = ?;',
+                                   (channel,)).fetchone()
+        if row is None or self._clock() - row[1] >= self.ttl:
+            return None
+        return row[0]
+
+    def put(self, channel: str, browse_id: str):
+        with self._lock:
+            self.con.execute('INSERT OR REPLACE INTO "channels" ("channel", "browse_id", "time") VALUES (?, ?, ?);',
+                             (channel, browse_id, self._clock()))
+            self.con.commit()
+
+    def invalidate(self, channel: str):
+        with self._lock:
+            self.con.execute('DELETE FROM "channels" WHERE "channel" = ?;', (channel,))
+            self.con.commit()
+
+    def close(self):
+        with self._lock:
+            self.con.close()
@@ -0,0 +1,231 @@
+import json
+import pathlib
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Executor
+from os import PathLike
+
+from ytldl.yt.pool import FairExecutor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 48650
+
+
+class Library:
+    """
+    One library (output dir with its own .ytldl/ state), managed by daemon.
+    """
+
+    def __init__(self, download_dir: PathLike, oauth=None, /,
+                 limit: int = 50, interval: float = 6 * 60 * 60, debug: bool = False, store=None,
+                 transfer_tuner=None, staging_dir=None, rate_limiter=None, max_bytes: int | None = None):
+        self.download_dir = pathlib.Path(download_dir)
+        self.ytldl_dir = self.download_dir / ".ytldl"
+        self.info_cache_path = self.ytldl_dir / "info.db"
+        self.search_path = self.ytldl_dir / "search.db"
+        self.channels_path = self.ytldl_dir / "channels.db"
+        self.oauth = oauth
+        self.limit = limit
+        self.interval = interval
+        self.debug = debug
+        self.store = store
+        self.transfer_tuner = transfer_tuner
+        self.staging_dir = staging_dir
+        self.rate_limiter = rate_limiter
+        # bytes, downloaded by each update at most
+        self.max_bytes = max_bytes
+
+        self.state = "idle"
+        self.last_run: float | None = None
+        self.last_downloaded: int | None = None
+        self.last_error: str | None = None
+        self.next_run: float | None = None
+        self.trigger_event = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return str(self.download_dir)
+
+    def make_downloader(self, executor: Executor):
+        """
+        Is called once from library's thread, so sqlite connection is created in thread, that uses it.
+        """
+        from ytldl.yt.cache import open_cache
+        from ytldl.yt.channelcache import ChannelCache
+        from ytldl.yt.download import LibDownloader
+        from ytldl.yt.infocache import InfoCache
+        from ytldl.yt.search import SearchIndex
+
+        self.ytldl_dir.mkdir(parents=True, exist_ok=True)
+        return LibDownloader(self.download_dir, self.oauth, debug=self.debug,
+                             executor=executor, store=self.store,
+                             info_cache=InfoCache(str(self.info_cache_path)),
+                             search_index=SearchIndex(str(self.search_path)),
+                             channel_cache=ChannelCache(str(self.channels_path)),
+                             transfer_tuner=self.transfer_tuner, staging_dir=self.staging_dir,
+                             rate_limiter=self.rate_limiter,
+                             cache=open_cache(self.ytldl_dir, batch_size=10))
+
+    def make_budget(self):
+        if self.max_bytes is None:
+            return None
+
+        from ytldl.yt.scheduler import Budget
+        return Budget(max_bytes=self.max_bytes)
+
+    def status(self) -> dict:
+        return dict(dir=self.name, state=self.state, last_run=self.last_run,
+                    last_downloaded=self.last_downloaded, last_error=self.last_error,
+                    next_run=self.next_run)
+
+
+class Daemon:
+    """
+    Long-running process, that periodically updates several libraries.
+
+    Each library is updated in its own thread, but all downloads go through one
+    bounded FairExecutor, so libraries share bandwidth fairly.
+    Local control socket accepts json lines: {"cmd": "status"} and {"cmd": "update", "dir": optional dir}.
+    """
+
+    def __init__(self, libraries: list[Library], /, workers: int = 4,
+                 host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, drain_timeout: float = 10):
+        """
+        drain_timeout is seconds, given to running downloads to finish after stop().
+        """
+        self.libraries = libraries
+        self.drain_timeout = drain_timeout
+        self.executor = FairExecutor(workers)
+        self._stopped = threading.Event()
+        self._threads: list[threading.Thread] = []
+        # library name -> downloader, while library is running
+        self._downloaders: dict[str, object] = {}
+        self._server = _ControlServer((host, port), self)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self):
+        for library in self.libraries:
+            thread = threading.Thread(target=self._run_library, args=(library,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        server_thread.start()
+        print(f"[Daemon] Managing {len(self.libraries)} libraries, control socket at {self.address}")
+
+    def serve_forever(self):
+        signal.signal(signal.SIGINT, lambda *a: self.stop())
+        signal.signal(signal.SIGTERM, lambda *a: self.stop())
+        self.start()
+        while not self._stopped.wait(timeout=1):
+            pass
+        self.join()
+
+    def stop(self):
+        """
+        Stops at once starting new downloads, running ones are aborted after drain_timeout.
+        Second stop() aborts them at once.
+        """
+        print("[Daemon] STOPPING...")
+        drain_timeout = 0 if self._stopped.is_set() else self.drain_timeout
+        self._stopped.set()
+        for library in self.libraries:
+            library.trigger_event.set()
+        for downloader in list(self._downloaders.values()):
+            downloader.stop(drain_timeout)
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self._server.server_close()
+
+    def trigger(self, download_dir: str | None = None) -> list[str]:
+        """
+        Triggers immediate update of library with download_dir or of all libraries.
+        Returns names of triggered libraries.
+        """
+        triggered = []
+        for library in self.libraries:
+            if download_dir is None or pathlib.Path(download_dir) == library.download_dir:
+                library.trigger_event.set()
+                triggered.append(library.name)
+        return triggered
+
+    def status(self) -> dict:
+        return dict(libraries=[library.status() for library in self.libraries],
+                    workers=self.executor.max_workers,
+                    pending=self.executor.pending())
+
+    def _run_library(self, library: Library):
+        downloader = None
+        try:
+            while not self._stopped.is_set():
+                library.trigger_event.clear()
+                library.state = "running"
+                try:
+                    if downloader is None:
+                        downloader = library.make_downloader(self.executor.queue(library.name))
+                    self._downloaders[library.name] = downloader
+                    downloaded = downloader.lib_update(limit=library.limit, budget=library.make_budget())
+                    library.last_downloaded = len(downloaded)
+                    library.last_error = None
+                except Exception as e:
+                    print(f"[Daemon] couldn't update {library.name}: {e}")
+                    library.last_error = str(e)
+                finally:
+                    self._downloaders.pop(library.name, None)
+                    library.state = "idle"
+                    library.last_run = time.time()
+                    library.next_run = library.last_run + library.interval
+                library.trigger_event.wait(timeout=library.interval)
+        finally:
+            if downloader is not None:
+                downloader.close()
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self._dispatch(request)
+            except Exception as e:
+                response = dict(error=str(e))
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    def _dispatch(self, request: dict) -> dict:
+        daemon: Daemon = self.server.daemon
+        match request.get("cmd"):
+            case "status":
+                return daemon.status()
+            case "update":
+                return dict(triggered=daemon.trigger(request.get("dir")))
+            case cmd:
+                return dict(error=f"unknown command: {cmd}")
+
+
+class _ControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], daemon: Daemon):
+        super().__init__(address, _ControlHandler)
+        self.daemon = daemon
+
+
+def send_command(request: dict, /, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 timeout: float = 10) -> dict:
+    """
+    Sends command to running daemon and returns its response.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
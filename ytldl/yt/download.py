@@ -1,21 +1,39 @@
+import contextlib
+import copy
 import os
 import pathlib
-import re
 import signal
+import threading
+import time
 from asyncio import Future
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor, ThreadPoolExecutor
 from os import PathLike
 from time import sleep
 from typing import Callable, Iterable
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
 from ytmusicapi import YTMusic
 
+from ytldl.metadata.metadata import read_metadata
+from ytldl.util.filename import extract_video_id, get_downloaded_video_ids
 from ytldl.util.url import to_url
+from ytldl.yt.bandwidth import RateLimiter
 from ytldl.yt.cache import Cache, MemoryCache
+from ytldl.yt.channelcache import ChannelCache
+from ytldl.yt.events import EventBus
 from ytldl.yt.extractor import Extractor
+from ytldl.yt.filter import TrackFilter
+from ytldl.yt.infocache import InfoCache
+from ytldl.yt.jobs import JobQueue
 from ytldl.yt.oauth import Oauth
-from ytldl.yt.postprocessors import FilterPP, FilterPPException, LyricsPP, MetadataPP
+from ytldl.yt.postprocessors import BudgetPP, FilterPP, FilterPPException, LyricsPP, MetadataPP, PrefetchPP, \
+    PublishPP, StorePP, TransferPP, is_song
+from ytldl.yt.scheduler import Budget, BudgetExpired, DownloadAborted, Source, prioritize
+from ytldl.yt.search import SearchIndex
+from ytldl.yt.staging import Staging
+from ytldl.yt.store import ContentStore
+from ytldl.yt.transfer import TransferTuner
 
 
 class Downloader:
@@ -52,81 +70,260 @@ class Downloader:
         },
     }
 
-    def __init__(self, download_dir: PathLike, /, yt: YTMusic = YTMusic(), debug: bool = False):
+    def __init__(self, download_dir: PathLike, /, yt: YTMusic | None = None, debug: bool = False,
+                 executor: Executor | None = None, store: ContentStore | None = None,
+                 track_filter: TrackFilter | None = None, info_cache: InfoCache | None = None,
+                 events: EventBus | None = None, search_index: SearchIndex | None = None,
+                 transfer_tuner: TransferTuner | None = None, drain_timeout: float = 10,
+                 channel_cache: ChannelCache | None = None, staging_dir: PathLike | None = None,
+                 rate_limiter: RateLimiter | None = None):
+        """
+        executor is used to download tracks, it can be shared between several downloaders.
+        If not provided, new thread pool is created for each download.
+        store is ContentStore, shared between libraries: stored tracks are linked from it instead of downloading.
+        track_filter discards non-songs before download, by metadata from extractor.
+        info_cache keeps yt-dlp info between attempts and runs, so download can skip info extraction.
+        events is EventBus, that gets pipeline events, subscribe to downloader.events to get them.
+        search_index gets metadata of downloaded and linked tracks.
+        transfer_tuner enables chunked download of tracks by several connections, see TransferPP.
+        drain_timeout is seconds, given to running downloads to finish after stop().
+        channel_cache keeps songs playlists of channels between runs, see Extractor.
+        staging_dir is local dir, where tracks are downloaded, transcoded and tagged before they are
+        moved into download_dir, see Staging.
+        rate_limiter limits byte rate of all downloads, it can be shared between several downloaders.
+        """
         self._stopped = False
+        # running downloads are aborted after this time, see stop()
+        self._abort_at: float | None = None
+        self.drain_timeout = drain_timeout
+        if yt is None:
+            yt = YTMusic()
         self._yt = yt
-        self._extractor = Extractor(yt)
+        # prefetch threads share client, see LyricsPP
+        self._yt_lock = threading.Lock()
+        self._channel_cache = channel_cache
+        self._extractor = Extractor(yt, channel_cache=channel_cache)
         self._debug = debug
+        self._executor = executor
+        self._store = store
+        self._track_filter = track_filter or TrackFilter()
+        self._info_cache = info_cache
+        self.events = events or EventBus()
+        self._search_index = search_index
+        # lyrics and thumbnails are prefetched here, while audio is downloading, see PrefetchPP
+        self._prefetch_executor = ThreadPoolExecutor(thread_name_prefix="prefetch")
+        self._transfer_tuner = transfer_tuner
+        self._rate_limiter = rate_limiter
+        if transfer_tuner is not None and transfer_tuner.workers is None:
+            transfer_tuner.workers = self._max_workers()
         self.download_dir = download_dir
         self._set_download_dir(download_dir)
-
-        signal.signal(signal.SIGINT, lambda *a: self.stop())
-        signal.signal(signal.SIGTERM, lambda *a: self.stop())
+        self._staging = Staging(staging_dir, download_dir) if staging_dir is not None else None
+        if self._staging is not None:
+            self._ydl_opts['paths']['home'] = str(self._staging.path)
+        # store, that can't hardlink tracks of library, gets them from staging dir, see PublishPP
+        self._store_from_staging = self._staging is not None and self._store is not None \
+            and os.stat(self._store.path).st_dev != os.stat(download_dir).st_dev
+
+        # signals can be handled only in main thread, e.g. daemon creates downloaders in worker threads
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, lambda *a: self.stop())
+            signal.signal(signal.SIGTERM, lambda *a: self.stop())
+
+    def _max_workers(self) -> int:
+        if self._executor is None:
+            # default of ThreadPoolExecutor
+            return min(32, (os.cpu_count() or 1) + 4)
+        return getattr(self._executor, "max_workers", None) or getattr(self._executor, "_max_workers", 1)
 
     def _set_download_dir(self, download_dir: PathLike):
         pathlib.Path(download_dir).mkdir(parents=True, exist_ok=True)
+        # copying, so several downloaders in one process don't share download dir
+        self._ydl_opts = copy.deepcopy(self._ydl_opts)
         if 'paths' not in self._ydl_opts:
             self._ydl_opts['paths'] = {}
         self._ydl_opts['paths']['home'] = str(download_dir)
 
     # returns download filepath
 
-    def _download_track(self, video_id: str) -> str:
+    def _download_track(self, video_id: str, budget: Budget | None = None) -> str:
         """
         Raises FilterPPException if got filtered.
+        Raises BudgetExpired if track doesn't fit into bytes of budget.
         Returns videoId of downloaded track (same as input video_id).
         """
 
         url = to_url(video_id)
+        self.events.emit(EventBus.STARTED, video_id)
 
         if self._debug:
             sleep(1)
             return video_id
 
-        with YoutubeDL(self._ydl_opts) as ydl:
-            ydl.add_post_processor(FilterPP(), when='pre_process')
-            ydl.add_post_processor(LyricsPP(), when='post_process')
-            ydl.add_post_processor(MetadataPP(), when='post_process')
+        if self._staging is not None and (published := self._staging.find(video_id)):
+            print(f"{published.name} is already in library")
+            return video_id
 
-            ydl.download([url])
+        if self._store is not None and (linked := self._store.link_to(video_id, self.download_dir)):
+            print(f"linked {video_id} from store")
+            if self._search_index is not None:
+                self._search_index.add(linked, read_metadata(str(linked)))
             return video_id
 
+        track = self._extractor.tracks.get(video_id)
+        # copying, so per-track params (see TransferPP) don't leak to other tracks
+        with YoutubeDL(dict(self._ydl_opts)) as ydl:
+            ydl.add_progress_hook(self._abort_hook)
+            ydl.add_progress_hook(self.events.progress_hook)
+            ydl.add_postprocessor_hook(self.events.postprocessor_hook)
+            lyrics_pp = LyricsPP(yt=self._yt, track=track, lock=self._yt_lock)
+            metadata_pp = MetadataPP(track=track, search_index=self._search_index)
+            ydl.add_post_processor(FilterPP(), when='pre_process')
+            ydl.add_post_processor(PrefetchPP(self._prefetch_executor, lyrics_pp, metadata_pp), when='pre_process')
+            ydl.add_post_processor(lyrics_pp, when='post_process')
+            ydl.add_post_processor(metadata_pp, when='post_process')
+            if self._store is not None and self._store_from_staging:
+                ydl.add_post_processor(StorePP(self._store), when='after_move')
+            if self._staging is not None:
+                ydl.add_post_processor(PublishPP(self._staging), when='after_move')
+            if self._store is not None and not self._store_from_staging:
+                ydl.add_post_processor(StorePP(self._store), when='after_move')
+            if self._transfer_tuner is not None:
+                transfer_pp = TransferPP(self._transfer_tuner)
+                ydl.add_post_processor(transfer_pp, when='before_dl')
+                ydl.add_progress_hook(transfer_pp.progress_hook)
+            budget_pp = None
+            if budget is not None and budget.max_bytes is not None:
+                budget_pp = BudgetPP(budget, max_duration=self._track_filter.max_duration)
+                ydl.add_post_processor(budget_pp, when='before_dl')
+                ydl.add_progress_hook(budget_pp.progress_hook)
+            if self._rate_limiter is not None:
+                ydl.add_progress_hook(self._rate_limiter.progress_hook)
+
+            try:
+                if self._info_cache is None:
+                    ydl.download([url])
+                else:
+                    self._download_with_info_cache(ydl, video_id)
+            finally:
+                if budget_pp is not None:
+                    budget_pp.release()
+            return video_id
+
+    def _download_with_info_cache(self, ydl: YoutubeDL, video_id: str):
+        """
+        Starts download from cached info, if it's fresh, otherwise extracts and caches info.
+        """
+        metadata = self._info_cache.get_metadata(video_id)
+        if metadata is not None and not is_song(metadata):
+            raise FilterPPException()
+
+        info = self._info_cache.get(video_id)
+        if info is not None:
+            try:
+                ydl.process_ie_result(info, download=True)
+                return
+            except DownloadError as e:
+                print(f"couldn't download {video_id} from cached info, extracting again: {e}")
+                self._info_cache.invalidate(video_id)
+
+        info = ydl.extract_info(to_url(video_id), download=False, process=False)
+        sanitized = ydl.sanitize_info(copy.deepcopy(info), remove_private_keys=True)
+        # private, but used to sort formats, so cached info selects the same format
+        if info.get("_format_sort_fields"):
+            sanitized["_format_sort_fields"] = list(info["_format_sort_fields"])
+        self._info_cache.put(video_id, sanitized)
+        ydl.process_ie_result(info, download=True)
+
+    def _discard_non_songs(self, videos: list[str],
+                           on_discarded: Callable[[Iterable[str]], None] = None) -> list[str]:
+        """
+        Discards videos, that are surely not songs by extracted metadata, without downloading them.
+        Returns rest of videos.
+        """
+        discarded = {video_id for video_id in videos
+                     if self._track_filter.is_song(self._extractor.tracks.get(video_id)) is False}
+        if not discarded:
+            return videos
+
+        print(f"discarding {len(discarded)} non-songs before download")
+        for video_id in discarded:
+            self.events.emit(EventBus.DISCARDED, video_id, reason="metadata")
+        if on_discarded:
+            on_discarded(discarded)
+        return [video_id for video_id in videos if video_id not in discarded]
+
+    def _download_track_within(self, video_id: str, budget: Budget | None) -> str:
+        """
+        Raises BudgetExpired or DownloadAborted instead of starting download, if budget is expired or if stopped.
+        """
+        if self._stopped:
+            raise DownloadAborted()
+        if budget is not None and budget.expired():
+            raise BudgetExpired()
+        return self._download_track(video_id, budget)
+
     def _download_tracks(self, videos: Iterable[str],
                          after_download: Callable[[str], None] = None,
-                         on_discarded: Callable[[Iterable[str]], None] = None) \
+                         on_discarded: Callable[[Iterable[str]], None] = None,
+                         budget: Budget | None = None) \
             -> Iterable[str]:
         """
         Downloads several tracks, based on their videoIds in thread pool.
-        Uses set() to not to allow video_ids duplicates.
+        Tracks are started in given order, video_ids duplicates are dropped.
+        If budget expires, not started tracks are cancelled, running ones are completed.
+        If stopped, not started tracks are cancelled, running ones are aborted after drain timeout (see stop()).
         Returns list of downloaded tracks.
         """
 
         downloaded_videos = []
-        videos = set(videos)
-        with ThreadPoolExecutor() as executor:
+        if self._staging is not None:
+            self._staging.refresh()
+        videos = list(dict.fromkeys(videos))
+        videos = self._discard_non_songs(videos, on_discarded)
+        if budget is not None:
+            videos = budget.limit(videos)
+        if self._executor is None:
+            executor_context = ThreadPoolExecutor()
+        else:
+            executor_context = contextlib.nullcontext(self._executor)
+        with executor_context as executor:
             futures: list[Future] = []
             for video_id in videos:
+                # before submit, so worker thread can't emit STARTED before it
+                self.events.emit(EventBus.QUEUED, video_id)
                 future = executor.submit(
-                    self._download_track, video_id)
+                    self._download_track_within, video_id, budget)
                 future.video_id = video_id
                 futures.append(future)
 
             for future in futures:
                 video_id: str = future.video_id
                 try:
-                    if self._stopped:
-                        executor.shutdown(wait=True, cancel_futures=True)
+                    # running tracks are still collected, so finished ones get cached
+                    if self._stopped or budget is not None and budget.expired():
+                        for f in futures:
+                            f.cancel()
+                    if future.cancelled():
+                        self.events.emit(EventBus.CANCELLED, video_id)
+                        continue
 
                     future.result()
+                    self.events.emit(EventBus.DOWNLOADED, video_id)
                     if after_download:
                         after_download(video_id)
                     downloaded_videos.append(video_id)
+                except (BudgetExpired, DownloadAborted):
+                    self.events.emit(EventBus.CANCELLED, video_id)
                 except FilterPPException:
                     print(f"discarding {video_id} due to FilterPP")
+                    self.events.emit(EventBus.DISCARDED, video_id, reason="FilterPP")
                     if on_discarded:
                         on_discarded([video_id])
                 except Exception as e:
                     print(f"couldn't download {video_id}: {e}")
+                    self.events.emit(EventBus.FAILED, video_id, error=str(e))
+        self.sync()
         return iter(downloaded_videos)
 
     def download(self,
@@ -139,6 +336,8 @@ class Downloader:
         Limit is max tracks per list or channel.
         """
         self._stopped = False
+        self._abort_at = None
+        self._extractor.tracks.clear()
 
         tracks_to_download = self._extractor.extract(
             videos=videos, playlists=playlists, channels=channels, limit=limit)
@@ -151,46 +350,98 @@ class Downloader:
         """
         Gets all music filenames from download_dir and parses videoid from it.
         """
-        files: list[str] = os.listdir(self.download_dir)
-
-        video_ids = [video_id for file in files if
-                     (video_id := self.extract_video_id(file)) is not None]
-        return video_ids
-
-    # for parsing filename
-    pattern = re.compile(".*\[(.+?)\].m4a$")
+        return get_downloaded_video_ids(self.download_dir)
 
     # can return None
-    def extract_video_id(self, filename: str) -> str | None:
-        search = self.pattern.search(filename)
-        if search is None:
-            return None
-        try:
-            return self.pattern.search(filename).group(1)
-        except IndexError:
-            return None
-
-    def stop(self):
-        print("STOPPING...")
+    @staticmethod
+    def extract_video_id(filename: str) -> str | None:
+        return extract_video_id(filename)
+
+    def stop(self, drain_timeout: float | None = None):
+        """
+        Stops starting new downloads at once. Running downloads are aborted after drain_timeout
+        (self.drain_timeout by default, 0 if already stopping), leaving .part files, that yt-dlp resumes next time.
+        Can be called from signal handler or other thread.
+        """
+        if drain_timeout is None:
+            drain_timeout = 0 if self._stopped else self.drain_timeout
+        print(f"STOPPING, running downloads are aborted in {drain_timeout}s...")
+        abort_at = time.monotonic() + drain_timeout
+        if self._abort_at is None or abort_at < self._abort_at:
+            self._abort_at = abort_at
         self._stopped = True
 
+    def sync(self):
+        """
+        Syncs download_dir, so tracks, published from staging dir, survive crash.
+        """
+        if self._staging is not None:
+            self._staging.sync()
+
+    def close(self):
+        """
+        Shuts down prefetch threads. Is called, when downloader isn't used anymore.
+        """
+        self._prefetch_executor.shutdown()
+
+    def _abort_hook(self, d: dict):
+        """
+        yt-dlp progress hook, that aborts download after stop().
+        """
+        if self._abort_at is not None and time.monotonic() >= self._abort_at:
+            raise DownloadAborted()
+
 
 class CacheDownloader(Downloader):
-    def __init__(self, download_dir: PathLike, /, cache: Cache = MemoryCache(), *args, **kwargs):
+    def __init__(self, download_dir: PathLike, /, cache: Cache | None = None, *args,
+                 count_new: bool = False, stop_after_known: int | None = None, **kwargs):
+        """
+        count_new = True makes limit count only uncached tracks, see Extractor.
+        """
         super().__init__(download_dir, *args, **kwargs)
+        if cache is None:
+            cache = MemoryCache()
         self._cache = cache
-
-    def _download_tracks(self, videos: Iterable[str], **kwargs) -> Iterable[str]:
-        uncached_video_ids = self._cache.filter_uncached(videos)
+        if count_new:
+            self._extractor = Extractor(self._yt, cache=cache, stop_after_known=stop_after_known,
+                                        channel_cache=self._channel_cache)
+
+    def _download_tracks(self, videos: Iterable[str], budget: Budget | None = None, **kwargs) -> Iterable[str]:
+        videos = list(videos)
+        uncached = self._cache.filter_uncached(videos)
+        # keeping order of videos
+        uncached_video_ids = [video_id for video_id in dict.fromkeys(videos) if video_id in uncached]
         print(f"download only uncached {len(uncached_video_ids)} tracks")
 
         downloaded_tracks = super()._download_tracks(
             uncached_video_ids,
-            after_download=lambda x: self._cache.add_items([x]),
-            on_discarded=lambda x: self._cache.add_discarded_items(x))
+            after_download=self._add_to_cache,
+            on_discarded=lambda x: self._cache.add_discarded_items(x),
+            budget=budget)
         self._cache.commit()
         return downloaded_tracks
 
+    def _add_to_cache(self, video_id: str):
+        self._cache.add_items([video_id])
+        self.events.emit(EventBus.CACHED, video_id)
+
+    def enqueue(self, queue: JobQueue,
+                videos: Iterable[str] = None,
+                playlists: Iterable[str] = None,
+                channels: Iterable[str] = None,
+                limit: int = 50) -> int:
+        """
+        Extracts tracks and puts uncached ones to queue instead of downloading them,
+        see JobWorker.
+        Returns count of new jobs.
+        """
+        tracks = self._extractor.extract(
+            videos=videos, playlists=playlists, channels=channels, limit=limit)
+        uncached_video_ids = self._cache.filter_uncached(tracks)
+        added = queue.put(uncached_video_ids)
+        print(f"enqueued {added} of {len(uncached_video_ids)} uncached tracks")
+        return added
+
 
 class LibDownloader(CacheDownloader):
     # TODO: add to settings etc
@@ -210,50 +461,110 @@ class LibDownloader(CacheDownloader):
     ]
 
     def __init__(self, download_dir: PathLike, oauth: Oauth, /, *args, **kwargs):
-        yt = YTMusic(oauth.auth)
+        self._oauth = oauth
+        self._auth = oauth.auth
+        super().__init__(download_dir, yt=self._make_yt(self._auth), *args, **kwargs)
 
-        super().__init__(download_dir, yt=yt, *args, **kwargs)
+    @staticmethod
+    def _make_yt(auth: str) -> YTMusic:
+        return YTMusic(auth)
 
-    def _get_home_items(self, filter_titles: list[str]) -> dict:
+    def _refresh_yt(self):
         """
-        Returns home items in format of { videos, playlists, channels },
-            that can be put into download function
+        YTMusic keeps auth headers, it was created with, so it's recreated, when oauth token is refreshed.
+        Is called before each run, as downloader can live longer than token, e.g. in daemon.
+        """
+        auth = self._oauth.auth
+        if auth == self._auth:
+            return
+        self._auth = auth
+        self._yt = self._make_yt(auth)
+        self._extractor.yt = self._yt
+
+    def _get_home_sources(self, filter_titles: list[str]) -> list[Source]:
+        """
+        Returns home items as sources, ranked by section:
+            by index of section title in filter_titles or by position on home page.
         """
         home = self._yt.get_home(limit=100)
         if filter_titles:
             home = [chapter for chapter in home if chapter["title"]
                     in filter_titles]
 
-        home_items = [
-            contents for home_item in home for contents in home_item["contents"]]
+        def section_rank(position: int, chapter: dict) -> int:
+            return filter_titles.index(chapter["title"]) if filter_titles else position
 
-        res = dict(videos=[], playlists=[], channels=[])
-        for home_item in home_items:
+        home_items = [(section_rank(position, chapter), contents)
+                      for position, chapter in enumerate(home) for contents in chapter["contents"]]
+
+        res: list[Source] = []
+        for section, home_item in home_items:
             title = home_item["title"]
 
             if "subscribers" in home_item and "browseId" in home_item:
                 browse_id = home_item["browseId"]
                 print(f"Appending channel {title} with browseId {browse_id}")
-                res['channels'].append(browse_id)
+                res.append(Source(section, "channels", browse_id))
                 continue
 
             video_id = home_item.get("videoId", None)
             playlist_id = home_item.get("playlistId", None)
             if video_id:
                 print(f"Appending video {title} with videoId {video_id}")
-                res['videos'].append(video_id)
+                res.append(Source(section, "videos", video_id))
             if playlist_id:
                 if title in self._skip_home_title_items:
                     print(f"Skipping playlist {title} with playlist_id {playlist_id}")
                     continue
                 print(f"Appending playlist {title} with playlist_id {playlist_id}")
-                res["playlists"].append(playlist_id)
+                res.append(Source(section, "playlists", playlist_id))
+        return res
+
+    def _get_home_items(self, filter_titles: list[str]) -> dict:
+        """
+        Returns home items in format of { videos, playlists, channels },
+            that can be put into download function
+        """
+        return self._group_sources(self._get_home_sources(filter_titles))
+
+    @staticmethod
+    def _group_sources(sources: Iterable[Source]) -> dict:
+        res = dict(videos=[], playlists=[], channels=[])
+        for source in sources:
+            res[source.kind].append(source.id)
         return res
 
-    def lib_update(self, limit: int = 50):
+    def lib_update(self, limit: int = 50, budget: Budget | None = None) -> list[str]:
+        """
+        Downloads tracks from home, the most valuable first (see prioritize).
+        Stops, when budget is exhausted.
+        Returns list of downloaded tracks.
+        """
         print("Starting updating lib...")
-        home_items = self._get_home_items(
+        self._refresh_yt()
+        self._stopped = False
+        self._abort_at = None
+        self._extractor.tracks.clear()
+        if budget is not None:
+            budget.start()
+
+        sources = self._get_home_sources(
             filter_titles=self._personalised_home_titles)
+        extracted = self._extractor.extract_by_source(**self._group_sources(sources), limit=limit)
+        tracks = prioritize(sources, extracted)
 
-        downloaded_tracks = list(self.download(**home_items, limit=limit))
+        downloaded_tracks = list(self._download_tracks(tracks, budget=budget))
         print(f"Downloaded {sum(1 for i in downloaded_tracks)} tracks")
+        if self._info_cache is not None:
+            self._info_cache.purge()
+        return downloaded_tracks
+
+    def lib_enqueue(self, queue: JobQueue, limit: int = 50) -> int:
+        """
+        Same as lib_update, but puts tracks to queue for JobWorkers.
+        """
+        print("Starting enqueueing lib...")
+        self._refresh_yt()
+        home_items = self._get_home_items(
+            filter_titles=self._personalised_home_titles)
+        return self.enqueue(queue, **home_items, limit=limit)
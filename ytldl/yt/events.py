@@ -0,0 +1,180 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, NamedTuple, TextIO
+
+
+class Event(NamedTuple):
+    """
+    type is one of EventBus event types, data depends on it:
+        progress: downloaded_bytes, total_bytes, speed
+        discarded: reason
+        failed: error
+    """
+    type: str
+    video_id: str
+    time: float
+    data: dict
+
+    def to_dict(self) -> dict:
+        return dict(type=self.type, video_id=self.video_id, time=self.time, **self.data)
+
+
+class EventBus:
+    """
+    Pipeline events, delivered to subscribers in a separate dispatcher thread.
+
+    emit() only puts event into SimpleQueue, so download threads don't wait for subscribers
+    and don't contend on locks. Without subscribers emit() does nothing.
+    """
+
+    QUEUED = "queued"
+    STARTED = "started"
+    PROGRESS = "progress"
+    DOWNLOADED = "downloaded"
+    TAGGED = "tagged"
+    CACHED = "cached"
+    DISCARDED = "discarded"
+    FAILED = "failed"
+    # not started, because budget expired
+    CANCELLED = "cancelled"
+
+    def __init__(self):
+        self._subscribers: list[Callable[[Event], None]] = []
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, callback: Callable[[Event], None]):
+        """
+        Callback is called from dispatcher thread, events come in order of emit().
+        """
+        self._subscribers.append(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch, daemon=True, name="EventBus")
+            self._thread.start()
+
+    def emit(self, type: str, video_id: str, **data):
+        if self._subscribers:
+            self._queue.put(Event(type, video_id, time.time(), data))
+
+    def close(self):
+        """
+        Delivers emitted events and stops dispatcher thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _dispatch(self):
+        while (event := self._queue.get()) is not None:
+            for callback in self._subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"[EventBus] subscriber failed on {event.type}: {e}")
+
+    def progress_hook(self, d: dict):
+        """
+        yt-dlp progress hook.
+        """
+        if d.get("status") != "downloading":
+            return
+        self.emit(self.PROGRESS, (d.get("info_dict") or {}).get("id", ""),
+                  downloaded_bytes=d.get("downloaded_bytes"),
+                  total_bytes=d.get("total_bytes") or d.get("total_bytes_estimate"),
+                  speed=d.get("speed"))
+
+    def postprocessor_hook(self, d: dict):
+        """
+        yt-dlp postprocessor hook, emits TAGGED after MetadataPP.
+        """
+        if d.get("status") == "finished" and d.get("postprocessor") == "Metadata":
+            self.emit(self.TAGGED, (d.get("info_dict") or {}).get("id", ""))
+
+
+class ProgressTracker:
+    """
+    Aggregates events into counters, throughput and ETA.
+    Subscribe it to EventBus, then read snapshot() from any thread.
+    """
+
+    # events, that finish track
+    FINISHED = {EventBus.DOWNLOADED, EventBus.DISCARDED, EventBus.FAILED, EventBus.CANCELLED}
+
+    def __init__(self, window: float = 30, clock: Callable[[], float] = time.time):
+        """
+        window is time in seconds, throughput is measured over.
+        """
+        self.window = window
+        self._clock = clock
+        self.counts: dict[str, int] = {}
+        self.bytes = 0
+        self.started_at: float | None = None
+        # queued, but not finished video_ids
+        self._pending: set[str] = set()
+        self._finished = 0
+        # video_id -> downloaded bytes of current download
+        self._downloaded: dict[str, int] = {}
+        # (time, bytes) samples for throughput
+        self._samples: deque[tuple[float, int]] = deque()
+
+    def __call__(self, event: Event):
+        if self.started_at is None:
+            self.started_at = event.time
+        self.counts[event.type] = self.counts.get(event.type, 0) + 1
+
+        if event.type == EventBus.PROGRESS:
+            downloaded = event.data.get("downloaded_bytes") or 0
+            delta = max(0, downloaded - self._downloaded.get(event.video_id, 0))
+            self._downloaded[event.video_id] = downloaded
+            self.bytes += delta
+            self._samples.append((event.time, self.bytes))
+            while self._samples and self._samples[0][0] < event.time - self.window:
+                self._samples.popleft()
+        elif event.type == EventBus.QUEUED:
+            self._pending.add(event.video_id)
+        elif event.type in self.FINISHED:
+            self._downloaded.pop(event.video_id, None)
+            if event.video_id in self._pending:
+                self._pending.discard(event.video_id)
+                self._finished += 1
+
+    def throughput(self) -> float:
+        """
+        Bytes per second over last window.
+        """
+        samples = list(self._samples)
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            return 0.0
+        return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
+
+    def eta(self) -> float | None:
+        """
+        Seconds left, estimated by rate of finished tracks.
+        """
+        if not self._finished or self.started_at is None:
+            return None
+        elapsed = self._clock() - self.started_at
+        return max(0.0, len(self._pending) * elapsed / self._finished)
+
+    def snapshot(self) -> dict:
+        return dict(counts=dict(self.counts), bytes=self.bytes, throughput=self.throughput(), eta=self.eta())
+
+
+class JsonLinesSink:
+    """
+    Writes events as json lines. If tracker is provided, also writes its snapshot after each finished track.
+    """
+
+    def __init__(self, file: TextIO, tracker: ProgressTracker | None = None):
+        self.file = file
+        self.tracker = tracker
+
+    def __call__(self, event: Event):
+        self.file.write(json.dumps(event.to_dict()) + "\n")
+        if self.tracker is not None and event.type in ProgressTracker.FINISHED:
+            self.file.write(json.dumps(dict(type="stats", time=event.time, **self.tracker.snapshot())) + "\n")
+        self.file.flush()
@@ -1,13 +1,33 @@
+import itertools
 from asyncio import Future
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
 
 from ytmusicapi import YTMusic
+from ytmusicapi.continuations import get_continuation_contents, get_continuation_params
+from ytmusicapi.navigation import SECTION_LIST_ITEM, SINGLE_COLUMN_TAB, nav
+from ytmusicapi.parsers.playlists import parse_playlist_items
+
+from ytldl.yt.cache import Cache
+from ytldl.yt.channelcache import ChannelCache
+from ytldl.yt.track import Track
 
 
 class Extractor:
-    def __init__(self, yt: YTMusic):
+    def __init__(self, yt: YTMusic, cache: Cache | None = None, stop_after_known: int | None = None,
+                 channel_cache: ChannelCache | None = None):
+        """
+        If cache is provided, limit counts only new (uncached) tracks:
+            playlists are fetched page by page, until limit of new tracks is found.
+            If stop_after_known is set, paging stops after that many known tracks in a row.
+        channel_cache keeps songs playlists of channels, so channel is extracted by one request instead of two.
+        """
         self.yt = yt
+        self.cache = cache
+        self.stop_after_known = stop_after_known
+        self.channel_cache = channel_cache
+        # metadata of extracted tracks: videoId -> Track
+        self.tracks: dict[str, Track] = {}
 
     def extract(self,
                 videos: Iterable[str] = None,
@@ -20,22 +40,37 @@ class Extractor:
         Returns iterable of videoIds.
         """
 
+        by_source = self.extract_by_source(
+            videos=videos, playlists=playlists, channels=channels, limit=limit)
+        video_ids: list[str] = [video_id for ids in by_source.values() for video_id in ids]
+        print(f"[Extractor] Extracted {len(video_ids)} videos")
+        return (video_id for video_id in video_ids)
+
+    def extract_by_source(self,
+                          videos: Iterable[str] = None,
+                          playlists: Iterable[str] = None, channels: Iterable[str] = None,
+                          limit: int = 50) -> dict[str, list[str]]:
+        """
+        Same as extract, but keeps videoIds of each source in their order.
+        Returns dict: source id (videoId, playlistId or channelId) -> list of videoIds.
+        Sources, that couldn't be extracted, are skipped.
+        """
+
+        res: dict[str, list[str]] = {video_id: [video_id] for video_id in (videos or ())}
         with ThreadPoolExecutor(max_workers=10) as executor:
-            futures: list[Future[Iterable[str]]] = []
+            futures: dict[str, Future[Iterable[str]]] = {}
             for playlist in (playlists or ()):
-                futures.append(executor.submit(
-                    self._extract_video_ids_from_playlist, playlist, limit=limit))
+                futures[playlist] = executor.submit(
+                    self._extract_video_ids_from_playlist, playlist, limit=limit)
             for channel in (channels or ()):
-                futures.append(executor.submit(
-                    self.extract_video_ids_from_channel, channel, limit=limit))
-            video_ids: list[str] = list(videos or ())
-            for future in as_completed(futures):
+                futures[channel] = executor.submit(
+                    self.extract_video_ids_from_channel, channel, limit=limit)
+            for source, future in futures.items():
                 try:
-                    video_ids += future.result()
+                    res[source] = list(future.result())
                 except Exception as e:
                     print(f"skipping playlist, couldn't extract video ids: {e}")
-            print(f"[Extractor] Extracted {len(video_ids)} videos")
-            return (video_id for video_id in video_ids)
+        return res
 
     def _extract_video_ids_from_playlist(self, playlist: str, /, limit: int = 50) -> Iterable[str]:
         """
@@ -43,22 +78,104 @@ class Extractor:
         Returns iterable of videoIds.
         """
 
+        if self.cache is not None:
+            return self._extract_new_video_ids_from_playlist(playlist, limit=limit)
+
+        tracks = self._get_playlist_tracks(playlist, limit=limit)
+        return (track['videoId'] for track in tracks)
+
+    def _get_playlist_tracks(self, playlist: str, /, limit: int = 50) -> list[dict]:
         try:
             contents = self.yt.get_playlist(playlistId=playlist, limit=limit)
         except Exception:
             try:
-                contents = self.yt.get_watch_playlist(playlistId=contents, limit=limit)
+                contents = self.yt.get_watch_playlist(playlistId=playlist, limit=limit)
             except Exception as e:
                 raise Exception(f"couldn't get songs from {playlist}")
         tracks: list = contents['tracks']
         tracks = tracks[:min(limit, len(tracks))]
+        self._remember(tracks)
+        # watch playlist has lyrics of its first track
+        if tracks and contents.get('lyrics') and tracks[0].get('videoId') in self.tracks:
+            self.tracks[tracks[0]['videoId']].lyrics_browse_id = contents['lyrics']
+        return tracks
 
-        return (track['videoId'] for track in tracks)
+    def _remember(self, tracks: Iterable[dict]):
+        for track in tracks:
+            if track.get('videoId') and track['videoId'] not in self.tracks:
+                self.tracks[track['videoId']] = Track.from_ytmusic(track)
+
+    def _extract_new_video_ids_from_playlist(self, playlist: str, /, limit: int = 50) -> list[str]:
+        """
+        Fetches playlist page by page and returns up to limit uncached videoIds.
+        Stops paging after stop_after_known cached videoIds in a row.
+        """
+        if limit <= 0:
+            return []
+
+        try:
+            pages = self._iter_playlist_pages(playlist)
+            first_page = next(pages)
+        except Exception:
+            # e.g. watch playlists can't be paged, fetching them at once
+            pages = iter([])
+            first_page = self._get_playlist_tracks(playlist, limit=limit)
+
+        new_video_ids: list[str] = []
+        known_in_row = 0
+        for page in itertools.chain([first_page], pages):
+            self._remember(page)
+            video_ids = [track['videoId'] for track in page if track.get('videoId')]
+            uncached = self.cache.filter_uncached(video_ids)
+            for video_id in video_ids:
+                if video_id in uncached and video_id not in new_video_ids:
+                    new_video_ids.append(video_id)
+                    known_in_row = 0
+                    if len(new_video_ids) >= limit:
+                        return new_video_ids
+                else:
+                    known_in_row += 1
+                    if self.stop_after_known is not None and known_in_row >= self.stop_after_known:
+                        return new_video_ids
+        return new_video_ids
+
+    def _iter_playlist_pages(self, playlist: str) -> Iterator[list[dict]]:
+        """
+        Yields pages of playlist tracks, next page is requested only when it's needed.
+        Does the same requests, as YTMusic.get_playlist.
+        """
+        browse_id = playlist if playlist.startswith("VL") else "VL" + playlist
+        body = {'browseId': browse_id}
+        response = self.yt._send_request('browse', body)
+        results = nav(response, SINGLE_COLUMN_TAB + SECTION_LIST_ITEM + ['musicPlaylistShelfRenderer'])
+        yield parse_playlist_items(results.get('contents', []))
+
+        while 'continuations' in results:
+            response = self.yt._send_request('browse', body, get_continuation_params(results))
+            if 'continuationContents' not in response:
+                return
+            results = response['continuationContents']['musicPlaylistShelfContinuation']
+            page = get_continuation_contents(results, parse_playlist_items)
+            if not page:
+                return
+            yield page
 
     def extract_video_ids_from_channel(self, channel: str, /, limit: int = 50) -> Iterable[str]:
         """
         Extracts videoIds from channel.
         Returns iterable of videoIds.
         """
+        if self.channel_cache is not None:
+            browse_id = self.channel_cache.get(channel)
+            if browse_id is not None:
+                try:
+                    return list(self._extract_video_ids_from_playlist(browse_id, limit=limit))
+                except Exception as e:
+                    print(f"couldn't get songs of {channel} by cached playlist {browse_id}, resolving it again: {e}")
+                    self.channel_cache.invalidate(channel)
+
         artist = self.yt.get_artist(channel)
-        return self._extract_video_ids_from_playlist(artist["songs"]["browseId"], limit=limit)
+        browse_id = artist["songs"]["browseId"]
+        if self.channel_cache is not None:
+            self.channel_cache.put(channel, browse_id)
+        return self._extract_video_ids_from_playlist(browse_id, limit=limit)
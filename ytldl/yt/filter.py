@@ -0,0 +1,47 @@
+from ytldl.yt.track import Track
+
+
+class TrackFilter:
+    """
+    Cheap pre-download filter, that classifies tracks by metadata from extractor,
+    so obvious non-songs are discarded without yt-dlp info extraction.
+    Ambiguous tracks are left to FilterPP.
+
+    Discarded tracks are cached and never retried, so rules, that can discard songs
+    (short tracks, e.g. intros, long ones, e.g. DJ mixes, and tracks without artists in extractor metadata),
+    are opt-in.
+    """
+
+    SONG_TYPES = {"MUSIC_VIDEO_TYPE_ATV"}
+    NON_SONG_TYPES = {"MUSIC_VIDEO_TYPE_UGC", "MUSIC_VIDEO_TYPE_PODCAST_EPISODE"}
+
+    def __init__(self, min_duration: int | None = None, max_duration: int | None = None,
+                 require_artists: bool = False):
+        """
+        Durations are in seconds, None means no limit.
+        If not require_artists, tracks without artists are left to FilterPP.
+        """
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.require_artists = require_artists
+
+    def is_song(self, track: Track | None) -> bool | None:
+        """
+        Returns True for songs, False for non-songs and None, if it can't be decided.
+        """
+        if track is None:
+            return None
+
+        if track.video_type in self.NON_SONG_TYPES:
+            return False
+        if track.duration_seconds is not None:
+            if self.min_duration is not None and track.duration_seconds < self.min_duration:
+                return False
+            if self.max_duration is not None and track.duration_seconds > self.max_duration:
+                return False
+        if not track.artists:
+            return False if self.require_artists else None
+
+        if track.video_type in self.SONG_TYPES and track.title:
+            return True
+        return None
@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+
+class InfoCache:
+    """
+    On-disk cache of yt-dlp info dicts (unprocessed extractor results), keyed by videoId.
+
+    Full info (with stream urls) is valid for url_ttl seconds, but not longer than its stream urls:
+        expiration is read from "expire" param of format urls.
+    Static metadata (info without formats) is valid for meta_ttl seconds.
+    """
+
+    # stream urls expiring sooner than this (in seconds) are considered expired
+    EXPIRE_MARGIN = 10 * 60
+
+    # keys, that hold stream urls
+    URL_KEYS = ("formats", "requested_formats", "url", "manifest_url", "fragments")
+
+    def __init__(self, path: str, /, url_ttl: float = 60 * 60, meta_ttl: float = 30 * 24 * 60 * 60,
+                 clock=time.time):
+        self.url_ttl = url_ttl
+        self.meta_ttl = meta_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute('CREATE TABLE IF NOT EXISTS "info" ('
+                         '"item" varchar(50) PRIMARY KEY NOT NULL, '
+                         '"time" real NOT NULL, '
+                         '"urls_expire" real NOT NULL, '
+                         '"info" blob NOT NULL);')
+        self.con.commit()
+
+    def put(self, video_id: str, info: dict):
+        """
+        Info should be sanitized (see YoutubeDL.sanitize_info).
+        """
+        now = self._clock()
+        urls_expire = min(now + self.url_ttl,
+                          self._urls_expire(info, default=now + self.url_ttl) - self.EXPIRE_MARGIN)
+        blob = zlib.compress(json.dumps(info).encode())
+        with self._lock:
+            self.con.execute(
+                'INSERT OR REPLACE INTO "info" ("item", "time", "urls_expire", "info") VALUES (?, ?, ?, ?);',
+                (video_id, now, urls_expire, blob))
+            self.con.commit()
+
+    def get(self, video_id: str) -> dict | None:
+        """
+        Returns full info, if its stream urls are not expired.
+        """
+        row = self._row(video_id)
+        if row is None or self._clock() >= row[1]:
+            return None
+        return self._decode(row[2])
+
+    def get_metadata(self, video_id: str) -> dict | None:
+        """
+        Returns info without stream urls, if it's not older than meta_ttl.
+        """
+        row = self._row(video_id)
+        if row is None or self._clock() - row[0] >= self.meta_ttl:
+            return None
+        info = self._decode(row[2])
+        for key in self.URL_KEYS:
+            info.pop(key, None)
+        return info
+
+    def invalidate(self, video_id: str):
+        with self._lock:
+            self.con.execute('DELETE FROM "info" WHERE "item" = ?;', (video_id,))
+            self.con.commit()
+
+    def purge(self):
+        """
+        Removes entries, older than meta_ttl.
+        """
+        with self._lock:
+            self.con.execute('DELETE FROM "info" WHERE "time" <= ?;', (self._clock() - self.meta_ttl,))
+            self.con.commit()
+
+    def close(self):
+        with self._lock:
+            self.con.close()
+
+    def _row(self, video_id: str) -> tuple | None:
+        with self._lock:
+            return self.con.execute('SELECT "time", "urls_expire", "info" FROM "info" WHERE "item" = ?;',
+                                    (video_id,)).fetchone()
+
+    @staticmethod
+    def _decode(blob: bytes) -> dict:
+        return json.loads(zlib.decompress(blob))
+
+    @staticmethod
+    def _urls_expire(info: dict, default: float) -> float:
+        """
+        Returns the earliest "expire" param of format urls.
+        """
+        expires = []
+        for fmt in info.get("formats") or ():
+            expire = parse_qs(urlparse(fmt.get("url") or "").query).get("expire")
+            if expire and expire[0].isdigit():
+                expires.append(float(expire[0]))
+        return min(expires, default=default)
@@ -0,0 +1,235 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from typing import Callable, Iterable
+
+from ytldl.yt.cache import Cache
+from ytldl.yt.scheduler import DownloadAborted
+
+
+class JobQueue:
+    """
+    Durable queue of videoIds to download, backed by sqlite.
+
+    Producer puts uncached videoIds, workers (threads, processes or hosts sharing the file)
+    lease them for lease_seconds. Lease of dead worker expires and job is leased again.
+    Job, that failed max_attempts times, is marked as failed.
+    """
+
+    PENDING = "pending"
+    LEASED = "leased"
+    DONE = "done"
+    DISCARDED = "discarded"
+    FAILED = "failed"
+
+    def __init__(self, path: str, /, lease_seconds: float = 600, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # autocommit mode, transactions are opened explicitly
+        self.con = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.con.execute('PRAGMA journal_mode=WAL;')
+        self.con.execute('CREATE TABLE IF NOT EXISTS "jobs" ('
+                         '"item" varchar(50) PRIMARY KEY NOT NULL, '
+                         '"state" varchar(10) NOT NULL, '
+                         '"worker" varchar(100) DEFAULT NULL, '
+                         '"lease_until" real DEFAULT NULL, '
+                         '"attempts" integer NOT NULL DEFAULT 0, '
+                         '"error" text DEFAULT NULL);')
+        self.con.execute('CREATE INDEX IF NOT EXISTS "jobs_state" ON "jobs" ("state", "lease_until");')
+
+    def put(self, items: Iterable[str]) -> int:
+        """
+        Adds new jobs and returns finished ones (e.g. failed, or done, but removed from cache since) to queue.
+        Pending and leased jobs are ignored.
+        Returns count of added jobs.
+        """
+        with self._lock:
+            cur = self.con.executemany(
+                'INSERT INTO "jobs" ("item", "state") VALUES (?, ?) '
+                'ON CONFLICT ("item") DO UPDATE SET "state" = excluded."state", "worker" = NULL, '
+                '"lease_until" = NULL, "attempts" = 0, "error" = NULL '
+                'WHERE "state" IN (?, ?, ?);',
+                [(item, self.PENDING, self.DONE, self.DISCARDED, self.FAILED) for item in items])
+            return cur.rowcount
+
+    def lease(self, worker: str, count: int = 1) -> list[str]:
+        """
+        Atomically leases up to count pending jobs or jobs with expired lease.
+        """
+        now = time.time()
+        with self._lock:
+            self.con.execute('BEGIN IMMEDIATE;')
+            try:
+                self._fail_exhausted()
+                items = [row[0] for row in self.con.execute(
+                    'SELECT "item" FROM "jobs" WHERE "state" = ? OR ("state" = ? AND "lease_until" < ?) LIMIT ?;',
+                    (self.PENDING, self.LEASED, now, count))]
+                self.con.executemany(
+                    'UPDATE "jobs" SET "state" = ?, "worker" = ?, "lease_until" = ?, "attempts" = "attempts" + 1 '
+                    'WHERE "item" = ?;',
+                    [(self.LEASED, worker, now + self.lease_seconds, item) for item in items])
+                self.con.execute('COMMIT;')
+            except BaseException:
+                self.con.execute('ROLLBACK;')
+                raise
+        return items
+
+    def _fail_exhausted(self):
+        """
+        Jobs, which lease expired max_attempts times (e.g. they kill workers), are failed.
+        """
+        self.con.execute(
+            'UPDATE "jobs" SET "state" = ?, "error" = coalesce("error", \'lease expired\') '
+            'WHERE "state" = ? AND "lease_until" < ? AND "attempts" >= ?;',
+            (self.FAILED, self.LEASED, time.time(), self.max_attempts))
+
+    def heartbeat(self, worker: str, items: Iterable[str]):
+        """
+        Extends leases of items, held by worker.
+        """
+        with self._lock:
+            self.con.executemany(
+                'UPDATE "jobs" SET "lease_until" = ? WHERE "item" = ? AND "worker" = ? AND "state" = ?;',
+                [(time.time() + self.lease_seconds, item, worker, self.LEASED) for item in items])
+
+    def complete(self, worker: str, item: str):
+        self._finish(worker, item, self.DONE)
+
+    def discard(self, worker: str, item: str):
+        self._finish(worker, item, self.DISCARDED)
+
+    def fail(self, worker: str, item: str, error: str = ""):
+        """
+        Returns job to queue or marks it failed, if it has no attempts left.
+        """
+        with self._lock:
+            self.con.execute(
+                'UPDATE "jobs" SET "state" = CASE WHEN "attempts" >= ? THEN ? ELSE ? END, '
+                '"worker" = NULL, "lease_until" = NULL, "error" = ? '
+                'WHERE "item" = ? AND "worker" = ? AND "state" = ?;',
+                (self.max_attempts, self.FAILED, self.PENDING, error, item, worker, self.LEASED))
+
+    def release(self, worker: str, item: str):
+        """
+        Returns job to queue without spending its attempt, e.g. when worker is stopping.
+        """
+        with self._lock:
+            self.con.execute(
+                'UPDATE "jobs" SET "state" = ?, "worker" = NULL, "lease_until" = NULL, '
+                '"attempts" = max(0, "attempts" - 1) '
+                'WHERE "item" = ? AND "worker" = ? AND "state" = ?;',
+                (self.PENDING, item, worker, self.LEASED))
+
+    def _finish(self, worker: str, item: str, state: str):
+        # finishing is idempotent: job, re-leased after expiration and done by other worker, stays done
+        with self._lock:
+            self.con.execute(
+                'UPDATE "jobs" SET "state" = ?, "lease_until" = NULL, "error" = NULL '
+                'WHERE "item" = ? AND "state" IN (?, ?);',
+                (state, item, self.PENDING, self.LEASED))
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.con.execute('SELECT "state", count(*) FROM "jobs" GROUP BY "state";').fetchall())
+
+    def close(self):
+        self.con.close()
+
+
+class JobWorker:
+    """
+    Leases jobs from JobQueue, downloads them and reports results to cache.
+
+    download_track should raise FilterPPException for discarded tracks.
+    If executor is provided, leased jobs are downloaded in it concurrently, otherwise one by one.
+    Results are reported from the thread, that runs worker, so cache doesn't need to be thread-safe.
+    """
+
+    def __init__(self, queue: JobQueue, cache: Cache, download_track: Callable[[str], object], /,
+                 worker_id: str | None = None, batch_size: int = 4, poll: float = 5,
+                 executor: Executor | None = None):
+        self.queue = queue
+        self.cache = cache
+        self.download_track = download_track
+        self.executor = executor
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.poll = poll
+        self._stopped = threading.Event()
+        self._held: set[str] = set()
+
+    def run(self, stop_when_empty: bool = False) -> int:
+        """
+        Processes jobs until stopped (or until queue is empty, if stop_when_empty).
+        Returns count of processed jobs.
+        """
+        from ytldl.yt.postprocessors import FilterPPException
+
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        processed = 0
+        try:
+            while not self._stopped.is_set():
+                items = self.queue.lease(self.worker_id, self.batch_size)
+                if not items:
+                    if stop_when_empty:
+                        break
+                    self._stopped.wait(self.poll)
+                    continue
+
+                self._held.update(items)
+                if self.executor is not None:
+                    futures = [self.executor.submit(self._download, item) for item in items]
+                else:
+                    futures = [None] * len(items)
+                for item, future in zip(items, futures):
+                    try:
+                        if future is None:
+                            self._download(item)
+                        else:
+                            future.result()
+                        self.cache.add_items([item])
+                        self.cache.commit()
+                        self.queue.complete(self.worker_id, item)
+                    except DownloadAborted:
+                        print(f"[{self.worker_id}] returning {item} to queue")
+                        self.queue.release(self.worker_id, item)
+                        continue
+                    except FilterPPException:
+                        print(f"[{self.worker_id}] discarding {item} due to FilterPP")
+                        self.cache.add_discarded_items([item])
+                        self.cache.commit()
+                        self.queue.discard(self.worker_id, item)
+                    except Exception as e:
+                        print(f"[{self.worker_id}] couldn't download {item}: {e}")
+                        self.queue.fail(self.worker_id, item, str(e))
+                    finally:
+                        self._held.discard(item)
+                    processed += 1
+        finally:
+            self._stopped.set()
+            heartbeat.join()
+        return processed
+
+    def _download(self, item: str):
+        # jobs, that weren't started before stop(), are returned to queue
+        if self._stopped.is_set():
+            raise DownloadAborted()
+        self.download_track(item)
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.queue.lease_seconds / 3):
+            self.queue.heartbeat(self.worker_id, list(self._held))
+
+    def stop(self):
+        """
+        Stops leasing jobs, leased ones, that aren't started, are returned to queue.
+        Running download should be aborted by its downloader, see Downloader.stop().
+        """
+        self._stopped.set()
@@ -1,16 +1,94 @@
+import base64
 import json
 import os
 import pathlib
+import threading
+import time
 from os import PathLike
 
+import requests
 import robocrypt
 import ytmusicapi
-from robocrypt import encrypt, decrypt
+from cryptography.fernet import Fernet, InvalidToken
+from robocrypt import DecryptionError
+from ytmusicapi.constants import OAUTH_CLIENT_ID, OAUTH_CLIENT_SECRET, OAUTH_TOKEN_URL, OAUTH_USER_AGENT
+
+# Key derivation and token format below mirror robocrypt 4.2.6 (pinned in pyproject.toml),
+# with other versions tokens go through robocrypt.encrypt/decrypt, that derive key on every call.
+_ROBOCRYPT_COMPATIBLE = robocrypt.__version__ == "4.2.6"
+
+# Derived keys, keyed by (salt, password), so PBKDF2 runs only once per process.
+_keys: dict[tuple[bytes, bytes], bytes] = {}
+_keys_lock = threading.Lock()
+
+
+def _derive_key(salt_path: pathlib.Path, password: bytes) -> bytes:
+    """
+    Returns fernet key, compatible with robocrypt.encrypt/decrypt.
+    """
+    salt = salt_path.read_bytes()
+    with _keys_lock:
+        key = _keys.get((salt, password))
+        if key is None:
+            os.environ['ROBO_SALT_FILE'] = str(salt_path.as_posix())
+            key = base64.urlsafe_b64encode(robocrypt.get_kdf().derive(password))
+            _keys[(salt, password)] = key
+        return key
+
+
+class _FileLock:
+    """
+    Simple cross-process lock, based on exclusive creation of lock file.
+    Lock older than stale_after seconds is considered abandoned by dead process.
+    """
+
+    def __init__(self, path: pathlib.Path, stale_after: float = 60, poll: float = 0.05):
+        self.path = path
+        self.stale_after = stale_after
+        self.poll = poll
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_after:
+                        self.path.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(self.poll)
+
+    def __exit__(self, *args):
+        self.path.unlink(missing_ok=True)
 
 
 class Oauth:
-    def __init__(self, oauth_path: PathLike, salt_path: PathLike, /, password: str | None = None) -> None:
+    """
+    Keeps oauth token encrypted on disk and decrypted in memory.
+
+    Key is derived once per process, token is reloaded only if oauth file was changed
+    (e.g. refreshed by other process) and is refreshed proactively,
+    when it expires in less than refresh_margin seconds.
+    Refresh is guarded by lock file, so several processes can share one oauth file.
+
+    YTMusic refreshes token, that expires within YTMUSIC_REFRESH_MARGIN, on construction and doesn't persist it,
+    and Google issues tokens for less than that (3599 seconds), so auth, given to YTMusic, has expires_at
+    shifted by the margin: YTMusic doesn't refresh token, that isn't expired, and refreshing is left here.
+    """
+
+    YTMUSIC_REFRESH_MARGIN = 3600
+    # seconds of token request, shorter than stale timeout of lock file, so other processes don't take it over
+    REFRESH_TIMEOUT = 30
+
+    def __init__(self, oauth_path: PathLike, salt_path: PathLike, /, password: str | None = None,
+                 token_url: str = OAUTH_TOKEN_URL, refresh_margin: float = 600) -> None:
         self._oauth_path = pathlib.Path(oauth_path)
+        self._lock_path = self._oauth_path.with_name(self._oauth_path.name + ".lock")
         if password is None:
             password = Oauth._ask_password()
 
@@ -19,7 +97,15 @@ class Oauth:
         if not salt_path.exists():
             robocrypt.generate_salt(10)
 
+        self._salt_path = salt_path
         self._password = password.encode()
+        self._token_url = token_url
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.Lock()
+        self._token: dict | None = None
+        # (st_mtime_ns, st_size) of oauth file, from which token was loaded
+        self._loaded_stat: tuple[int, int] | None = None
 
     @staticmethod
     def _ask_password() -> str:
@@ -27,19 +113,91 @@ class Oauth:
 
     @property
     def auth(self) -> str:
-        if self._oauth_path.exists():
-            return self._load()
+        with self._lock:
+            if self._token is None or self._file_changed():
+                if self._oauth_path.exists():
+                    self._token = self._load()
+                else:
+                    self._token = dict(ytmusicapi.setup_oauth())
+                    self._dump(self._token)
+
+            if self._is_expiring(self._token):
+                self._token = self._refresh()
+
+            token = dict(self._token)
+            if "expires_at" in token:
+                token["expires_at"] += self.YTMUSIC_REFRESH_MARGIN
+            return json.dumps(token)
+
+    # token, fresher than this (in seconds), isn't refreshed, even if its lifetime is shorter than refresh_margin
+    MIN_TOKEN_AGE = 60
+
+    def _is_expiring(self, token: dict) -> bool:
+        if "expires_at" not in token:
+            return False
+        margin = self.refresh_margin
+        if "expires_in" in token:
+            margin = min(margin, int(token["expires_in"]) - self.MIN_TOKEN_AGE)
+        return time.time() > token["expires_at"] - margin
+
+    def _file_changed(self) -> bool:
+        return self._stat() != self._loaded_stat
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = self._oauth_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> dict:
+        """
+        Refreshes token, if other process didn't it already.
+        """
+        with _FileLock(self._lock_path):
+            token = self._load()
+            if not self._is_expiring(token):
+                return token
+
+            print("refreshing oauth token")
+            response = requests.post(self._token_url, data={
+                "client_id": OAUTH_CLIENT_ID,
+                "client_secret": OAUTH_CLIENT_SECRET,
+                "grant_type": "refresh_token",
+                "refresh_token": token["refresh_token"],
+            }, headers={"User-Agent": OAUTH_USER_AGENT}, timeout=self.REFRESH_TIMEOUT)
+            response.raise_for_status()
+            refreshed = response.json()
+            refreshed["expires_at"] = int(time.time()) + int(refreshed["expires_in"])
+
+            token.update(refreshed)
+            self._dump(token)
+            return token
 
-        headers = ytmusicapi.setup_oauth()
-        contents = json.dumps(headers)
-        self._dump(contents)
-        return contents
+    def _fernet(self) -> Fernet:
+        return Fernet(_derive_key(self._salt_path, self._password))
 
-    def _load(self) -> str:
+    def _load(self) -> dict:
+        stat = self._stat()
         contents = self._oauth_path.read_bytes()
-        decrypted = decrypt(contents, self._password).decode()
-        return decrypted
+        if not _ROBOCRYPT_COMPATIBLE:
+            os.environ['ROBO_SALT_FILE'] = str(self._salt_path.as_posix())
+            decrypted = robocrypt.decrypt(contents, self._password)
+        else:
+            try:
+                decrypted = self._fernet().decrypt(base64.urlsafe_b64encode(contents))
+            except InvalidToken:
+                raise DecryptionError
+        self._loaded_stat = stat
+        return json.loads(decrypted)
 
-    def _dump(self, contents: str):
-        encrypted = encrypt(contents.encode(), self._password)
-        self._oauth_path.write_bytes(encrypted)
+    def _dump(self, token: dict):
+        if not _ROBOCRYPT_COMPATIBLE:
+            os.environ['ROBO_SALT_FILE'] = str(self._salt_path.as_posix())
+            encrypted = robocrypt.encrypt(json.dumps(token).encode(), self._password)
+        else:
+            encrypted = base64.urlsafe_b64decode(self._fernet().encrypt(json.dumps(token).encode()))
+        tmp_path = self._oauth_path.with_name(self._oauth_path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(encrypted)
+        os.replace(tmp_path, self._oauth_path)
+        self._loaded_stat = self._stat()
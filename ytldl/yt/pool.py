@@ -0,0 +1,114 @@
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+
+
+class FairExecutor(Executor):
+    """
+    Bounded thread pool, shared by several producers (e.g. libraries in daemon mode).
+
+    Each producer submits into its own named queue (see queue()),
+    workers take tasks from non-empty queues in round-robin,
+    so one big library doesn't starve others.
+    """
+
+    DEFAULT_QUEUE = "default"
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        # queue name -> deque of (future, fn, args, kwargs)
+        self._queues: dict[str, deque] = {}
+        # names of non-empty queues, in round-robin order
+        self._order: deque[str] = deque()
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._work, daemon=True, name=f"FairExecutor-{i}")
+                         for i in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def queue(self, name: str) -> "FairQueue":
+        """
+        Returns executor, that submits into queue with provided name.
+        """
+        return FairQueue(self, name)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.submit_to(self.DEFAULT_QUEUE, fn, *args, **kwargs)
+
+    def submit_to(self, name: str, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._queues.setdefault(name, deque()).append((future, fn, args, kwargs))
+            if name not in self._order:
+                self._order.append(name)
+            self._cond.notify()
+        return future
+
+    def pending(self) -> dict[str, int]:
+        """
+        Returns count of not yet started tasks for each queue.
+        """
+        with self._cond:
+            return {name: len(queue) for name, queue in self._queues.items()}
+
+    def _next(self) -> tuple | None:
+        with self._cond:
+            while not self._order and not self._shutdown:
+                self._cond.wait()
+            if not self._order:
+                return None
+            name = self._order.popleft()
+            queue = self._queues[name]
+            item = queue.popleft()
+            if queue:
+                self._order.append(name)
+            else:
+                del self._queues[name]
+            return item
+
+    def _work(self):
+        while (item := self._next()) is not None:
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in self._queues.values():
+                    for future, *_ in queue:
+                        future.cancel()
+                self._queues.clear()
+                self._order.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class FairQueue(Executor):
+    """
+    Named view of FairExecutor. Shutting it down doesn't affect shared executor.
+    """
+
+    def __init__(self, executor: FairExecutor, name: str):
+        self.executor = executor
+        self.name = name
+
+    @property
+    def max_workers(self) -> int:
+        return self.executor.max_workers
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.executor.submit_to(self.name, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        pass
@@ -1,3 +1,5 @@
+import threading
+from concurrent.futures import Executor, Future
 from io import BytesIO
 from typing import Any, Dict
 
@@ -7,35 +9,58 @@ from yt_dlp.postprocessor import PostProcessor
 from ytmusicapi import YTMusic
 
 from ytldl.metadata.metadata import write_metadata
+from ytldl.yt.scheduler import Budget, BudgetExpired
+from ytldl.yt.search import SearchIndex
+from ytldl.yt.staging import Staging
+from ytldl.yt.store import ContentStore
+from ytldl.yt.track import Track
+from ytldl.yt.transfer import TransferTuner, split_into_ranges
 
 
 class LyricsPP(PostProcessor):
     """
-    Gets lyrics and adds it to info
+    Gets lyrics and adds it to info.
+    Pass yt to reuse existing client, and track to reuse its lyrics browseId.
+    Client (its requests.Session) isn't thread-safe, so pass lock, that guards it, if client is shared between threads.
     """
 
-    def __init__(self, downloader=None):
+    def __init__(self, downloader=None, yt: YTMusic | None = None, track: Track | None = None,
+                 lock: "threading.Lock | None" = None):
         super().__init__(downloader)
-        self.yt = YTMusic()
+        self.yt = yt or YTMusic()
+        self.track = track
+        self.lock = lock or threading.Lock()
+        # is set by PrefetchPP
+        self.prefetched: Future | None = None
 
     def run(self, info):
         video_id = info["id"]
-        lyrics = self.get_lyrics(video_id) or ""
+        if self.prefetched is not None:
+            lyrics = self.prefetched.result() or ""
+        else:
+            lyrics = self.fetch(video_id)
         self.to_screen("Got lyrics with len={}".format(len(lyrics)))
         info["lyrics"] = lyrics
         return [], info
 
-    def get_lyrics(self, video_id: str) -> str:
+    def fetch(self, video_id: str) -> str:
+        lyrics_browse_id = self.track.lyrics_browse_id if self.track else None
+        return self.get_lyrics(video_id, lyrics_browse_id) or ""
+
+    def get_lyrics(self, video_id: str, lyrics_browse_id: str | None = None) -> str:
         """
         Shouldn't throw invalid key exception
         """
 
-        lyrics_browse_id = self.yt.get_watch_playlist(video_id).get("lyrics")
+        if not lyrics_browse_id:
+            with self.lock:
+                lyrics_browse_id = self.yt.get_watch_playlist(video_id).get("lyrics")
         if not lyrics_browse_id:
             return ""
         self.write_debug("Got lyrics browseId={}".format(lyrics_browse_id))
 
-        lyrics = self.yt.get_lyrics(lyrics_browse_id).get("lyrics")
+        with self.lock:
+            lyrics = self.yt.get_lyrics(lyrics_browse_id).get("lyrics")
         if not lyrics:
             return ""
 
@@ -45,21 +70,36 @@ class LyricsPP(PostProcessor):
 class MetadataPP(PostProcessor):
     """
     Sets metadata to file:
-    artist, title, lyrics, url
+    artist, title, album, lyrics, url
+    Fields of track (from YouTube Music) are preferred to yt-dlp ones.
+    Written metadata is added to search_index, if provided.
     """
 
     THUMBNAIL = "thumbnail"
 
+    def __init__(self, downloader=None, track: Track | None = None, search_index: SearchIndex | None = None):
+        super().__init__(downloader)
+        self.track = track or Track(video_id="")
+        self.search_index = search_index
+        # thumbnail url and its bytes, is set by PrefetchPP
+        self.prefetched: tuple[str, Future] | None = None
+
     def run(self, info: Dict[str, Any]):
-        metadata = dict(artist=info.get("artist", ""),
-                        title=info.get("title", ""),
+        metadata = dict(artist=self.track.artist or info.get("artist", ""),
+                        title=self.track.title or info.get("title", ""),
                         url=info.get("webpage_url", ""),
                         lyrics=info.get("lyrics", ""))
+        album = self.track.album or info.get("album")
+        if album:
+            metadata["album"] = album
 
-        thumbnail = info.get(MetadataPP.THUMBNAIL)
+        thumbnail = self.thumbnail_url(info)
         if thumbnail:
-            metadata[MetadataPP.THUMBNAIL] = self.get_image_bytes(
-                thumbnail)
+            if self.prefetched is not None and self.prefetched[0] == thumbnail:
+                metadata[MetadataPP.THUMBNAIL] = self.prefetched[1].result()
+            else:
+                metadata[MetadataPP.THUMBNAIL] = self.get_image_bytes(
+                    thumbnail)
 
         filepath = info["filepath"]
         self.write_debug(
@@ -67,9 +107,15 @@ class MetadataPP(PostProcessor):
         write_metadata(filepath, metadata)
         self.to_screen(
             "Wrote metadata to {}".format(filepath))
+        if self.search_index is not None:
+            self.search_index.add(filepath, metadata)
 
         return [], info
 
+    def thumbnail_url(self, info: Dict[str, Any]) -> str | None:
+        # yt-dlp thumbnail has better resolution
+        return info.get(MetadataPP.THUMBNAIL) or self.track.thumbnail
+
     def get_image_bytes(self, url: str, format: str = "JPEG") -> bytes:
         response = requests.get(url)
         img = Image.open(BytesIO(response.content))
@@ -95,3 +141,188 @@ class FilterPP(PostProcessor):
         if not is_song(info):
             raise FilterPPException()
         return [], info
+
+
+class PrefetchPP(PostProcessor):
+    """
+    Starts fetching lyrics and thumbnail in executor as soon as info is extracted,
+    so they are fetched, while audio is downloading.
+    LyricsPP and MetadataPP then wait for prefetched results instead of fetching them.
+    Should be run pre_process, after FilterPP.
+    """
+
+    def __init__(self, executor: Executor, lyrics_pp: LyricsPP, metadata_pp: MetadataPP, downloader=None):
+        super().__init__(downloader)
+        self.executor = executor
+        self.lyrics_pp = lyrics_pp
+        self.metadata_pp = metadata_pp
+
+    def run(self, info: Dict[str, Any]):
+        self.lyrics_pp.prefetched = self.executor.submit(self.lyrics_pp.fetch, info["id"])
+        thumbnail = self.metadata_pp.thumbnail_url(info)
+        if thumbnail:
+            self.metadata_pp.prefetched = (thumbnail, self.executor.submit(self.metadata_pp.get_image_bytes, thumbnail))
+        self.write_debug("Prefetching lyrics and thumbnail")
+        return [], info
+
+
+class TransferPP(PostProcessor):
+    """
+    Splits selected stream into ranged chunks, downloaded by several connections, as tuned by TransferTuner.
+    Streams of unknown size are downloaded by sequential chunks.
+    Should be run before_dl. Its progress_hook should be added to the same YoutubeDL,
+    so measured throughput gets back to tuner.
+    """
+
+    def __init__(self, tuner: TransferTuner, downloader=None):
+        super().__init__(downloader)
+        self.tuner = tuner
+        # connections of current download, None if it's not split
+        self.connections: int | None = None
+
+    def run(self, info: Dict[str, Any]):
+        self.connections = None
+        if info.get("requested_formats"):
+            return [], info
+
+        if not self._is_ranged(info):
+            if info.get("protocol") in ("http", "https"):
+                info.setdefault("downloader_options", {})["http_chunk_size"] = self.tuner.chunk_size()
+            return [], info
+
+        self.connections = self.tuner.connections()
+        # every connection should get a chunk
+        chunk_size = min(self.tuner.chunk_size(), -(-info["filesize"] // self.connections))
+        info["fragments"] = split_into_ranges(info["url"], info["filesize"], chunk_size)
+        self._downloader.params["concurrent_fragment_downloads"] = self.connections
+        self.write_debug("Downloading by {} chunks of {} bytes with {} connections".format(
+            len(info["fragments"]), chunk_size, self.connections))
+        return [], info
+
+    def progress_hook(self, d: Dict[str, Any]):
+        if d.get("status") == "finished" and self.connections and d.get("elapsed"):
+            self.tuner.record(self.connections, d.get("total_bytes") or d.get("downloaded_bytes") or 0,
+                              d["elapsed"])
+
+    @staticmethod
+    def _is_ranged(info: Dict[str, Any]) -> bool:
+        """
+        YouTube audio streams of known size are downloaded by fragments with "range" query param.
+        """
+        fragments = info.get("fragments")
+        return (info.get("protocol") == "http_dash_segments" and bool(info.get("filesize"))
+                and isinstance(fragments, list) and bool(fragments)
+                and all("range=" in (fragment.get("url") or "") for fragment in fragments))
+
+
+def estimate_size(info: Dict[str, Any]) -> int | None:
+    """
+    Estimates size of selected format(s) in bytes: by filesize, or by bitrate and duration.
+    """
+    formats = info.get("requested_formats") or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get("filesize") or fmt.get("filesize_approx")
+        if not size:
+            # bitrate is in kbit/s
+            bitrate = fmt.get("tbr") or fmt.get("abr")
+            duration = fmt.get("duration") or info.get("duration")
+            if not bitrate or not duration:
+                return None
+            size = bitrate * 1000 / 8 * duration
+        total += size
+    return int(total)
+
+
+class BudgetPP(PostProcessor):
+    """
+    Reserves estimated size of selected format in Budget, skips track, if it doesn't fit.
+    Should be run before_dl. Its progress_hook should be added to the same YoutubeDL,
+    so budget gets actually downloaded bytes, and release() should be called after download,
+    so reservation of failed or aborted download doesn't stay in budget.
+
+    Track of unknown size reserves DEFAULT_BITRATE for its duration or for max_duration.
+    """
+
+    # kbit/s, the best audio bitrate of YouTube Music
+    DEFAULT_BITRATE = 256
+    # seconds, if neither size nor duration of track is known
+    DEFAULT_MAX_DURATION = 20 * 60
+
+    def __init__(self, budget: Budget, downloader=None, max_duration: int | None = None):
+        super().__init__(downloader)
+        self.budget = budget
+        self.max_duration = max_duration or self.DEFAULT_MAX_DURATION
+        # bytes, reserved for current track
+        self.reserved = 0
+        # bytes, downloaded since the last settled file
+        self.downloaded = 0
+        self.settled = False
+
+    def run(self, info: Dict[str, Any]):
+        size = estimate_size(info)
+        if size is None:
+            size = int(self.DEFAULT_BITRATE * 1000 / 8 * (info.get("duration") or self.max_duration))
+        if not self.budget.reserve(size):
+            raise BudgetExpired("{} of ~{} bytes doesn't fit into budget".format(info.get("id"), size))
+        self.reserved = size
+        self.write_debug("Reserved {} bytes".format(size))
+        return [], info
+
+    def progress_hook(self, d: Dict[str, Any]):
+        status = d.get("status")
+        if status == "downloading":
+            self.downloaded = d.get("downloaded_bytes") or self.downloaded
+        elif status == "finished":
+            size = d.get("total_bytes") or d.get("downloaded_bytes") or self.reserved
+            self.budget.settle(self.reserved, size)
+            self.reserved = size
+            self.downloaded = 0
+            self.settled = True
+        elif status == "error":
+            self.release()
+
+    def release(self):
+        """
+        Replaces reservation of unfinished download with bytes, it has downloaded.
+        """
+        if self.settled:
+            return
+        self.budget.settle(self.reserved, self.downloaded)
+        self.reserved = self.downloaded
+        self.settled = True
+
+
+class PublishPP(PostProcessor):
+    """
+    Moves downloaded and tagged file from staging dir into library.
+    Should be run after_move. StorePP runs before it, if store isn't on filesystem of library,
+    so store gets local staged file instead of copying it back from library (e.g. on NAS),
+    otherwise after it, so store hardlinks published file.
+    """
+
+    def __init__(self, staging: Staging, downloader=None):
+        super().__init__(downloader)
+        self.staging = staging
+
+    def run(self, info: Dict[str, Any]):
+        published = self.staging.publish(info["filepath"])
+        self.write_debug("Published {} as {}".format(info["filepath"], published))
+        info["filepath"] = str(published)
+        return [], info
+
+
+class StorePP(PostProcessor):
+    """
+    Adds downloaded file to shared ContentStore.
+    Should be run after_move, when file is tagged, see PublishPP for order with it.
+    """
+
+    def __init__(self, store: ContentStore, downloader=None):
+        super().__init__(downloader)
+        self.store = store
+
+    def run(self, info: Dict[str, Any]):
+        stored = self.store.add(info["id"], info["filepath"])
+        self.write_debug("Stored {} as {}".format(info["filepath"], stored))
+        return [], info
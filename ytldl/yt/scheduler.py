@@ -0,0 +1,99 @@
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple
+
+
+class Source(NamedTuple):
+    """
+    Source of tracks, found on home page.
+    section is rank of home section (lower is more valuable),
+    kind is one of "videos", "playlists", "channels".
+    """
+    section: int
+    kind: str
+    id: str
+
+
+def prioritize(sources: Iterable[Source], extracted: dict[str, list[str]]) -> list[str]:
+    """
+    Orders videoIds, extracted from sources, from the most valuable to the least.
+
+    Tracks are ranked by home section, then by position in their playlist or channel,
+    then by position of source in section (home lists more recent items first).
+    So first tracks of all sources of the best section go first.
+    Track found in several sources gets its best rank.
+    """
+    ranks: dict[str, tuple[int, int, int]] = {}
+    for order, source in enumerate(sources):
+        for position, video_id in enumerate(extracted.get(source.id, ())):
+            rank = (source.section, position, order)
+            if video_id not in ranks or rank < ranks[video_id]:
+                ranks[video_id] = rank
+    return sorted(ranks, key=ranks.get)
+
+
+class BudgetExpired(Exception):
+    pass
+
+
+class DownloadAborted(Exception):
+    """
+    Download wasn't started or was aborted, because downloader was stopped.
+    """
+    pass
+
+
+class Budget:
+    """
+    Limits run by duration (in seconds, counted from start()), by count of tracks and by downloaded bytes.
+
+    Bytes are reserved by estimated size of track before its download (see BudgetPP):
+    track, that doesn't fit into the rest of budget, is skipped, but smaller tracks after it are still downloaded.
+    Shared by download threads.
+    """
+
+    def __init__(self, max_duration: float | None = None, max_tracks: int | None = None,
+                 max_bytes: int | None = None, clock: Callable[[], float] = time.monotonic):
+        self.max_duration = max_duration
+        self.max_tracks = max_tracks
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._deadline: float | None = None
+        self._lock = threading.Lock()
+        # reserved and downloaded bytes
+        self.bytes = 0
+
+    def start(self):
+        if self.max_duration is not None:
+            self._deadline = self._clock() + self.max_duration
+        self.bytes = 0
+
+    def expired(self) -> bool:
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return True
+        return self._deadline is not None and self._clock() >= self._deadline
+
+    def limit(self, video_ids: list[str]) -> list[str]:
+        """
+        Returns first max_tracks of (already prioritized) video_ids.
+        """
+        if self.max_tracks is None:
+            return video_ids
+        return video_ids[:self.max_tracks]
+
+    def reserve(self, size: int) -> bool:
+        """
+        Reserves size bytes for track, returns False, if they don't fit into budget.
+        """
+        with self._lock:
+            if self.max_bytes is not None and self.bytes + size > self.max_bytes:
+                return False
+            self.bytes += size
+            return True
+
+    def settle(self, reserved: int, size: int):
+        """
+        Replaces reserved bytes of track with actually downloaded size.
+        """
+        with self._lock:
+            self.bytes += size - reserved
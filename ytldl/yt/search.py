@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from os import PathLike
+from typing import NamedTuple
+
+from ytldl.metadata.metadata import read_metadata
+from ytldl.util.filename import extract_video_id
+
+
+class SearchResult(NamedTuple):
+    video_id: str
+    filename: str
+    artist: str
+    title: str
+    album: str
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index of downloaded tracks: artist, title, album and lyrics.
+
+    Files are keyed by filename (library is flat, see Downloader outtmpl),
+    so index stays valid, when library dir is moved.
+    Is filled by MetadataPP at tag time, sync() catches up with files, added or removed by hand.
+    """
+
+    FIELDS = ("artist", "title", "album", "lyrics")
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute('CREATE TABLE IF NOT EXISTS "files" ('
+                         '"id" INTEGER PRIMARY KEY, '
+                         '"filename" text UNIQUE NOT NULL, '
+                         '"video_id" varchar(50) NOT NULL, '
+                         '"mtime" real NOT NULL);')
+        # rowid of "tracks" is "files"."id"
+        self.con.execute('CREATE VIRTUAL TABLE IF NOT EXISTS "tracks" USING fts5('
+                         '"artist", "title", "album", "lyrics", tokenize="unicode61 remove_diacritics 2");')
+        self.con.commit()
+
+    def add(self, filepath: PathLike, metadata: dict, mtime: float | None = None):
+        """
+        Adds or replaces file in index.
+        """
+        if mtime is None:
+            mtime = os.stat(filepath).st_mtime
+        filename = os.path.basename(filepath)
+        with self._lock:
+            self._add(filename, metadata, mtime)
+            self.con.commit()
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._remove(filename)
+            self.con.commit()
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        """
+        Every word of query should prefix-match some of fields. Best matches go first.
+        """
+        match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in query.split())
+        if not match:
+            return []
+        with self._lock:
+            rows = self.con.execute(
+                'SELECT "files"."video_id", "files"."filename", "tracks"."artist", "tracks"."title", '
+                '"tracks"."album" FROM "tracks" JOIN "files" ON "files"."id" = "tracks"."rowid" '
+                'WHERE "tracks" MATCH ? ORDER BY "tracks"."rank" LIMIT ?;', (match, limit)).fetchall()
+        return [SearchResult(*row) for row in rows]
+
+    def indexed(self) -> dict[str, float]:
+        """
+        Returns filename -> mtime of indexed files.
+        """
+        with self._lock:
+            return dict(self.con.execute('SELECT "filename", "mtime" FROM "files";').fetchall())
+
+    def sync(self, download_dir: PathLike, workers: int | None = None, rebuild: bool = False) -> tuple[int, int]:
+        """
+        Indexes new and modified tracks of download_dir (reading tags in process pool)
+        and removes deleted ones.
+        rebuild = True reindexes all tracks.
+        Returns count of (indexed, removed) files.
+        """
+        if rebuild:
+            with self._lock:
+                self.con.execute('DELETE FROM "files";')
+                self.con.execute('DELETE FROM "tracks";')
+                self.con.commit()
+
+        indexed = self.indexed()
+        files: dict[str, float] = {}
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and extract_video_id(entry.name) is not None:
+                    files[entry.name] = entry.stat().st_mtime
+
+        removed = [filename for filename in indexed if filename not in files]
+        changed = [filename for filename, mtime in files.items() if indexed.get(filename) != mtime]
+
+        paths = [os.path.join(download_dir, filename) for filename in changed]
+        metadatas = []
+        if paths:
+            with ProcessPoolExecutor(workers) as executor:
+                metadatas = list(executor.map(_read_metadata, paths, chunksize=64))
+
+        with self._lock:
+            for filename in removed:
+                self._remove(filename)
+            for filename, metadata in zip(changed, metadatas):
+                if metadata is not None:
+                    self._add(filename, metadata, files[filename])
+            self.con.commit()
+        return sum(1 for metadata in metadatas if metadata is not None), len(removed)
+
+    def close(self):
+        with self._lock:
+            self.con.close()
+
+    def _add(self, filename: str, metadata: dict, mtime: float):
+        self._remove(filename)
+        cur = self.con.execute('INSERT INTO "files" ("filename", "video_id", "mtime") VALUES (?, ?, ?);',
+                               (filename, extract_video_id(filename) or "", mtime))
+        self.con.execute('INSERT INTO "tracks" ("rowid", "artist", "title", "album", "lyrics") '
+                         'VALUES (?, ?, ?, ?, ?);',
+                         (cur.lastrowid, *(metadata.get(field) or "" for field in self.FIELDS)))
+
+    def _remove(self, filename: str):
+        row = self.con.execute('SELECT "id" FROM "files" WHERE "filename" = ?;', (filename,)).fetchone()
+        if row is None:
+            return
+        self.con.execute('DELETE FROM "tracks" WHERE "rowid" = ?;', row)
+        self.con.execute('DELETE FROM "files" WHERE "id" = ?;', row)
+
+
+def _read_metadata(filepath: str) -> dict | None:
+    try:
+        return read_metadata(filepath)
+    except Exception as e:
+        print(f"couldn't read metadata of {filepath}: {e}")
+        return None
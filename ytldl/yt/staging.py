@@ -0,0 +1,127 @@
+import errno
+import hashlib
+import os
+import pathlib
+import shutil
+import threading
+from os import PathLike
+
+from ytldl.util.filename import extract_video_id
+
+
+class Staging:
+    """
+    Local staging dir (e.g. tmpfs or SSD) for library on slow storage, e.g. NAS.
+
+    yt-dlp downloads, transcodes and tags tracks in staging dir, then PublishPP moves final file
+    into library: it's renamed, if staging dir is on the same filesystem, otherwise copied
+    under temporary name (one sequential write) and renamed, so library never has partial files.
+    Library dir is fsynced once per sync_every published tracks and on sync().
+
+    Each library gets its own subdir, so staging dir can be shared by several libraries and processes.
+    """
+
+    def __init__(self, path: PathLike, library_dir: PathLike, /, sync_every: int = 16):
+        self.library_dir = pathlib.Path(library_dir)
+        key = hashlib.sha1(str(self.library_dir.resolve()).encode()).hexdigest()[:12]
+        self.path = pathlib.Path(path) / key
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.sync_every = sync_every
+        self._lock = threading.Lock()
+        # published, but not synced tracks
+        self._unsynced = 0
+        # videoId -> filename of library tracks, library is listed on the first find() after refresh()
+        self._library: dict[str, str] | None = None
+
+    def find(self, video_id: str) -> pathlib.Path | None:
+        """
+        Returns track of library by videoId, e.g. published by previous run.
+        yt-dlp skips only tracks, that are already in staging dir, so downloader should check library itself.
+        Library (e.g. on NAS) is listed once per refresh(), found track is checked by stat,
+        as it could be removed since.
+        """
+        with self._lock:
+            if self._library is None:
+                self._library = self._list_library()
+            name = self._library.get(video_id)
+        if name is None:
+            return None
+        path = self.library_dir / name
+        if not path.exists():
+            with self._lock:
+                self._library.pop(video_id, None)
+            return None
+        return path
+
+    def refresh(self):
+        """
+        Makes next find() list library again, e.g. before run, so tracks, added by other processes, are found.
+        """
+        with self._lock:
+            self._library = None
+
+    def _list_library(self) -> dict[str, str]:
+        library = {}
+        with os.scandir(self.library_dir) as entries:
+            for entry in entries:
+                video_id = extract_video_id(entry.name)
+                if video_id is not None:
+                    library[video_id] = entry.name
+        return library
+
+    def publish(self, filepath: PathLike) -> pathlib.Path:
+        """
+        Moves staged file into library. Existing track of library isn't replaced, staged file is dropped then.
+        Returns path of published file.
+        """
+        filepath = pathlib.Path(filepath)
+        dst = self.library_dir / filepath.name
+        if dst.exists():
+            filepath.unlink()
+            return dst
+        _fsync(filepath)
+        try:
+            os.replace(filepath, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            tmp = self.library_dir / f".{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                shutil.copy2(filepath, tmp)
+                _fsync(tmp)
+                os.replace(tmp, dst)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            filepath.unlink()
+
+        with self._lock:
+            if self._library is not None and (video_id := extract_video_id(dst.name)) is not None:
+                self._library[video_id] = dst.name
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+        return dst
+
+    def sync(self):
+        """
+        Makes published tracks durable.
+        """
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        _fsync(self.library_dir)
+        self._unsynced = 0
+
+
+def _fsync(path: PathLike):
+    # directories can't be opened on Windows
+    if os.name != "posix" and os.path.isdir(path):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pathlib
+import shutil
+import sys
+import threading
+from os import PathLike
+
+
+class ContentStore:
+    """
+    Store of downloaded tracks, shared between several libraries.
+
+    Tracks are keyed by videoId and format: <path>/<format>/<videoId key>/<original filename>,
+    so library gets the same "artist - title [videoId].m4a" filename, as if it was downloaded.
+    Files are hardlinked (or reflinked/copied across filesystems), so all libraries
+    and the store share one copy of data.
+    """
+
+    def __init__(self, path: PathLike, /, fmt: str = "m4a"):
+        self.path = pathlib.Path(path)
+        self.fmt = fmt
+        (self.path / fmt).mkdir(parents=True, exist_ok=True)
+
+    def _track_dir(self, video_id: str) -> pathlib.Path:
+        # videoIds are case-sensitive, hash suffix keeps them apart on case-insensitive filesystems
+        suffix = hashlib.sha1(video_id.encode()).hexdigest()[:8]
+        return self.path / self.fmt / f"{video_id}.{suffix}"
+
+    def get(self, video_id: str) -> pathlib.Path | None:
+        """
+        Returns stored file of track or None.
+        """
+        track_dir = self._track_dir(video_id)
+        try:
+            files = [f for f in track_dir.iterdir() if f.suffix == f".{self.fmt}"]
+        except FileNotFoundError:
+            return None
+        return files[0] if files else None
+
+    def add(self, video_id: str, filepath: PathLike) -> pathlib.Path:
+        """
+        Adds downloaded file to store, if track isn't stored yet.
+        Returns stored file.
+        """
+        stored = self.get(video_id)
+        if stored is not None:
+            return stored
+
+        filepath = pathlib.Path(filepath)
+        track_dir = self._track_dir(video_id)
+        track_dir.mkdir(parents=True, exist_ok=True)
+        stored = track_dir / filepath.name
+        _link_or_copy_atomic(filepath, stored)
+        return stored
+
+    def remove(self, video_id: str) -> bool:
+        """
+        Removes stored track, e.g. when it's broken, so it isn't linked into libraries anymore.
+        Returns True, if track was stored.
+        """
+        track_dir = self._track_dir(video_id)
+        if not track_dir.exists():
+            return False
+        shutil.rmtree(track_dir)
+        return True
+
+    def link_to(self, video_id: str, download_dir: PathLike) -> pathlib.Path | None:
+        """
+        Links stored track into download_dir.
+        Returns path of linked file or None, if track isn't stored.
+        """
+        stored = self.get(video_id)
+        if stored is None:
+            return None
+
+        dst = pathlib.Path(download_dir) / stored.name
+        if not dst.exists():
+            _link_or_copy_atomic(stored, dst)
+        return dst
+
+
+def _link_or_copy_atomic(src: pathlib.Path, dst: pathlib.Path):
+    """
+    Same as link_or_copy, but file is copied under temporary name and renamed,
+    so killed copy doesn't leave truncated file, that looks downloaded.
+    """
+    # temporary name is unique per thread, so concurrent downloads of the same track don't collide
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    # leftover of killed process could be a link to src, reflink would truncate it
+    tmp.unlink(missing_ok=True)
+    try:
+        link_or_copy(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        # rename is no-op, if tmp and dst are links to the same file
+        tmp.unlink(missing_ok=True)
+
+
+def link_or_copy(src: PathLike, dst: PathLike):
+    """
+    Hardlinks src to dst. Across filesystems tries to reflink, then copies.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+
+    if _reflink(src, dst):
+        return
+    shutil.copy2(src, dst)
+
+
+# FICLONE ioctl, supported by btrfs, xfs and other CoW filesystems on Linux
+_FICLONE = 0x40049409
+
+
+def _reflink(src: PathLike, dst: PathLike) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    except OSError:
+        pathlib.Path(dst).unlink(missing_ok=True)
+        return False
+    shutil.copystat(src, dst)
+    return True
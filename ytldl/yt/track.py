@@ -0,0 +1,43 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Track:
+    """
+    Track metadata, that we already got from playlist or home, when extracting videoIds.
+    Is passed to post-processors, so they don't need to request it again.
+    Missing fields are None.
+    """
+
+    video_id: str
+    title: str | None = None
+    artists: tuple[str, ...] | None = None
+    album: str | None = None
+    duration_seconds: int | None = None
+    video_type: str | None = None
+    thumbnail: str | None = None
+    lyrics_browse_id: str | None = None
+
+    @property
+    def artist(self) -> str | None:
+        if not self.artists:
+            return None
+        return ", ".join(self.artists)
+
+    @classmethod
+    def from_ytmusic(cls, track: dict) -> "Track":
+        """
+        Parses track dict from ytmusicapi (get_playlist, get_watch_playlist).
+        """
+        artists = tuple(artist["name"] for artist in (track.get("artists") or ()) if artist.get("name"))
+        album = track.get("album") or {}
+        # playlists have "thumbnails", watch playlists have "thumbnail", biggest is the last one
+        thumbnails = track.get("thumbnails") or track.get("thumbnail") or ()
+
+        return cls(video_id=track["videoId"],
+                   title=track.get("title"),
+                   artists=artists or None,
+                   album=album.get("name"),
+                   duration_seconds=track.get("duration_seconds"),
+                   video_type=track.get("videoType"),
+                   thumbnail=thumbnails[-1]["url"] if thumbnails else None)
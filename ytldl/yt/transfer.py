@@ -0,0 +1,98 @@
+import threading
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+
+class TransferTuner:
+    """
+    Tunes chunked transfer of audio streams by measured throughput, see TransferPP.
+
+    Each track is split into ranged chunks, downloaded by several connections.
+    Connections per track are bounded by max_connections // workers, so all downloads together
+    don't open more than max_connections. Within this bound tuner climbs to the smallest
+    connection count, that gives (almost) the best throughput, and sizes chunks so that each chunk
+    takes about chunk_seconds at throughput of one connection.
+
+    Is shared by downloads in several threads.
+    """
+
+    # connection count is increased only if it gives this much more throughput
+    GAIN = 1.1
+
+    def __init__(self, max_connections: int = 16, workers: int | None = None,
+                 min_chunk: int = 256 << 10, max_chunk: int = 10 << 20,
+                 chunk_seconds: float = 2, smoothing: float = 0.3):
+        """
+        workers is count of tracks, downloaded at once, Downloader sets it from its executor, if not provided.
+        smoothing is weight of new measurement in moving average of throughput.
+        """
+        self.max_connections = max_connections
+        self.workers = workers
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.chunk_seconds = chunk_seconds
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        # connections per track -> average throughput of track in bytes per second
+        self._throughput: dict[int, float] = {}
+
+    def max_connections_per_track(self) -> int:
+        return max(1, self.max_connections // max(1, self.workers or 1))
+
+    def connections(self) -> int:
+        """
+        Connections for the next track.
+        """
+        limit = self.max_connections_per_track()
+        with self._lock:
+            tried = {n: tp for n, tp in self._throughput.items() if n <= limit}
+        if not tried:
+            return min(2, limit)
+        best = self._best(tried)
+        if best == max(tried) and best < limit:
+            # exploring, while more connections help
+            return best + 1
+        return best
+
+    def chunk_size(self) -> int:
+        """
+        Chunk size for the next track.
+        """
+        limit = self.max_connections_per_track()
+        with self._lock:
+            tried = {n: tp for n, tp in self._throughput.items() if n <= limit}
+        if not tried:
+            return self.min_chunk
+        best = self._best(tried)
+        per_connection = tried[best] / best
+        return int(min(self.max_chunk, max(self.min_chunk, per_connection * self.chunk_seconds)))
+
+    def record(self, connections: int, size: int, seconds: float):
+        """
+        Records transfer of track with size bytes in seconds.
+        """
+        if seconds <= 0 or size <= 0:
+            return
+        throughput = size / seconds
+        with self._lock:
+            previous = self._throughput.get(connections)
+            if previous is not None:
+                throughput = previous + self.smoothing * (throughput - previous)
+            self._throughput[connections] = throughput
+
+    def _best(self, tried: dict[int, float]) -> int:
+        top = max(tried.values())
+        return min(n for n, tp in tried.items() if tp * self.GAIN >= top)
+
+
+def split_into_ranges(url: str, size: int, chunk_size: int) -> list[dict]:
+    """
+    Returns fragments, that download url by chunks with "range" query param (as YouTube streams do).
+    """
+    parsed = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k != "range"]
+    fragments = []
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size) - 1
+        fragment_query = urlencode(query + [("range", f"{start}-{end}")])
+        fragments.append(dict(url=urlunparse(parsed._replace(query=fragment_query))))
+    return fragments
@@ -0,0 +1,169 @@
+import mmap
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import PathLike
+from typing import NamedTuple
+
+import mutagen.mp4
+
+from ytldl.util.filename import extract_video_id
+
+# top-level boxes, that every playable m4a has
+REQUIRED_BOXES = {b"ftyp", b"moov", b"mdat"}
+
+
+class VerifyResult(NamedTuple):
+    filename: str
+    size: int
+    mtime: float
+    ok: bool
+    error: str | None
+    duration: float | None
+
+    @property
+    def video_id(self) -> str | None:
+        return extract_video_id(self.filename)
+
+
+def check_boxes(buf) -> str | None:
+    """
+    Walks top-level mp4 boxes, returns error if container is truncated or incomplete.
+    """
+    pos, end = 0, len(buf)
+    seen = set()
+    while pos < end:
+        if end - pos < 8:
+            return "truncated box header"
+        size = int.from_bytes(buf[pos:pos + 4], "big")
+        kind = bytes(buf[pos + 4:pos + 8])
+        header = 8
+        if size == 1:
+            if end - pos < 16:
+                return "truncated box header"
+            size = int.from_bytes(buf[pos + 8:pos + 16], "big")
+            header = 16
+        elif size == 0:
+            # box extends to the end of file
+            size = end - pos
+        if size < header:
+            return f"invalid size of {kind!r} box"
+        if pos + size > end:
+            return f"{kind!r} box is truncated"
+        seen.add(kind)
+        pos += size
+
+    missing = REQUIRED_BOXES - seen
+    if missing:
+        return "missing boxes: " + ", ".join(sorted(repr(kind) for kind in missing))
+    return None
+
+
+def verify_file(filepath: str, expected_duration: float | None = None,
+                tolerance: float = 2) -> VerifyResult:
+    """
+    Checks mp4 container structure and duration (it should differ from expected one
+    not more than by tolerance seconds or 2%).
+    """
+    stat = os.stat(filepath)
+    filename = os.path.basename(filepath)
+
+    def result(error: str | None, duration: float | None = None) -> VerifyResult:
+        return VerifyResult(filename, stat.st_size, stat.st_mtime, error is None, error, duration)
+
+    if stat.st_size == 0:
+        return result("empty file")
+
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        error = check_boxes(buf)
+    if error:
+        return result(error)
+
+    try:
+        duration = mutagen.mp4.MP4(filepath).info.length
+    except Exception as e:
+        return result(f"couldn't parse: {e}")
+    if not duration:
+        return result("zero duration", duration)
+    if expected_duration and abs(duration - expected_duration) > max(tolerance, 0.02 * expected_duration):
+        return result(f"duration {duration:.1f}s, expected {expected_duration:.1f}s", duration)
+    return result(None, duration)
+
+
+def _verify_file(args: tuple[str, float | None]) -> VerifyResult | None:
+    filepath, expected_duration = args
+    try:
+        return verify_file(filepath, expected_duration)
+    except OSError as e:
+        # file was removed or became unreadable during verification
+        print(f"couldn't verify {filepath}: {e}")
+        return None
+
+
+class Verifier:
+    """
+    Verifies downloaded tracks and keeps results in sqlite, keyed by filename, size and mtime,
+    so unchanged files are not verified again.
+    """
+
+    def __init__(self, path: str):
+        self.con = sqlite3.connect(path)
+        self.con.execute('CREATE TABLE IF NOT EXISTS "verified" ('
+                         '"filename" text PRIMARY KEY NOT NULL, '
+                         '"size" integer NOT NULL, '
+                         '"mtime" real NOT NULL, '
+                         '"ok" bool NOT NULL, '
+                         '"error" text, '
+                         '"duration" real, '
+                         '"time" real NOT NULL);')
+        self.con.commit()
+
+    def verify(self, download_dir: PathLike, expected_durations: dict[str, float] | None = None,
+               workers: int | None = None, full: bool = False) -> list[VerifyResult]:
+        """
+        Verifies tracks of download_dir in process pool.
+        expected_durations is videoId -> duration in seconds.
+        full = True verifies also unchanged files.
+        Returns results of all tracks, including previously verified ones.
+        """
+        expected_durations = expected_durations or {}
+        stored = {row[0]: VerifyResult(*row) for row in self.con.execute(
+            'SELECT "filename", "size", "mtime", "ok", "error", "duration" FROM "verified";')}
+
+        results: list[VerifyResult] = []
+        to_verify: list[tuple[str, float | None]] = []
+        files = set()
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                video_id = extract_video_id(entry.name)
+                if video_id is None or not entry.is_file():
+                    continue
+                files.add(entry.name)
+                stat = entry.stat()
+                previous = stored.get(entry.name)
+                if not full and previous is not None \
+                        and (previous.size, previous.mtime) == (stat.st_size, stat.st_mtime):
+                    results.append(previous._replace(ok=bool(previous.ok)))
+                    continue
+                to_verify.append((entry.path, expected_durations.get(video_id)))
+
+        print(f"verifying {len(to_verify)} of {len(files)} tracks")
+        verified: list[VerifyResult] = []
+        if to_verify:
+            with ProcessPoolExecutor(workers) as executor:
+                verified = [result for result in executor.map(_verify_file, to_verify, chunksize=16)
+                            if result is not None]
+
+        now = time.time()
+        self.con.executemany(
+            'INSERT OR REPLACE INTO "verified" ("filename", "size", "mtime", "ok", "error", "duration", "time") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?);',
+            [(*result, now) for result in verified])
+        self.con.executemany('DELETE FROM "verified" WHERE "filename" = ?;',
+                             [(filename,) for filename in stored if filename not in files])
+        self.con.commit()
+        return results + verified
+
+    def close(self):
+        self.con.close()